@@ -0,0 +1,292 @@
+# Curdling - Concurrent package manager for Python
+# Copyright (C) 2013  Lincoln Clarete <lincoln@clarete.li>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Warm processes that run `setup.py` scripts
+
+Starting an interpreter and importing setuptools takes longer than
+building most pure Python packages. A build server is an interpreter
+that imports setuptools once and then forks a child for each build it
+receives, so every `setup.py` still runs in a process of its own.
+
+Requests and responses are JSON documents, one per line, exchanged
+through the standard input and output of the server. This module is
+imported by the servers themselves, possibly running another interpreter
+than curdling. So besides the standard library it only imports
+`curdling.exceptions`, which doesn't import anything else either.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+from .exceptions import BuildServerUnavailable
+
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# How much of the output of a failed build goes to its error message
+ERROR_OUTPUT_SIZE = 4096
+
+# Servers are started with this command, see `BuildServer.start()`
+BOOTSTRAP = (
+    'import sys; sys.path.insert(0, {0!r}); '
+    'from curdling.buildserver import serve; serve()')
+
+# Packages that can't be built by an interpreter that already imported
+# setuptools, since they are the tools themselves
+BUILD_TOOLS = ('setuptools', 'distribute', 'wheel', 'pip')
+
+
+def available():
+    return hasattr(os, 'fork') and hasattr(os, 'wait4')
+
+
+def needs_isolation(setup_py, name):
+    """Tell if a package must be built by a brand new interpreter
+
+    Packages declaring their build requirements in `pyproject.toml` might
+    need a different setuptools than the one loaded by the servers.
+    """
+    directory = os.path.dirname(setup_py)
+    return (name.lower() in BUILD_TOOLS or
+            os.path.exists(os.path.join(directory, 'pyproject.toml')))
+
+
+# -- Server side --
+
+def serve():
+    # Anything written to the standard output of the server by the things
+    # it imports would break the protocol, so the requests and responses
+    # go through copies of the original descriptors.
+    requests = io.open(os.dup(0), 'rb')
+    channel = io.open(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    # Loading setuptools once, before any build, is the whole point of the
+    # server. It's imported this way so linters don't flag it as unused.
+    __import__('setuptools')
+    for line in iter(requests.readline, b''):
+        response = build(json.loads(line.decode('utf-8')), channel)
+        channel.write(json.dumps(response).encode('utf-8') + b'\n')
+        channel.flush()
+
+
+def build(request, channel):
+    log = request.get('log')
+    output = io.open(log, 'w+b') if log else tempfile.TemporaryFile()
+    with output:
+        started = time.time()
+        pid = os.fork()
+        if pid == 0:
+            channel.close()
+            run_script(request, output.fileno())
+
+        result = wait(pid, request.get('timeout'))
+        killed = result is None
+        if killed:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:  # It just finished
+                pass
+            result = os.wait4(pid, 0)
+        _, status, rusage = result
+
+        # Linux reports kilobytes, OS X reports bytes
+        scale = 1 if sys.platform == 'darwin' else 1024
+        response = {
+            'status': os.WEXITSTATUS(status)
+                if os.WIFEXITED(status) else -os.WTERMSIG(status),
+            'peak_rss': rusage.ru_maxrss * scale,
+            'duration': time.time() - started,
+            'killed': killed,
+        }
+        if response['status'] != 0:
+            output.seek(0, os.SEEK_END)
+            output.seek(max(output.tell() - ERROR_OUTPUT_SIZE, 0))
+            response['output'] = output.read().decode('latin-1')
+    return response
+
+
+def wait(pid, timeout=None):
+    if timeout is None:
+        return os.wait4(pid, 0)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = os.wait4(pid, os.WNOHANG)
+        if result[0]:
+            return result
+        time.sleep(0.1)
+    return None
+
+
+def run_script(request, output):
+    # We're in the child process now and it must never return to the
+    # loop of the server, no matter what happens to the build.
+    status = 1
+    try:
+        os.setsid()
+        if request.get('memory_limit'):
+            limit = request['memory_limit']
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        os.dup2(output, 1)
+        os.dup2(output, 2)
+        if request.get('env') is not None:
+            os.environ.clear()
+            os.environ.update(request['env'])
+
+        # Same environment the `-c` snippet of `run_setup_script()` gets
+        script = request['script']
+        os.chdir(os.path.dirname(script))
+        sys.argv = ['-c'] + request['args']
+        sys.path[0] = ''
+        with io.open(script, 'r', encoding='utf-8', errors='replace') as fobj:
+            source = fobj.read().replace('\r\n', '\n')
+        namespace = {'__name__': '__main__', '__file__': os.path.basename(script)}
+        exec(compile(source, namespace['__file__'], 'exec'), namespace)
+        status = 0
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            status = exc.code or 0
+        else:
+            sys.stderr.write('{0}\n'.format(exc.code))
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+
+# -- Client side --
+
+class BuildServer(object):
+
+    def __init__(self, python=sys.executable):
+        self.python = python
+        self.process = None
+
+    def start(self):
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(
+            [self.python, '-c', BOOTSTRAP.format(path)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env=os.environ)
+        return self
+
+    def run(self, script, args, usage=None, env=None, timeout=None,
+            memory_limit=None, log=None):
+        """Run a `setup.py` script in a child of the server
+
+        Works just like `util.execute_command()`: the `usage` dictionary
+        receives the exit status, peak memory and duration of the build
+        and an exception with the last lines of the output is raised
+        when the script fails.
+        """
+        request = {
+            'script': os.path.abspath(script),
+            'args': list(args),
+            'env': dict(env) if env is not None else None,
+            'timeout': timeout,
+            'memory_limit': memory_limit,
+            'log': log,
+        }
+        try:
+            self.process.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            response = self.process.stdout.readline()
+        except (IOError, OSError) as exc:
+            raise BuildServerUnavailable(str(exc))
+        if not response:
+            raise BuildServerUnavailable(
+                'Build server exited with status {0}'.format(self.process.poll()))
+        response = json.loads(response.decode('utf-8'))
+
+        if usage is not None:
+            usage.update((key, response[key])
+                for key in ('status', 'peak_rss', 'duration'))
+        if response['status'] != 0:
+            message = response['output'].encode('latin-1')
+            if response['killed']:
+                message += 'Killed after {0} seconds\n'.format(timeout).encode('ascii')
+            if log:
+                message += 'The full output is in {0}\n'.format(log).encode('utf-8')
+            raise Exception(message)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+class BuildServerPool(object):
+    """Up to `size` build servers, started as they're needed"""
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = []
+        self.servers = []
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and len(self.servers) >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            server = BuildServer().start()
+            self.servers.append(server)
+            return server
+
+    def release(self, server, healthy=True):
+        with self.condition:
+            if healthy:
+                self.idle.append(server)
+            else:
+                self.servers.remove(server)
+                server.stop()
+            self.condition.notify()
+
+    def run(self, script, args, **options):
+        server = self.acquire()
+        healthy = True
+        try:
+            server.run(script, args, **options)
+        except BuildServerUnavailable:
+            healthy = False
+            raise
+        finally:
+            self.release(server, healthy)
+
+    def close(self):
+        with self.condition:
+            for server in self.servers:
+                server.stop()
+            self.servers, self.idle = [], []
@@ -45,6 +45,14 @@ class TooManyRedirects(ReportableError):
     """Raised when a download exceeds the maximum number of redirects"""
 
 
+class HostUnavailable(ReportableError):
+    """Raised when a host failed too many times in a row to be tried again"""
+
+
+class DigestMismatch(ReportableError):
+    """Raised when a downloaded file doesn't match the digest informed"""
+
+
 class RequirementNotFound(ReportableError):
     """Raised when a requirement is not found by the finder"""
 
@@ -56,6 +64,10 @@ class BuildError(ReportableError):
     """Raised when a package can't be built using the setup.py script"""
 
 
+class BuildServerUnavailable(CurdlingError):
+    """Raised when a warm build server dies or can't be reached"""
+
+
 class BrokenDependency(ReportableError):
     """Raised to inform that a dependency couldn't be installed"""
 
@@ -64,6 +76,10 @@ class VersionConflict(ReportableError):
     """Raised when Maestro.best_version() can't find versions for all the requests"""
 
 
+class InvalidLockfile(CurdlingError):
+    """Raised when a lockfile can't be read or has an unknown format"""
+
+
 class NoSetupScriptFound(ReportableError):
     pass
 
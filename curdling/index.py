@@ -17,15 +17,43 @@
 from __future__ import absolute_import, print_function, unicode_literals
 from collections import defaultdict
 from threading import RLock
-from pkg_resources import parse_version
+from pkg_resources import parse_version, get_distribution, DistributionNotFound
+from .exceptions import DigestMismatch
 from .util import split_name, filehash, safe_name, parse_requirement
+from distlib.compat import urlparse
+from distlib.wheel import IMPVER, ABI, ARCH
 
+import io
 import os
 import re
+import json
+import sys
 import shutil
+import hashlib
+import tempfile
 
 FORMATS = ('whl', 'gz', 'bz', 'zip')
 
+# Size of the blocks read from files being copied to the index
+BLOCK_SIZE = 2 ** 20
+
+# Updates kept in memory before the catalogs are written to the disk. See
+# `Index.update_catalog()`.
+CATALOG_FLUSH_SIZE = 64
+
+# Wheels built by this interpreter might not work on others, so the builds
+# recorded in the index are tied to it. See `Index.get_build()`.
+BUILD_TAG = '-'.join((IMPVER, ABI, ARCH))
+
+# Environment variables that change the result of a build
+BUILD_ENVIRON = (
+    'CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'LDSHARED',
+    'ARCHFLAGS',
+)
+
+# See `build_fingerprint()`
+_build_fingerprint = None
+
 PKG_NAMES = [
     r'([\w\-\_\.]+)-([\d\.]+\d)[\.\-]',
     r'(\w+)-(.+)\.\w+$',
@@ -39,6 +67,26 @@ def pkg_name(name):
             return result[0]
 
 
+def build_fingerprint():
+    """Digest of what changes our wheels besides their source
+
+    That's the exact version of the interpreter, the versions of the tools
+    that build the wheels and the flags passed to the compiler.
+    """
+    global _build_fingerprint
+    if _build_fingerprint is None:
+        tools = []
+        for name in ('setuptools', 'wheel'):
+            try:
+                tools.append(get_distribution(name).version)
+            except DistributionNotFound:
+                tools.append(None)
+        environ = [os.environ.get(name) for name in BUILD_ENVIRON]
+        _build_fingerprint = hashlib.sha1(json.dumps(
+            [sys.version, tools, environ]).encode('utf-8')).hexdigest()[:16]
+    return _build_fingerprint
+
+
 def match_format(format_, name):
     ext = split_name(name)[1]
     if format_.startswith('~'):
@@ -62,11 +110,22 @@ class Index(object):
         self.storage = defaultdict(lambda: defaultdict(list))
         self.lock = RLock()
 
+        # Auxiliary records saved in the cache. See `Index.catalog()`.
+        self._catalogs = {}
+        self._pending = defaultdict(int)
+
+        # Lookups that found (or not) a wheel built before
+        self.build_stats = {'hits': 0, 'misses': 0}
+
     def scan(self):
         if not os.path.isdir(self.base_path):
             return
 
         for file_name in os.listdir(self.base_path):
+            # Hidden entries are used by curdling to store its caches. See
+            # `Index.cache_path()`.
+            if file_name.startswith('.'):
+                continue
             destination = os.path.join(self.base_path, file_name)
             self.index(destination)
 
@@ -84,21 +143,205 @@ class Index(object):
 
     def from_file(self, path):
         # Moving the file around
-        file_name = '.'.join(split_name(os.path.basename(path))[:2])
-        destination = self.ensure_path(os.path.join(self.base_path, file_name))
-        shutil.copy(path, destination)
-        self.index(destination)
-        return destination
+        with open(path, 'rb') as fobj:
+            return self.from_stream(
+                path, iter(lambda: fobj.read(BLOCK_SIZE), b''))
 
     def from_data(self, path, data):
+        return self.from_stream(path, [data])
+
+    def from_stream(self, path, chunks, digest=None):
+        """Write the `chunks` of a file to the index, hashing them on the way
+
+        When the `(algo, value)` `digest` is informed, the file only gets
+        its final name if its contents match it. Otherwise `DigestMismatch`
+        is raised and nothing is added to the index. The sha256 of the
+        file is always recorded, see `Index.digest()`.
+        """
         # Build the name of the package based on its spec and extension
         file_name = '.'.join(split_name(os.path.basename(path))[:2])
         destination = self.ensure_path(os.path.join(self.base_path, file_name))
-        with open(destination, 'wb') as fobj:
-            fobj.write(data)
+
+        hashers = {'sha256': hashlib.sha256()}
+        if digest and digest[0] not in hashers:
+            hashers[digest[0]] = hashlib.new(digest[0])
+
+        # The temporary file is hidden, so `Index.scan()` won't see it even
+        # if we don't get to remove it
+        fd, temporary = tempfile.mkstemp(
+            prefix='.{0}.'.format(file_name), suffix='.part',
+            dir=self.base_path)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                for chunk in chunks:
+                    fobj.write(chunk)
+                    size += len(chunk)
+                    for hasher in hashers.values():
+                        hasher.update(chunk)
+            if digest and hashers[digest[0]].hexdigest() != digest[1].lower():
+                raise DigestMismatch(
+                    'Digest mismatch for `{0}\': expected {1}={2}, got {1}={3}'.format(
+                        file_name, digest[0], digest[1],
+                        hashers[digest[0]].hexdigest()))
+            with self.lock:
+                if os.path.exists(destination):
+                    os.remove(destination)
+                os.rename(temporary, destination)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+        self.save_digest(file_name, hashers['sha256'].hexdigest(), size)
         self.index(destination)
         return destination
 
+    def catalog(self, name):
+        """A dictionary saved as `<name>.json` in the cache of the index"""
+        with self.lock:
+            if name not in self._catalogs:
+                try:
+                    path = self.cache_path('{0}.json'.format(name))
+                    with io.open(path, 'r', encoding='utf-8') as fobj:
+                        self._catalogs[name] = json.load(fobj)
+                except (IOError, OSError, ValueError):
+                    self._catalogs[name] = {}
+            return self._catalogs[name]
+
+    def update_catalog(self, name, key, value):
+        """Change an entry of a catalog
+
+        Catalogs are only written to the disk after a few updates, so
+        storing lots of files doesn't rewrite them over and over again.
+        `Index.flush()` writes the updates still pending.
+        """
+        with self.lock:
+            self.catalog(name)[key] = value
+            self._pending[name] += 1
+            if self._pending[name] >= CATALOG_FLUSH_SIZE:
+                self.write_catalog(name)
+
+    def flush(self):
+        with self.lock:
+            for name in list(self._pending):
+                self.write_catalog(name)
+
+    def write_catalog(self, name):
+        # Each writer gets its own temporary file, and the catalog is only
+        # replaced once it was completely written
+        path = self.ensure_path(self.cache_path('{0}.json'.format(name)))
+        with self.lock:
+            fd, temporary = tempfile.mkstemp(
+                prefix='.{0}.'.format(os.path.basename(path)), dir=os.path.dirname(path))
+            try:
+                with io.open(fd, 'w', encoding='utf-8') as fobj:
+                    fobj.write(json.dumps(self.catalog(name), sort_keys=True))
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+            self._pending.pop(name, None)
+
+    @property
+    def digests(self):
+        return self.catalog('digests')
+
+    def save_digest(self, file_name, sha256, size):
+        self.update_catalog(
+            'digests', file_name, {'sha256': sha256, 'size': size})
+
+    def digest(self, fname):
+        """The sha256 of a file in the index
+
+        Files written by the index have their digest recorded, so they
+        don't have to be read again. The size of the file is checked to
+        make sure it wasn't replaced behind our backs.
+        """
+        # Files that don't live in the index are not recorded
+        directory = os.path.dirname(fname)
+        if directory and os.path.abspath(directory) != os.path.abspath(self.base_path):
+            with open(fname, 'rb') as fobj:
+                return filehash(fobj, 'sha256')
+
+        file_name = os.path.basename(fname)
+        path = os.path.join(self.base_path, file_name)
+        entry = self.digests.get(file_name)
+        if entry and entry['size'] == os.path.getsize(path):
+            return entry['sha256']
+        with self.open(file_name, 'rb') as fobj:
+            sha256 = filehash(fobj, 'sha256')
+        self.save_digest(file_name, sha256, os.path.getsize(path))
+        return sha256
+
+    def verify(self, fname):
+        """Make sure a file of the index still has the digest recorded
+
+        The file is read again, since `Index.digest()` trusts the record
+        when the size didn't change. `DigestMismatch` is raised if the
+        contents changed since the file was stored.
+        """
+        directory = os.path.dirname(fname)
+        if directory and os.path.abspath(directory) != os.path.abspath(self.base_path):
+            return
+        file_name = os.path.basename(fname)
+        entry = self.digests.get(file_name)
+        if not entry:
+            return
+        with self.open(file_name, 'rb') as fobj:
+            sha256 = filehash(fobj, 'sha256')
+        if sha256 != entry['sha256']:
+            raise DigestMismatch(
+                'Digest mismatch for `{0}\': expected sha256={1}, got sha256={2}'.format(
+                    file_name, entry['sha256'], sha256))
+
+    def build_key(self, source):
+        # Credentials are not saved to the disk
+        parsed = urlparse(source)
+        netloc = parsed.netloc.rsplit('@', 1)[-1]
+        return '{0} {1} {2}'.format(
+            parsed._replace(netloc=netloc).geturl(), BUILD_TAG,
+            build_fingerprint())
+
+    def get_build(self, source):
+        """The wheel built from `source` in this environment, if any
+
+        `source` must point to something that never changes, like a VCS
+        URL pinned to a commit or the digest of a source distribution.
+        """
+        file_name = self.catalog('builds').get(self.build_key(source))
+        path = file_name and os.path.join(self.base_path, file_name)
+        found = bool(path) and os.path.isfile(path)
+        with self.lock:
+            self.build_stats['hits' if found else 'misses'] += 1
+        return path if found else None
+
+    def add_build(self, source, wheel):
+        self.update_catalog(
+            'builds', self.build_key(source), os.path.basename(wheel))
+
+    def get_dependencies(self, wheel):
+        """Dependencies read from a wheel of the index before, if any
+
+        Entries are keyed by the digest of the wheel, so replacing the
+        file invalidates them.
+        """
+        return self.catalog('dependencies').get(self.digest(wheel))
+
+    def add_dependencies(self, wheel, dependencies):
+        self.update_catalog('dependencies', self.digest(wheel), dependencies)
+
+    def cache_path(self, *parts):
+        """Path for auxiliary files that live along with the packages
+
+        Things like the list of projects not found in the remote indexes
+        are stored in a hidden directory, ignored by `Index.scan()`.
+        """
+        return os.path.join(self.base_path, '.cache', *parts)
+
     def delete(self):
         shutil.rmtree(self.base_path)
 
@@ -108,8 +351,7 @@ class Index(object):
     def get_urlhash(self, url, fmt):
         """Returns the hash of the file of an internal url
         """
-        with self.open(os.path.basename(url)) as f:
-            return {'url': fmt(url), 'sha256': filehash(f, 'sha256')}
+        return {'url': fmt(url), 'sha256': self.digest(url)}
 
     def package_releases(self, package, url_fmt=lambda u: u):
         """List all versions of a package
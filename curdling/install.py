@@ -18,22 +18,26 @@ from __future__ import absolute_import, print_function, unicode_literals
 from functools import wraps
 from collections import defaultdict
 from distlib.compat import queue
+from distlib.version import LegacyVersion
 
 from .database import Database
 from .index import PackageNotFound
-from .mapping import Mapping
+from .mapping import Mapping, wheel_version
+from .resolver import Candidate, Resolver
+from . import lockfile
 from .signal import SignalEmitter, Signal
-from .util import logger, is_url, parse_requirement, safe_name
+from .util import logger, is_url, parse_requirement, safe_name, requirement_cache_stats
 from .exceptions import VersionConflict
 
 from .services.base import Service
-from .services.downloader import Finder, Downloader
+from .services.downloader import Finder, Downloader, NETWORK_ERRORS, add_url_digest
 from .services.curdler import Curdler
 from .services.dependencer import Dependencer
 from .services.installer import Installer
 from .services.uploader import Uploader
 
 import os
+import re
 import sys
 import time
 import traceback
@@ -84,6 +88,19 @@ class Install(Service):
         # Track dependencies and requirements to be installed
         self.mapping = Mapping()
 
+        # Requirement chosen for each package. See `load_installer()`.
+        self.chosen = {}
+
+        # Releases the resolver found in the indexes, by their URL, and the
+        # wheels of the ones retrieved. See `remote_candidates()`.
+        self.remote = {}
+        self.retrieved = {}
+
+        # Catalogs of the index are only written from time to time. See
+        # `Index.update_catalog()`.
+        if self.index is not None:
+            self.connect('finished', lambda *args: self.index.flush())
+
         # General params for all the services
         args = self.conf
         args.update({
@@ -103,18 +120,41 @@ class Install(Service):
         self.uploader = Uploader(size=cpu_count, **args)
 
     def pipeline(self):
+        # Save the wheels that reached the end of the flow
+        def queue_install(requester, **data):
+            self.mapping.wheels[data['requirement']] = data['wheel']
+
+        # Remember where each package came from. See `save_lockfile()`.
+        def update_sources(requester, **data):
+            self.mapping.sources[data['requirement']] = {
+                'url': data['url'],
+                'index': data.get('locator_url'),
+            }
+
+        # The digest of each file downloaded goes to the lockfile as well,
+        # so installing from it checks the files again
+        def update_digests(requester, **data):
+            digest = self.artifact_digest(data)
+            if digest:
+                self.mapping.sources.setdefault(data['requirement'], {})['sha256'] = digest
+
         # Building the pipeline to [find -> download -> build -> find deps]
+        self.finder.connect('finished', update_sources)
+        self.downloader.connect('finished', update_digests)
         self.finder.connect('finished', unique(self.downloader.queue, self))
         self.downloader.connect('finished', only(self.curdler.queue, 'directory'))
         self.downloader.connect('finished', only(self.curdler.queue, 'tarball'))
-        self.downloader.connect('finished', only(self.dependencer.queue, 'wheel'))
-        self.curdler.connect('finished', self.dependencer.queue)
-        self.dependencer.connect('dependency_found', self.queue)
 
-        # Save the wheels that reached the end of the flow
-        def queue_install(requester, **data):
-            self.mapping.wheels[data['requirement']] = data['wheel']
-        self.dependencer.connect('finished', queue_install)
+        # Packages installed from a lockfile are already known, their
+        # dependencies are not looked for again. See `load_lockfile()`.
+        if self.conf.get('lockfile'):
+            self.downloader.connect('finished', only(queue_install, 'wheel'))
+            self.curdler.connect('finished', queue_install)
+        else:
+            self.downloader.connect('finished', only(self.dependencer.queue, 'wheel'))
+            self.curdler.connect('finished', self.dependencer.queue)
+            self.dependencer.connect('dependency_found', self.queue)
+            self.dependencer.connect('finished', queue_install)
 
         # Error report, let's just remember what happened
         def update_error_list(name, **data):
@@ -174,9 +214,20 @@ class Install(Service):
         # Filter previously primarily required packages
         if self.mapping.was_directly_required(requirement):
             return
+        # Requirements that conflict with the ones filed before are not
+        # retrieved, they're handed to the resolver. See `file_conflict()`.
+        if requirement in self.mapping.conflicts:
+            return
+        dependency_of = data.get('dependency_of')
+        conflicts = not is_url(requirement) and dependency_of and \
+            self.mapping.conflicting_requirements(requirement)
+        if conflicts:
+            self.file_conflict(requirement, dependency_of, conflicts)
+            return
+
         # Save the requirement and its requester for later
         self.mapping.requirements.add(requirement)
-        self.mapping.dependencies[requirement].append(data.get('dependency_of'))
+        self.mapping.dependencies[requirement].append(dependency_of)
 
         # Defining which place we're moving our requirements
         service = self.finder
@@ -190,32 +241,92 @@ class Install(Service):
         # Finally feeding the chosen service
         service.queue(requester, **data)
 
+    def file_conflict(self, requirement, dependency_of, conflicts):
+        # The requirement is kept out of `mapping.requirements`, so the
+        # range of versions of its package still agrees with the ones
+        # filed, and nothing is downloaded or built for it. Choosing
+        # other versions of the packages that need it is up to the
+        # resolver, see `load_installer()`.
+        self.mapping.conflicts[requirement] = conflicts
+        self.mapping.dependencies[requirement].append(dependency_of)
+        self.logger.info('handle(%s): conflicts with %s',
+            self.describe(requirement), ', '.join(self.describe(r) for r in conflicts))
+
+    def describe(self, requirement):
+        return '{0} (required by {1})'.format(requirement,
+            ', '.join(filter(None, self.mapping.dependencies[requirement])) or 'the user')
+
     def load_installer(self):
         # Look for the best version collected for each package.
         # Failures will be collected and forwarded to the caller.
         errors = defaultdict(dict)
+        chosen = {}
         installable_packages = self.mapping.installable_packages()
         for package_name in installable_packages:
             try:
-                _, chosen_requirement = self.mapping.best_version(package_name)
+                _, chosen[package_name] = self.mapping.best_version(package_name)
             except Exception as exc:
                 self.logger.exception("best_version('%s'): %s:%d (%s) %s",
                     package_name, *traceback.extract_tb(sys.exc_info()[2])[0])
                 for requirement in self.mapping.get_requirements_by_package_name(package_name):
-                    previous_error = self.mapping.errors[package_name].get(requirement)
+                    previous_error = self.mapping.errors.get(package_name, {}).get(requirement)
                     exception = previous_error['exception'] if previous_error else exc
                     errors[package_name][requirement] = {
                         'exception': exception,
                         'dependency_of': self.mapping.dependencies[requirement],
                     }
-            else:
-                # It's OK to queue each package without being sure
-                # about the availability of all the requirements. The
-                # Installer service will not be started until everything
-                # is checked.
-                self.installer.queue('main',
-                    requirement=chosen_requirement,
-                    wheel=self.mapping.wheels[chosen_requirement])
+
+        # Requirements that conflicted with the ones filed before were
+        # never retrieved, they're errors unless the resolver finds
+        # versions of all the packages that satisfy them too
+        for requirement, filed in self.mapping.conflicts.items():
+            errors[parse_requirement(requirement).name][requirement] = {
+                'exception': VersionConflict('Requirement: {0} conflicts with {1}'.format(
+                    self.describe(requirement), ', '.join(self.describe(r) for r in filed))),
+                'dependency_of': self.mapping.dependencies[requirement],
+            }
+
+        # Picking the versions of each package alone didn't work, let's
+        # try to find versions of all of them that work together. Only
+        # the packages required along with the ones in conflict are
+        # chosen again, errors in the others are still reported.
+        conflicts = [package_name for package_name, requirements in errors.items()
+            if all(isinstance(e['exception'], VersionConflict) for e in requirements.values())]
+        if conflicts:
+            roots = self.primary_requirements_of([requirement
+                for requirement in list(self.mapping.requirements) + list(self.mapping.conflicts)
+                if parse_requirement(requirement).name in conflicts])
+            pinned = None
+            try:
+                pinned = self.resolve(roots)
+            except VersionConflict as exc:
+                self.logger.info('resolver: %s', exc)
+                for package_name in conflicts:
+                    for error in errors[package_name].values():
+                        error['exception'] = exc
+            if pinned:
+                for package_name in self.packages_required_by(roots):
+                    errors.pop(package_name, None)
+                    chosen.pop(package_name, None)
+                    installable_packages.discard(package_name)
+                for package_name, candidate in pinned.items():
+                    try:
+                        chosen[package_name] = self.pinned_requirement(package_name, candidate)
+                        installable_packages.add(package_name)
+                    except Exception as exc:
+                        self.logger.info('resolver: failed to retrieve %s (%s): %s',
+                            package_name, candidate.version, exc)
+                        errors[package_name][package_name] = {
+                            'exception': exc, 'dependency_of': [None]}
+
+        # It's OK to queue each package without being sure about the
+        # availability of all the requirements. The Installer service
+        # will not be started until everything is checked.
+        self.chosen = chosen
+        for package_name, requirement in chosen.items():
+            self.installer.queue('main',
+                requirement=requirement,
+                wheel=self.mapping.wheels[requirement])
 
         # Check if the number of packages to install is the same as
         # the number of packages initially requested. If it's not
@@ -226,6 +337,158 @@ class Install(Service):
             errors.update(self.mapping.errors)
         return installable_packages, errors
 
+    def resolve(self, requirements=None):
+        """Choose the versions of all the packages `requirements` need
+
+        Explores the wheels built in this run, the ones available in the
+        local index and the releases the indexes know about, retrieving
+        only the ones the resolver tries. All the primary requirements are
+        resolved when `requirements` is not informed. See
+        `curdling.resolver`.
+        """
+        if requirements is None:
+            requirements = [requirement for requirement in self.mapping.requirements
+                if self.mapping.is_primary_requirement(requirement)]
+        if not requirements:
+            return {}
+        resolver = Resolver(self.candidates, self.candidate_dependencies)
+        pinned = resolver.resolve(sorted(requirements))
+        self.logger.info('resolver: %d packages pinned after %d rounds',
+            len(pinned), resolver.rounds)
+        return pinned
+
+    def primary_requirements_of(self, requirements):
+        # Walks up `mapping.dependencies`, that has the requirements that
+        # asked for each requirement, or None for the primary ones
+        found, seen, pending = set(), set(), list(requirements)
+        while pending:
+            requirement = pending.pop()
+            if requirement in seen:
+                continue
+            seen.add(requirement)
+            for dependency_of in self.mapping.dependencies.get(requirement, ()):
+                if dependency_of is None:
+                    found.add(requirement)
+                else:
+                    pending.append(dependency_of)
+        return found
+
+    def packages_required_by(self, roots):
+        # Packages only required because of the primary requirements in `roots`
+        requirements = list(self.mapping.requirements) + list(self.mapping.conflicts)
+        packages, others = set(), set()
+        for requirement in requirements:
+            package_name = parse_requirement(requirement).name
+            if self.primary_requirements_of([requirement]) <= set(roots):
+                packages.add(package_name)
+            else:
+                others.add(package_name)
+        return packages - others
+
+    def candidates(self, package_name):
+        if package_name in PACKAGE_BLACKLIST:
+            return []
+        found = {}
+        for requirement in self.mapping.get_requirements_by_package_name(package_name):
+            if self.mapping.wheels.get(requirement):
+                found.setdefault(wheel_version(self.mapping.wheels[requirement]),
+                    self.mapping.wheels[requirement])
+        if self.index and not is_url(package_name):
+            for version in list(self.index.storage.get(package_name, ())):
+                if version not in found:
+                    try:
+                        found[version] = self.index.get(
+                            '{0}=={1};whl'.format(package_name, version))
+                    except PackageNotFound:
+                        pass
+        for version, url in self.remote_candidates(package_name):
+            found.setdefault(version, url)
+        return [Candidate(version, found[version])
+            for version in sorted(found, key=LegacyVersion, reverse=True)]
+
+    def remote_candidates(self, package_name):
+        # Releases listed by the indexes. The Finder already looked most
+        # of these projects up, the locators keep them cached.
+        if self.finder.locator is None or is_url(package_name):
+            return []
+        found = []
+        for locator in self.finder.locator.locators:
+            try:
+                versions = locator.get_project(package_name) or {}
+            except NETWORK_ERRORS:
+                continue
+            for version, distribution in versions.items():
+                # distlib also keeps a few dictionaries among the versions
+                if not hasattr(distribution, 'metadata'):
+                    continue
+                url = self.finder.get_download_url(distribution)
+                self.remote.setdefault(url, distribution)
+                found.append((version, url))
+        return found
+
+    def candidate_dependencies(self, requirement, wheel):
+        if wheel not in self.remote:
+            return self.dependencer.requirements(requirement, wheel)
+
+        # Some indexes inform the requirements of each release, the other
+        # releases have to be retrieved to read them from their wheels
+        distribution = self.remote[wheel]
+        dependencies = distribution.locator.get_dependencies(distribution)
+        if dependencies is not None:
+            return self.dependencer.select(requirement, {'install': dependencies})
+        try:
+            return self.dependencer.requirements(requirement, self.retrieve_candidate(wheel))
+        except Exception as exc:
+            self.logger.info('resolver: failed to retrieve %s: %s', wheel, exc)
+            return None
+
+    def retrieve_candidate(self, url):
+        """Download and build a release the resolver found in an index"""
+        if url not in self.retrieved:
+            distribution = self.remote[url]
+            requirement = safe_name('{0}=={1}'.format(distribution.name, distribution.version))
+            data = self.downloader.handle('main', {
+                'requirement': requirement,
+                'url': url,
+                'locator_url': distribution.locator.base_url,
+            })
+            digest = self.artifact_digest(dict(data, url=url))
+            if not data.get('wheel'):
+                data = self.curdler.handle('main', data)
+            self.retrieved[url] = data['wheel'], digest
+        return self.retrieved[url][0]
+
+    def artifact_digest(self, data):
+        """The sha256 of the file the downloader retrieved for `data`
+
+        Only files downloaded over HTTP have one, packages retrieved from
+        VCS URLs and the wheels built from them before don't.
+        """
+        requirement = data['requirement']
+        url = self.mapping.sources.get(requirement, {}).get('url') or \
+            data.get('url') or requirement
+        artifact = data.get('tarball') or data.get('wheel')
+        if not artifact or not re.match(r'^https?://', url):
+            return None
+        return self.index.digest(artifact)
+
+    def pinned_requirement(self, package_name, candidate):
+        # Wheels picked from the index weren't requested by anyone yet
+        for requirement in self.mapping.get_requirements_by_package_name(package_name):
+            if self.mapping.wheels.get(requirement) == candidate.wheel:
+                return requirement
+        requirement = safe_name('{0}=={1}'.format(package_name, candidate.version))
+        wheel = candidate.wheel
+        if wheel in self.remote:
+            wheel = self.retrieve_candidate(candidate.wheel)
+            self.mapping.sources[requirement] = {
+                'url': candidate.wheel,
+                'index': self.remote[candidate.wheel].locator.base_url,
+                'sha256': self.retrieved[candidate.wheel][1],
+            }
+        self.mapping.wheels[requirement] = wheel
+        return requirement
+
     def retrieve_and_build(self):
         # Wait until all the packages have the chance to be processed
         while True:
@@ -253,14 +516,106 @@ class Install(Service):
                 break
             time.sleep(0.5)
 
+        self.report_host_waits()
+        self.report_requirement_cache()
+
         # Walk through all the requested requirements and queue their best
         # version
         packages, errors = self.load_installer()
         if errors:
             self.emit('finished', errors)
             return []
+        if self.conf.get('save_lockfile'):
+            self.save_lockfile(self.conf['save_lockfile'])
         return packages
 
+    def save_lockfile(self, path):
+        packages = []
+        for package_name, requirement in self.chosen.items():
+            wheel = self.mapping.wheels[requirement]
+            source = self.mapping.sources.get(requirement, {})
+            url = requirement if is_url(requirement) else source.get('url')
+            digest = source.get('sha256') and ('sha256', source['sha256'])
+            packages.append(lockfile.package(
+                name=package_name,
+                version=wheel_version(os.path.basename(wheel)),
+                wheel=wheel,
+                sha256=self.index.digest(wheel),
+                url=url and add_url_digest(url, digest),
+                index=source.get('index')))
+        lockfile.save(path, packages)
+        self.logger.info('lockfile: %d packages saved to %s', len(packages), path)
+
+    def load_lockfile(self, packages):
+        """Queue the packages of a lockfile, see `curdling.lockfile`
+
+        Wheels found in the local index with the same digest are installed
+        right away. The others are downloaded straight from the URL saved
+        and built if needed. The URL carries the digest of the file
+        downloaded when the lockfile was saved, so the downloader refuses
+        files that changed since. Only packages saved without a URL are
+        looked up in the indexes, pinned to the version saved.
+        """
+        for package in packages:
+            if is_url(package['name']):
+                requirement = package['name']
+            else:
+                requirement = safe_name('{0}=={1}'.format(package['name'], package['version']))
+            self.mapping.requirements.add(requirement)
+            self.mapping.dependencies[requirement].append(None)
+
+            wheel = self.locked_wheel(package)
+            if wheel:
+                self.mapping.wheels[requirement] = wheel
+            elif package['url']:
+                self.downloader.queue('main', requirement=requirement,
+                    url=package['url'], locator_url=package['index'])
+            else:
+                self.finder.queue('main', requirement=requirement)
+
+    def locked_wheel(self, package):
+        path = os.path.join(self.index.base_path, package['wheel'])
+        if os.path.isfile(path) and self.index.digest(path) == package['sha256']:
+            return path
+        return None
+
+    def retrieve_locked(self):
+        # Everything was queued by `load_lockfile()`, so we just wait for
+        # the packages that had to be downloaded or built
+        while True:
+            total = len(self.mapping.requirements)
+            retrieved = self.mapping.count('downloader')
+            built = len(self.mapping.wheels)
+            failed = sum(len(x) for x in self.mapping.errors.values())
+            self.emit('update_retrieve_and_build',
+                total, retrieved, built, failed)
+            if total == built + failed:
+                break
+            time.sleep(0.5)
+
+        if self.mapping.errors:
+            self.emit('finished', self.mapping.errors)
+            return []
+        for requirement, wheel in self.mapping.wheels.items():
+            self.installer.queue('main', requirement=requirement, wheel=wheel)
+        return self.mapping.installable_packages()
+
+    def report_host_waits(self):
+        # How long requests waited for the per host limits. See `--max-per-host`.
+        stats = self.downloader.limiter.stats()
+        for host, (count, total, longest) in sorted(stats.items()):
+            self.logger.info(
+                '%s: %d requests waited %.2fs for a free slot (longest: %.2fs)',
+                host, count, total, longest)
+
+    def report_requirement_cache(self):
+        stats = requirement_cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        self.logger.debug(
+            'requirement cache: %d hits, %d misses (%.1f%% hit rate, %d entries)',
+            stats['hits'], stats['misses'],
+            lookups and 100.0 * stats['hits'] / lookups, stats['size'])
+
     def install(self, packages):
         self.installer.start()
         while True:
@@ -293,6 +648,7 @@ class Install(Service):
                 wheel = self.mapping.wheels[requirement]
                 self.uploader.queue('main',
                     wheel=wheel, server=server, requirement=requirement)
+                self.finder.forget_not_found(server, package_name)
         return total
 
     def upload(self):
@@ -305,9 +661,13 @@ class Install(Service):
             time.sleep(0.5)
 
     def run(self):
-        packages = self.retrieve_and_build()
+        if self.conf.get('lockfile'):
+            packages = self.retrieve_locked()
+        else:
+            packages = self.retrieve_and_build()
         if packages:
             self.install(packages)
-        if not self.mapping.errors and self.conf.get('upload'):
+        if not self.mapping.errors and self.conf.get('upload') \
+                and not self.conf.get('offline'):
             self.upload()
         return self.emit('finished')
@@ -0,0 +1,84 @@
+# Curdling - Concurrent package manager for Python
+# Copyright (C) 2013  Lincoln Clarete <lincoln@clarete.li>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Packages chosen by an install, saved to be installed again
+
+A lockfile is a JSON document listing each package installed with its
+version, the wheel installed and its sha256 digest, plus the URL the
+package was retrieved from and the index that informed it. URLs carry
+the sha256 of the file downloaded in a `#sha256=` fragment. Installing
+from a lockfile doesn't look anything up, see `Install.load_lockfile()`.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+from distlib import compat
+from .exceptions import InvalidLockfile
+
+import io
+import json
+import os
+
+
+LOCKFILE_VERSION = 1
+
+# Fields of each package. `url` and `index` might be null.
+PACKAGE_FIELDS = ('name', 'version', 'wheel', 'sha256', 'url', 'index')
+
+
+def package(name, version, wheel, sha256, url=None, index=None):
+    return {
+        'name': name,
+        'version': version,
+        'wheel': os.path.basename(wheel),
+        'sha256': sha256,
+        'url': url,
+        'index': index,
+    }
+
+
+def save(path, packages):
+    document = {
+        'version': LOCKFILE_VERSION,
+        'packages': sorted(packages, key=lambda p: p['name']),
+    }
+
+    # Write to a temporary file first so a crash never leaves a half
+    # written lockfile behind
+    temporary = '{0}.{1}'.format(path, os.getpid())
+    with io.open(temporary, 'w', encoding='utf-8') as fobj:
+        fobj.write(compat.text_type(
+            json.dumps(document, indent=2, sort_keys=True)) + '\n')
+    os.rename(temporary, path)
+
+
+def load(path):
+    try:
+        with io.open(path, 'r', encoding='utf-8') as fobj:
+            document = json.load(fobj)
+    except (IOError, OSError, ValueError) as exc:
+        raise InvalidLockfile(
+            'Can\'t read the lockfile `{0}\': {1}'.format(path, exc))
+
+    if not isinstance(document, dict) or document.get('version') != LOCKFILE_VERSION:
+        raise InvalidLockfile(
+            'Unknown format of the lockfile `{0}\''.format(path))
+    packages = document.get('packages')
+    if not isinstance(packages, list) or not all(
+            isinstance(p, dict) and all(f in p for f in PACKAGE_FIELDS)
+            for p in packages):
+        raise InvalidLockfile(
+            'Broken list of packages in the lockfile `{0}\''.format(path))
+    return packages
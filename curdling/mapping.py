@@ -18,8 +18,11 @@ from __future__ import absolute_import, unicode_literals, print_function
 from collections import defaultdict
 from distlib.version import LegacyMatcher, LegacyVersion
 
+import threading
+
 from . import util
 from .exceptions import BrokenDependency, VersionConflict
+from .resolver import VersionRange
 
 
 def wheel_version(path):
@@ -35,45 +38,175 @@ def wheel_version(path):
     return path.split('-')[1]
 
 
+class RequirementSet(set):
+    """Set of requirements indexed by the name of their packages
+
+    It's still a set, so the code that adds and discards requirements
+    doesn't change, but finding the requirements of a package doesn't
+    require parsing all the requirements filed so far anymore. Requirements
+    are filed by the threads of the services, so the set and its indexes
+    are only changed while holding `lock`.
+    """
+
+    def __init__(self, requirements=()):
+        super(RequirementSet, self).__init__()
+        self.lock = threading.RLock()
+        self.by_name = defaultdict(list)
+        self.ranges = {}
+        self.update(requirements)
+
+    def name(self, requirement):
+        # Parsed requirements are memoized, see `util.parse_requirement()`
+        return util.parse_requirement(requirement).name
+
+    def named(self, package_name):
+        with self.lock:
+            return list(self.by_name.get(package_name, ()))
+
+    def package_names(self):
+        with self.lock:
+            return set(name for name, requirements in self.by_name.items() if requirements)
+
+    def version_range(self, package_name):
+        # Versions accepted by all the requirements of a package, updated
+        # as requirements are added and computed again after discards
+        with self.lock:
+            if package_name not in self.ranges:
+                version_range = VersionRange()
+                for requirement in self.by_name.get(package_name, ()):
+                    version_range = version_range.intersect(
+                        VersionRange.from_requirement(requirement))
+                self.ranges[package_name] = version_range
+            return self.ranges[package_name]
+
+    def add(self, requirement):
+        with self.lock:
+            if requirement not in self:
+                super(RequirementSet, self).add(requirement)
+                name = self.name(requirement)
+                self.by_name[name].append(requirement)
+                if name in self.ranges:
+                    self.ranges[name] = self.ranges[name].intersect(
+                        VersionRange.from_requirement(requirement))
+
+    def discard(self, requirement):
+        with self.lock:
+            if requirement in self:
+                super(RequirementSet, self).discard(requirement)
+                name = self.name(requirement)
+                self.by_name[name].remove(requirement)
+                self.ranges.pop(name, None)
+
+    def remove(self, requirement):
+        with self.lock:
+            if requirement not in self:
+                raise KeyError(requirement)
+            self.discard(requirement)
+
+    def pop(self):
+        with self.lock:
+            requirement = next(iter(self))
+            self.discard(requirement)
+            return requirement
+
+    def clear(self):
+        with self.lock:
+            super(RequirementSet, self).clear()
+            self.by_name.clear()
+            self.ranges.clear()
+
+    def update(self, *others):
+        with self.lock:
+            for requirements in others:
+                for requirement in requirements:
+                    self.add(requirement)
+
+    def difference_update(self, *others):
+        with self.lock:
+            for requirements in others:
+                for requirement in list(requirements):
+                    self.discard(requirement)
+
+    def intersection_update(self, *others):
+        with self.lock:
+            kept = set(self).intersection(*others)
+            self.difference_update([r for r in self if r not in kept])
+
+    def symmetric_difference_update(self, other):
+        with self.lock:
+            for requirement in set(other):
+                if requirement in self:
+                    self.discard(requirement)
+                else:
+                    self.add(requirement)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
 class Mapping(object):
 
     def __init__(self):
-        self.requirements = set()
+        self.requirements = RequirementSet()
         self.dependencies = defaultdict(list)
         self.stats = defaultdict(int)
         self.errors = defaultdict(dict)
         self.wheels = {}
+        self.sources = {}
+        self.conflicts = {}
         self.repeated = []
 
+    @property
+    def requirements(self):
+        return self._requirements
+
+    @requirements.setter
+    def requirements(self, requirements):
+        # Plain sets assigned to the mapping get indexed as well
+        self._requirements = requirements \
+            if isinstance(requirements, RequirementSet) \
+            else RequirementSet(requirements)
+
     def count(self, service):
         return self.stats[service]
 
     def initially_required_packages(self):
-        return set(util.parse_requirement(r).name for r in self.requirements)
+        return self.requirements.package_names()
 
     def installable_packages(self):
         # Load all the wheels we built so far into the mapping, so
         # we'll be able to narrow down all the versions collected for
         # each single package to the best one.
-        return set(util.parse_requirement(r).name for r in self.wheels)
+        return set(self.requirements.name(r) for r in self.wheels)
 
     def filed_packages(self):
-        return list(set(util.parse_requirement(r).name for r in self.requirements))
+        return list(self.requirements.package_names())
 
     def get_requirements_by_package_name(self, package_name):
-        return [x for x in self.requirements
-            if util.parse_requirement(x).name == util.parse_requirement(package_name).name]
+        return self.requirements.named(self.requirements.name(package_name))
 
     def available_versions(self, package_name):
         return sorted(set(wheel_version(self.wheels[requirement])
-            for requirement in self.requirements
-                if self.wheels.get(requirement) and
-                    util.parse_requirement(requirement).name == package_name),
+            for requirement in self.requirements.named(package_name)
+                if self.wheels.get(requirement)),
                       reverse=True)
 
     def matching_versions(self, requirement):
         matcher = LegacyMatcher(requirement.replace('-', '_'))
-        package_name = util.parse_requirement(requirement).name
+        package_name = self.requirements.name(requirement)
         versions = self.available_versions(package_name)
         return [version for version in versions
             if matcher.match(version)]
@@ -84,11 +217,25 @@ class Mapping(object):
                 return True
         return False
 
+    def conflicting_requirements(self, requirement):
+        """Requirements filed so far that can't be satisfied with `requirement`
+
+        Only the requirements that conflict with `requirement` by
+        themselves are returned, unless it takes all of them together.
+        """
+        package_name = self.requirements.name(requirement)
+        version_range = VersionRange.from_requirement(requirement)
+        if not self.requirements.version_range(package_name).intersect(version_range).empty:
+            return []
+        filed = self.requirements.named(package_name)
+        return [r for r in filed
+                if VersionRange.from_requirement(r).intersect(version_range).empty] or filed
+
     def is_primary_requirement(self, requirement):
         return bool(self.dependencies[requirement].count(None))
 
     def best_version(self, requirement_or_package_name, debug=False):
-        package_name = util.parse_requirement(requirement_or_package_name).name
+        package_name = self.requirements.name(requirement_or_package_name)
         requirements = self.get_requirements_by_package_name(package_name)
 
         # Used to remember in which requirement we found each version
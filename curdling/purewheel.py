@@ -0,0 +1,264 @@
+# Curdling - Concurrent package manager for Python
+# Copyright (C) 2013  Lincoln Clarete <lincoln@clarete.li>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Build wheels of pure Python packages without running `setup.py`
+
+Lots of packages are described entirely by the `PKG-INFO` file of their
+source distribution and by `setup.cfg`, with a `setup.py` script that
+just calls `setup()`. Their wheels are nothing but the Python files of
+the packages plus some metadata, so they can be assembled right here.
+
+`build_wheel()` only does it when there's no doubt about what the
+wheel should contain. Anything it doesn't understand makes it return
+`None` and the package goes through `setup.py bdist_wheel` as usual.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+from .wheel import Wheel
+from base64 import urlsafe_b64encode
+from contextlib import closing
+from distlib.compat import configparser
+
+import ast
+import email
+import hashlib
+import io
+import os
+import re
+import sys
+import zipfile
+
+
+# Keys of the `[options]` section of `setup.cfg` we know how to honor.
+# Everything else (package_dir, package_data, scripts, entry_points,
+# setup_requires, etc) requires the real build.
+KNOWN_OPTIONS = set([
+    'packages', 'py_modules', 'install_requires', 'python_requires',
+    'zip_safe', 'include_package_data',
+])
+
+# Sections of `setup.cfg` that configure the commands used by the build
+BUILD_SECTIONS = ('build', 'build_py', 'install', 'install_lib', 'egg_info')
+
+# Fields of `PKG-INFO` replaced by the ones we build from `setup.cfg`
+DEPENDENCY_FIELDS = ('Requires-Dist', 'Provides-Extra', 'Requires', 'Metadata-Version')
+
+# Directives of setuptools that read values from other places
+DIRECTIVE = re.compile(r'^\s*(attr|file|find|find_namespace):')
+
+# `ast.Str` is gone in newer Pythons
+STRING_NODE = getattr(ast, 'Constant', None) or ast.Str
+
+
+def is_trivial_setup(source):
+    """Tell if a `setup.py` script just imports and calls `setup()`"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return False
+
+    def trivial(node):
+        if isinstance(node, ast.ImportFrom):
+            return node.module == 'setuptools' and \
+                [alias.name for alias in node.names] == ['setup']
+        if isinstance(node, ast.Import):
+            return [alias.name for alias in node.names] == ['setuptools']
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            call = node.value
+            name = getattr(call.func, 'id', None) or getattr(call.func, 'attr', None)
+            return name == 'setup' and not call.args and not call.keywords \
+                and not getattr(call, 'starargs', None) and not getattr(call, 'kwargs', None)
+        if isinstance(node, ast.Expr):
+            # Docstrings
+            return isinstance(node.value, STRING_NODE)
+        if isinstance(node, ast.If):
+            # if __name__ == '__main__':
+            return not node.orelse and all(trivial(x) for x in node.body) and \
+                getattr(node.test, 'left', None) is not None and \
+                getattr(node.test.left, 'id', None) == '__name__'
+        return False
+    return all(trivial(node) for node in tree.body)
+
+
+def read_setup_cfg(path):
+    parser = configparser.RawConfigParser()
+    with io.open(path, encoding='utf-8') as fobj:
+        if hasattr(parser, 'read_file'):
+            parser.read_file(fobj)
+        else:  # Python 2
+            parser.readfp(fobj)
+    return parser
+
+
+def split_list(value):
+    return [item.strip() for item in re.split(r'[\n,]', value or '') if item.strip()]
+
+
+def static_options(config):
+    """Read what we need from `setup.cfg` or None if it's not static"""
+    if not config.has_section('options'):
+        return None
+    for section in config.sections():
+        if section.startswith('options.') and section != 'options.extras_require':
+            return None
+        if section in BUILD_SECTIONS and section != 'egg_info':
+            return None
+        if section.startswith('options') and any(
+                DIRECTIVE.match(value) for _, value in config.items(section)):
+            return None
+
+    # Tags were already applied to the version saved in `PKG-INFO`
+    if config.has_section('egg_info'):
+        tags = dict(config.items('egg_info'))
+        if tags.get('tag_build') or tags.get('tag_date', '0') not in ('0', 'false'):
+            return None
+
+    options = dict(config.items('options'))
+    if set(options) - KNOWN_OPTIONS:
+        return None
+    if options.get('include_package_data', 'false').lower() not in ('0', 'false'):
+        return None
+
+    extras = {}
+    if config.has_section('options.extras_require'):
+        extras = dict((name, split_list(value))
+            for name, value in config.items('options.extras_require'))
+        if any(':' in name for name in extras):
+            return None
+
+    universal = config.has_section('bdist_wheel') and dict(
+        config.items('bdist_wheel')).get('universal', '0').lower() in ('1', 'true')
+    return {
+        'packages': split_list(options.get('packages')),
+        'py_modules': split_list(options.get('py_modules')),
+        'install_requires': split_list(options.get('install_requires')),
+        'extras': extras,
+        'universal': universal,
+    }
+
+
+def python_files(root, options):
+    """Python files of the packages and modules, relative to `root`"""
+    files = []
+    for package in options['packages']:
+        directory = os.path.join(root, *package.split('.'))
+        if not os.path.isfile(os.path.join(directory, '__init__.py')):
+            return None
+        files.extend(os.path.join(package.replace('.', '/'), name)
+            for name in sorted(os.listdir(directory)) if name.endswith('.py'))
+    for module in options['py_modules']:
+        name = '{0}.py'.format(module.replace('.', '/'))
+        if not os.path.isfile(os.path.join(root, name)):
+            return None
+        files.append(name)
+    return files
+
+
+def metadata(pkg_info, options):
+    """`METADATA` of the wheel: `PKG-INFO` plus the dependencies"""
+    message = email.message_from_string(pkg_info)
+    for field in DEPENDENCY_FIELDS:
+        del message[field]
+
+    # 2.0 is the newest version distlib 0.1.2 reads that has `Provides-Extra`
+    headers = [('Metadata-Version', '2.0')]
+    headers.extend(message.items())
+    headers.extend(('Requires-Dist', requirement_field(requirement))
+        for requirement in options['install_requires'])
+    for extra, requirements in sorted(options['extras'].items()):
+        headers.append(('Provides-Extra', extra))
+        headers.extend(('Requires-Dist', requirement_field(requirement, extra))
+            for requirement in requirements)
+
+    lines = ['{0}: {1}'.format(*header) for header in headers]
+    body = message.get_payload()
+    return '\n'.join(lines) + '\n\n' + (body or '')
+
+
+def requirement_field(requirement, extra=None):
+    spec, _, marker = requirement.partition(';')
+    markers = [m for m in (marker.strip(), extra and 'extra == "{0}"'.format(extra)) if m]
+    if len(markers) > 1:
+        markers[0] = '({0})'.format(markers[0])
+    return spec.strip() + ('; ' + ' and '.join(markers) if markers else '')
+
+
+def record_line(path, data):
+    digest = urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=')
+    return '{0},sha256={1},{2}'.format(path, digest.decode('ascii'), len(data))
+
+
+def build_wheel(setup_py, destination):
+    """Assemble the wheel of a static pure Python package
+
+    Returns the path of the wheel saved in `destination` or `None` when
+    the package needs a real build.
+    """
+    root = os.path.dirname(setup_py)
+    pkg_info_path = os.path.join(root, 'PKG-INFO')
+    setup_cfg_path = os.path.join(root, 'setup.cfg')
+    if os.path.exists(os.path.join(root, 'pyproject.toml')) or \
+            not os.path.isfile(pkg_info_path) or not os.path.isfile(setup_cfg_path):
+        return None
+
+    try:
+        with io.open(setup_py, encoding='utf-8') as fobj:
+            if not is_trivial_setup(fobj.read()):
+                return None
+        with io.open(pkg_info_path, encoding='utf-8') as fobj:
+            pkg_info = fobj.read()
+        options = static_options(read_setup_cfg(setup_cfg_path))
+    except (IOError, OSError, UnicodeDecodeError, configparser.Error):
+        return None
+
+    info = email.message_from_string(pkg_info)
+    if options is None or not info['Name'] or not info['Version']:
+        return None
+    files = python_files(root, options)
+    if not files:
+        return None
+
+    # The same name `bdist_wheel` would give to the file
+    wheel = Wheel()
+    wheel.distribution = re.sub(r'[^\w\d.]+', '_', info['Name'])
+    wheel.version = re.sub(r'[^\w\d.+!]+', '_', info['Version'])
+    wheel.tags.pyver = 'py2.py3' if options['universal'] \
+        else 'py{0}'.format(sys.version_info[0])
+    wheel.tags.abi = wheel.tags.arch = None
+    dist_info = wheel.dist_info_path()
+
+    contents = [(name, None) for name in files] + [
+        ('{0}/METADATA'.format(dist_info), metadata(pkg_info, options)),
+        ('{0}/WHEEL'.format(dist_info), wheel.wheel_file()),
+    ]
+    path = os.path.join(destination, '{0}.whl'.format(wheel.name()))
+    if not os.path.isdir(destination):
+        os.makedirs(destination)
+
+    record = []
+    with closing(zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)) as archive:
+        for name, text in contents:
+            if text is None:
+                with io.open(os.path.join(root, name), 'rb') as fobj:
+                    data = fobj.read()
+            else:
+                data = text.encode('utf-8')
+            archive.writestr(name, data)
+            record.append(record_line(name, data))
+        record.append('{0}/RECORD,,'.format(dist_info))
+        archive.writestr('{0}/RECORD'.format(dist_info),
+            '\n'.join(record).encode('utf-8') + b'\n')
+    return path
@@ -0,0 +1,299 @@
+# Curdling - Concurrent package manager for Python
+# Copyright (C) 2013  Lincoln Clarete <lincoln@clarete.li>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Choose versions of all the packages that agree with each other
+
+`Mapping.best_version()` looks at each package alone, so a version picked
+for one package can require a version of another one that nobody else
+accepts. The `Resolver` picks the versions of all the packages together,
+going back to try older versions of the packages chosen before whenever
+a choice leads to a conflict.
+
+Candidates and their dependencies are read through two functions, so
+the resolver doesn't care where the wheels come from. Dependencies are
+only read for the candidates actually tried.
+"""
+
+from __future__ import absolute_import, unicode_literals, print_function
+from collections import defaultdict, namedtuple
+from distlib.version import LegacyMatcher, LegacyVersion
+
+from . import util
+from .exceptions import VersionConflict
+
+
+# Number of packages the resolver may try to pin before giving up. It
+# keeps pathological dependency graphs from running for hours.
+MAX_RESOLVER_ROUNDS = 10000
+
+
+Candidate = namedtuple('Candidate', 'version wheel')
+
+
+def satisfies(requirement, version):
+    # Same matching used by `Mapping.matching_versions()`
+    if util.is_url(requirement):
+        return True
+    return LegacyMatcher(requirement.replace('-', '_')).match(version)
+
+
+class VersionRange(object):
+    """Versions accepted by a set of constraints
+
+    It doesn't need to know which versions exist, so conflicts between
+    requirements like `lib (>= 2.0)` and `lib (< 2.0)` can be found before
+    retrieving anything. Constraints it can't represent, like wildcards,
+    don't restrict the range, so it never reports false conflicts.
+    """
+
+    def __init__(self, lower=None, upper=None, excluded=()):
+        # Bounds are `(version, inclusive)` tuples
+        self.lower = lower
+        self.upper = upper
+        self.excluded = frozenset(excluded)
+
+    @classmethod
+    def from_requirement(cls, requirement):
+        version_range = cls()
+        if util.is_url(requirement):
+            return version_range
+        for operator, version in util.parse_requirement(requirement).constraints:
+            version_range = version_range.intersect(cls.from_constraint(operator, version))
+        return version_range
+
+    @classmethod
+    def from_constraint(cls, operator, version):
+        if '*' in version:
+            return cls()
+        bound = LegacyVersion(version)
+        if operator == '==':
+            return cls((bound, True), (bound, True))
+        elif operator == '!=':
+            return cls(excluded=[bound])
+        elif operator in ('>=', '>'):
+            return cls(lower=(bound, operator == '>='))
+        elif operator in ('<=', '<'):
+            return cls(upper=(bound, operator == '<='))
+        elif operator == '~=':
+            # `~= 1.4.5` means `>= 1.4.5, < 1.5`
+            parts = version.split('.')[:-1]
+            if len(parts) and parts[-1].isdigit():
+                parts[-1] = str(int(parts[-1]) + 1)
+                return cls((bound, True), (LegacyVersion('.'.join(parts)), False))
+            return cls(lower=(bound, True))
+        return cls()
+
+    def intersect(self, other):
+        return VersionRange(
+            self._bound(self.lower, other.lower, max),
+            self._bound(self.upper, other.upper, min),
+            self.excluded | other.excluded)
+
+    @property
+    def empty(self):
+        if self.lower is None or self.upper is None:
+            return False
+        (lower, lower_inclusive), (upper, upper_inclusive) = self.lower, self.upper
+        if lower != upper:
+            return lower > upper
+        return not (lower_inclusive and upper_inclusive) or lower in self.excluded
+
+    @staticmethod
+    def _bound(first, second, pick):
+        if first is None or second is None:
+            return first or second
+        if first[0] == second[0]:
+            return (first[0], first[1] and second[1])
+        return first if pick(first[0], second[0]) == first[0] else second
+
+
+class Resolver(object):
+    """Backtracking search for a version of each required package
+
+    `candidates(package_name)` returns the `Candidate` objects available
+    for a package, the preferred ones first. `dependencies(requirement,
+    wheel)` returns the requirements of a candidate, or None when they
+    can't be read, which leaves the candidate out.
+    """
+
+    def __init__(self, candidates, dependencies, max_rounds=MAX_RESOLVER_ROUNDS):
+        self.get_candidates = candidates
+        self.get_dependencies = dependencies
+        self.max_rounds = max_rounds
+        self.rounds = 0
+        self.conflict = None
+        self._candidates = {}
+        self._dependencies = {}
+        self._matching = {}
+
+    def candidates(self, package_name):
+        if package_name not in self._candidates:
+            self._candidates[package_name] = list(self.get_candidates(package_name))
+        return self._candidates[package_name]
+
+    def dependencies(self, requirement, candidate):
+        key = (requirement, candidate.wheel)
+        if key not in self._dependencies:
+            dependencies = self.get_dependencies(requirement, candidate.wheel)
+            self._dependencies[key] = None if dependencies is None else list(dependencies)
+        return self._dependencies[key]
+
+    def matching(self, package_name, constraints):
+        key = (package_name, tuple(requirement for requirement, _ in constraints))
+        if key not in self._matching:
+            self._matching[key] = [
+                candidate for candidate in self.candidates(package_name)
+                if all(satisfies(requirement, candidate.version)
+                       for requirement in key[1])]
+        return self._matching[key]
+
+    def resolve(self, requirements):
+        """Pin a candidate for each package needed by `requirements`
+
+        Returns a dictionary mapping package names to the chosen
+        candidates or raises `VersionConflict` with the smallest set of
+        requirements that can't be satisfied together.
+        """
+        constraints = defaultdict(list)
+        for requirement in requirements:
+            constraints[util.parse_requirement(requirement).name].append((requirement, None))
+
+        self.rounds = 0
+        self.conflict = None
+        pinned = self._resolve(constraints)
+        if pinned is None:
+            raise VersionConflict(self.explain())
+        return pinned
+
+    def explain(self):
+        if self.conflict is None:
+            return 'Requirement: no versions of the packages could be retrieved'
+        package_name, constraints = self.conflict
+        versions = ', '.join(c.version for c in self.candidates(package_name))
+        required = ', '.join(
+            '{0} (required by {1})'.format(requirement, dependency_of or 'the user')
+            for requirement, dependency_of in constraints)
+        return 'Requirement: {0}: {1}, {2}'.format(
+            package_name, required,
+            versions and 'Available versions: {0}'.format(versions)
+            or 'no available versions were found')
+
+    # -- Private API --
+
+    def _resolve(self, constraints):
+        # Depth first search driven by an explicit stack, so long chains of
+        # dependencies don't run into the recursion limit. `pinned`,
+        # `constraints` and `pending` are shared by all the levels instead
+        # of copied for each one: every frame keeps the package it pins,
+        # its remaining options and the constraints its current option
+        # added, which are taken back before trying the next option.
+        pinned = {}
+        pending = set(constraints)
+        stack = []
+        while True:
+            self._count_round()
+            if not pending:
+                return pinned
+
+            # The package with fewer options goes first, so dead ends are
+            # found before spending time on the other packages
+            options = dict((name, self.matching(name, constraints[name]))
+                           for name in pending)
+            package_name = min(pending, key=lambda name: (len(options[name]), name))
+            if options[package_name]:
+                pending.discard(package_name)
+                stack.append(_Frame(package_name, options[package_name]))
+            else:
+                self._conflict(package_name, constraints[package_name])
+
+            # Pin the next option of the frame on top of the stack, going
+            # back to the frames below when it runs out of options
+            while stack:
+                frame = stack[-1]
+                self._unpin(frame, pinned, pending, constraints)
+                if not frame.options:
+                    stack.pop()
+                    pending.add(frame.package_name)
+                elif self._pin(frame, frame.options.pop(0), pinned, pending, constraints):
+                    break
+            else:
+                return None
+
+    def _pin(self, frame, candidate, pinned, pending, constraints):
+        package_name = frame.package_name
+        dependency_of = '{0} ({1})'.format(package_name, candidate.version)
+
+        # Each requirement might ask for different extras
+        dependencies = []
+        for requirement in sorted(set(r for r, _ in constraints[package_name])):
+            found = self.dependencies(requirement, candidate)
+            if found is None:
+                return False
+            dependencies.extend(d for d in found if d not in dependencies)
+
+        broken = None
+        for dependency in dependencies:
+            name = util.parse_requirement(dependency).name
+            constraints[name].append((dependency, dependency_of))
+            frame.added.append(name)
+            if name in pinned and not satisfies(dependency, pinned[name].version):
+                broken = name
+            elif name not in pinned and name != package_name:
+                pending.add(name)
+        if broken is not None:
+            self._conflict(broken, constraints[broken])
+            return False
+        pinned[package_name] = candidate
+        return True
+
+    def _unpin(self, frame, pinned, pending, constraints):
+        pinned.pop(frame.package_name, None)
+        while frame.added:
+            name = frame.added.pop()
+            constraints[name].pop()
+            if not constraints[name]:
+                del constraints[name]
+                pending.discard(name)
+
+    def _count_round(self):
+        self.rounds += 1
+        if self.rounds > self.max_rounds:
+            raise VersionConflict(
+                'Gave up resolving the requirements after {0} attempts'.format(
+                    self.max_rounds))
+
+    def _conflict(self, package_name, constraints):
+        # The first dead end is the one reported, with only the
+        # requirements that can't be satisfied together
+        if self.conflict is not None:
+            return
+        needed = list(constraints)
+        for item in list(needed):
+            others = [c for c in needed if c is not item]
+            if others and not self.matching(package_name, others):
+                needed = others
+        self.conflict = (package_name, needed)
+
+
+class _Frame(object):
+    # One level of the search done by `Resolver._resolve()`
+
+    __slots__ = ('package_name', 'options', 'added')
+
+    def __init__(self, package_name, options):
+        self.package_name = package_name
+        self.options = list(options)
+        self.added = []
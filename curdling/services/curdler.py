@@ -1,18 +1,35 @@
 from __future__ import absolute_import, print_function, unicode_literals
-from ..exceptions import UnpackingError, BuildError, NoSetupScriptFound
-from ..util import execute_command
-from .base import Service
+from ..exceptions import (
+    UnpackingError, BuildError, BuildServerUnavailable, NoSetupScriptFound)
+from .. import buildserver, purewheel
+from ..util import execute_command, command_output, parse_requirement, logger
+from .base import Service, SENTINEL
+from contextlib import closing, contextmanager
+from distlib.compat import queue
 
 import io
+import heapq
+import itertools
 import fnmatch
 import os
 import re
 import sys
 import shutil
 import tempfile
+import threading
 import zipfile
 import tarfile
 
+try:
+    from shutil import which
+except ImportError:  # Python < 3.3
+    from distutils.spawn import find_executable as which
+
+try:
+    import sysconfig
+except ImportError:  # Python 2.6
+    from distutils import sysconfig
+
 
 # We'll use it to call the `setup.py` script of packages we're building
 PYTHON_EXECUTABLE = sys.executable.encode(sys.getfilesystemencoding())
@@ -32,9 +49,23 @@ SUPPORTED_FORMATS = {
 # be used as the block size to `file.read()` in `guess_file_type()`
 SUPPORTED_FORMATS_MAX_LEN = (max(len(x) for x in SUPPORTED_FORMATS) + 7) & ~7
 
+# Python versions with extraction filters complain when we don't use one
+TAR_OPTIONS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
 # Matcher for egg-info directories
 EGG_INFO_RE = re.compile(r'(-py\d\.\d)?\.egg-info', re.I)
 
+# `build_ext` compiles the extensions of a package in parallel since
+# Python 3.5, older versions don't understand the `--parallel` option
+PARALLEL_BUILD_EXT = sys.version_info >= (3, 5)
+
+# Options of `run_setup_script()` forwarded to `execute_command()`
+BUILD_OPTIONS = ('usage', 'env', 'timeout', 'memory_limit', 'log')
+
+# What we assume a build takes when the package was never built before
+DEFAULT_BUILD_RSS = 256 * 2**20
+DEFAULT_BUILD_DURATION = 0
+
 
 def guess_file_type(filename):
     with io.open(filename, 'rb') as f:
@@ -45,19 +76,6 @@ def guess_file_type(filename):
     raise UnpackingError('Unknown compress format for file %s' % filename)
 
 
-def unpack(package):
-    file_type = guess_file_type(package)
-
-    # The only extensions we currently support are `zip', `gz' and `bz2'
-    if file_type in ('gz', 'bz2'):
-        fp = tarfile.open(package, 'r')
-        return fp, [x.name for x in fp.getmembers()]
-    if file_type == 'zip':
-        fp = zipfile.ZipFile(package)
-        return fp, fp.namelist()
-    raise UnpackingError('Unknown compress format for file %s' % package)
-
-
 def find_setup_script(names):
     setup_scripts = [x for x in names if x[-8:] == 'setup.py']
     if not setup_scripts:
@@ -65,17 +83,86 @@ def find_setup_script(names):
     return sorted(setup_scripts, key=lambda e: len(e))[0]
 
 
+def member_name(name):
+    while name.startswith('./'):
+        name = name[2:]
+    return name.rstrip('/')
+
+
+def package_root(name):
+    # The directory all the files of a source distribution live in, or an
+    # empty string when files live in the top of the archive.
+    parts = member_name(name).split('/', 1)
+    return parts[0] if len(parts) > 1 else ''
+
+
+def inside_root(name, root):
+    name = member_name(name)
+    return not root or name == root or name.startswith(root + '/')
+
+
+def check_member_path(destination, name):
+    """Refuse to extract files outside of the `destination` directory"""
+    base = os.path.realpath(destination)
+    path = os.path.realpath(os.path.join(base, name))
+    if path != base and not path.startswith(base + os.sep):
+        raise UnpackingError(
+            'File `{0}\' would be extracted outside of the package'.format(name))
+
+
+def extract_tarball(package, destination):
+    # Just like in `extract_zip()`, we find out which directory the
+    # `setup.py` script is in before extracting anything, and then only
+    # the files inside of that directory are extracted.
+    with closing(tarfile.open(package, 'r:*')) as fp:
+        members = [member for member in fp.getmembers()
+            if member_name(member.name) not in ('', '.')]
+        setup_py = find_setup_script([member.name for member in members])
+        root = package_root(setup_py)
+        for member in members:
+            if not inside_root(member.name, root) or \
+                    not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+                continue
+            check_member_path(destination, member.name)
+            if member.issym():
+                check_member_path(destination, os.path.join(
+                    os.path.dirname(member.name), member.linkname))
+            elif member.islnk():
+                check_member_path(destination, member.linkname)
+            fp.extract(member, destination, **TAR_OPTIONS)
+    return setup_py
+
+
+def extract_zip(package, destination):
+    # The list of files is at the end of zip files, so we find out which
+    # directory the `setup.py` script is before extracting anything.
+    with closing(zipfile.ZipFile(package)) as fp:
+        setup_py = find_setup_script(fp.namelist())
+        root = package_root(setup_py)
+        for name in fp.namelist():
+            if inside_root(name, root):
+                check_member_path(destination, name)
+                fp.extract(name, destination)
+    return setup_py
+
+
 def get_setup_from_package(package, destination):
-    fp, namelist = unpack(package=package)
-    try:
-        setup_py = find_setup_script(namelist)
-        fp.extractall(destination)
-    finally:
-        fp.close()
+    """Extract the directory of `package` that contains its setup.py script
+
+    Files outside of that directory, absolute paths, links pointing to
+    places outside of `destination` and special files are never created.
+    """
+    file_type = guess_file_type(package)
+    if file_type in ('gz', 'bz2'):
+        setup_py = extract_tarball(package, destination)
+    elif file_type == 'zip':
+        setup_py = extract_zip(package, destination)
+    else:
+        raise UnpackingError('Unknown compress format for file %s' % package)
     return os.path.join(destination, setup_py)
 
 
-def run_setup_script(path, command, *custom_args):
+def run_setup_script(path, command, *custom_args, **kwargs):
     # What we're gonna run
     cwd = os.path.dirname(path)
     script = os.path.basename(path)
@@ -91,8 +178,20 @@ def run_setup_script(path, command, *custom_args):
     args.append(command)
     args.extend(custom_args)
 
-    # Boom! Executing the command.
-    execute_command(PYTHON_EXECUTABLE, *args, cwd=cwd)
+    # Boom! Executing the command. The `usage` dictionary, when informed,
+    # receives the exit status, the peak memory usage and the duration of
+    # the build and `env` replaces the environment the build runs with.
+    # See `execute_command()` for the other options. Warm build `servers`
+    # are used when informed and still working, see `curdling.buildserver`.
+    options = dict((key, kwargs[key]) for key in BUILD_OPTIONS if key in kwargs)
+    servers = kwargs.get('servers')
+    if servers is not None:
+        try:
+            servers.run(path, [command] + list(custom_args), **options)
+        except BuildServerUnavailable:
+            servers = None
+    if servers is None:
+        execute_command(PYTHON_EXECUTABLE, *args, cwd=cwd, **options)
 
     # Directory where the wheel will be saved after building it, returning
     # the path pointing to the generated file
@@ -101,15 +200,242 @@ def run_setup_script(path, command, *custom_args):
     return os.path.join(output_dir, wheel)
 
 
+def compiler_cache_environ(path, environ=None):
+    """Environment that sends the compilers of a build through `ccache`
+
+    distutils reads the compiler from `CC` and `CXX` and uses the same
+    prefix for the linker, which ccache just passes through.
+    """
+    environ = dict(os.environ if environ is None else environ)
+    ccache = which('ccache')
+    for variable in ('CC', 'CXX'):
+        compiler = environ.get(variable) or \
+            sysconfig.get_config_var(variable)
+        if compiler and os.path.basename(compiler.split()[0]) != 'ccache':
+            environ[variable] = '{0} {1}'.format(ccache, compiler)
+    environ['CCACHE_DIR'] = path
+    return environ
+
+
+def compiler_cache_stats(path):
+    """Number of hits and misses of the compiler cache in `path`
+
+    Returns None when `ccache` is too old to print machine readable
+    statistics or is not available at all.
+    """
+    environ = dict(os.environ, CCACHE_DIR=path)
+    try:
+        output = command_output(which('ccache') or 'ccache', '--print-stats', env=environ)
+    except Exception:
+        return None
+    stats = dict(line.split('\t', 1) for line in
+        output.decode('utf-8').splitlines() if '\t' in line)
+    try:
+        return {
+            'hits': (int(stats.get('direct_cache_hit', 0)) +
+                     int(stats.get('preprocessed_cache_hit', 0))),
+            'misses': int(stats.get('cache_miss', 0)),
+        }
+    except ValueError:
+        return None
+
+
+def mem_available():
+    """Memory that can be used without swapping, in bytes, if we know it"""
+    try:
+        with io.open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+class BuildScheduler(object):
+    """Decides when the builds can run based on the previous ones
+
+    The peak memory usage and the duration of each build are saved in
+    the `build-history` catalog of the index. A build only starts if
+    there's a free slot and if the memory the running builds are
+    expected to use plus its own estimate fits in the `budget`. A build
+    always starts when nothing else is running, so packages bigger than
+    the budget are still built, one at a time.
+    """
+
+    def __init__(self, slots, budget=None, index=None):
+        self.slots = slots
+        self.budget = budget
+        self.index = index
+        self.running = 0
+        self.committed = 0
+        self.condition = threading.Condition()
+        self._history = {}
+
+    @property
+    def history(self):
+        if self.index is None:
+            return self._history
+        return self.index.catalog('build-history')
+
+    def estimate(self, name):
+        usage = self.history.get(name) or {}
+        return {
+            'peak_rss': usage.get('peak_rss', DEFAULT_BUILD_RSS),
+            'duration': usage.get('duration', DEFAULT_BUILD_DURATION),
+        }
+
+    def record(self, name, usage):
+        usage = {
+            'peak_rss': usage['peak_rss'],
+            'duration': usage['duration'],
+            'status': usage.get('status', 0),
+        }
+        if self.index is None:
+            self._history[name] = usage
+        else:
+            self.index.update_catalog('build-history', name, usage)
+
+    def admits(self, memory):
+        if not self.running:
+            return True
+        if self.running >= self.slots:
+            return False
+        return self.budget is None or self.committed + memory <= self.budget
+
+    @contextmanager
+    def slot(self, name):
+        memory = self.estimate(name)['peak_rss']
+        with self.condition:
+            while not self.admits(memory):
+                self.condition.wait()
+            self.running += 1
+            self.committed += memory
+
+        # The build informs how it went in this dictionary, see
+        # `run_setup_script()`. Failed builds are recorded as well, so
+        # the ones that were killed can be found.
+        usage = {}
+        try:
+            yield usage
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.committed -= memory
+                self.condition.notify_all()
+            if usage:
+                self.record(name, usage)
+
+
+class BuildQueue(queue.Queue):
+    """Queue that hands the longest builds out first
+
+    Starting the slow builds early keeps them from being the last ones
+    running while all the other workers are idle. The sentinels used to
+    stop the workers always come after the real jobs.
+    """
+
+    def __init__(self, priority, maxsize=0):
+        self.priority = priority
+        self.counter = itertools.count()
+        queue.Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self, len=len):
+        return len(self.queue)
+
+    def _put(self, item):
+        priority = float('inf') if item == SENTINEL else self.priority(item)
+        heapq.heappush(self.queue, (priority, next(self.counter), item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+
+def build_name(requirement):
+    return parse_requirement(requirement).name
+
+
 class Curdler(Service):
 
+    def __init__(self, *args, **kwargs):
+        super(Curdler, self).__init__(*args, **kwargs)
+        budget = self.conf.get('build_memory')
+        self.scheduler = BuildScheduler(
+            slots=self.size,
+            budget=budget * 2**20 if budget else mem_available(),
+            index=self.index)
+        self._queue = BuildQueue(self.build_priority)
+
+        # Compiled objects are shared by all the builds of the index
+        self.compiler_cache = None
+        if self.conf.get('compiler_cache') and self.index is not None:
+            if which('ccache'):
+                self.compiler_cache = self.index.cache_path('ccache')
+            else:
+                logger(__name__).warning(
+                    'ccache not found, building without a compiler cache')
+
+        # Interpreters with setuptools already imported, waiting for builds
+        self.build_servers = None
+        if self.conf.get('warm_builds') and buildserver.available():
+            self.build_servers = buildserver.BuildServerPool(self.size)
+
+    def join(self):
+        super(Curdler, self).join()
+        if self.build_servers is not None:
+            self.build_servers.close()
+
+    def build_log(self, name):
+        if self.index is None:
+            return None
+        return self.index.ensure_path(self.index.cache_path(
+            'build-logs', '{0}.log'.format(re.sub(r'[^\w.-]+', '_', name))))
+
+    def build(self, setup_py, usage, name):
+        # Extensions are compiled in parallel before `bdist_wheel`, that
+        # won't run `build_ext` again.
+        command = ['bdist_wheel']
+        jobs = self.conf.get('build_jobs') or 1
+        if jobs > 1 and PARALLEL_BUILD_EXT:
+            command = ['build_ext', '--parallel', str(jobs)] + command
+
+        options = {'usage': usage, 'log': self.build_log(name)}
+        if self.conf.get('build_timeout'):
+            options['timeout'] = self.conf['build_timeout']
+        if self.conf.get('build_memory_limit'):
+            options['memory_limit'] = self.conf['build_memory_limit'] * 2**20
+        if self.compiler_cache:
+            options['env'] = compiler_cache_environ(self.compiler_cache)
+        if self.build_servers and not buildserver.needs_isolation(setup_py, name):
+            options['servers'] = self.build_servers
+        return run_setup_script(setup_py, *command, **options)
+
+    def build_priority(self, item):
+        requirement = item[1].get('requirement')
+        if not requirement:
+            return 0
+        return -self.scheduler.estimate(build_name(requirement))['duration']
+
     def handle(self, requester, data):
         requirement = data['requirement']
         tarball = data.get('tarball')
         directory = data.get('directory')
 
-        # Place used to unpack the wheel
-        destination = tempfile.mkdtemp()
+        # Source distributions are identified by their contents, no matter
+        # the URL or the name they came with. See `Index.get_build()`.
+        source = data.get('pinned_url')
+        if tarball:
+            source = 'sha256:{0}'.format(self.index.digest(tarball))
+            wheel = self.index.get_build(source)
+            if wheel:
+                return {'wheel': wheel, 'requirement': requirement}
+
+        # Place used to unpack the wheel. Pointing `build_dir` to a tmpfs
+        # saves some disk I/O for big packages.
+        destination = tempfile.mkdtemp(dir=self.conf.get('build_dir'))
 
         # Unpackaging the file we just received. The unpack function will give
         # us the path for the setup.py script and building the wheel file with
@@ -119,9 +445,28 @@ class Curdler(Service):
             setup_py = (os.path.join(directory, 'setup.py') \
                 if directory
                 else get_setup_from_package(tarball, destination))
-            wheel_file = run_setup_script(setup_py, 'bdist_wheel')
+            # Static pure Python packages are assembled right here, see
+            # `curdling.purewheel`.
+            wheel_file = None
+            if tarball and self.conf.get('fast_builds'):
+                wheel_file = purewheel.build_wheel(
+                    setup_py, os.path.join(os.path.dirname(setup_py), 'dist'))
+
+            name, usage = build_name(requirement), None
+            if wheel_file is None:
+                with self.scheduler.slot(name) as usage:
+                    wheel_file = self.build(setup_py, usage, name)
+            if usage:
+                self.logger.info(
+                    '%s built in %.1fs using %dMB', requirement,
+                    usage['duration'], usage['peak_rss'] / 2**20)
+            wheel = self.index.from_file(wheel_file)
+
+            # Next time this source is requested, it won't be built again
+            if source:
+                self.index.add_build(source, wheel)
             return {
-                'wheel': self.index.from_file(wheel_file),
+                'wheel': wheel,
                 'requirement': requirement
             }
         except BaseException as exc:
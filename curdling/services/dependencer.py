@@ -2,30 +2,88 @@ from __future__ import absolute_import, unicode_literals, print_function
 from ..signal import Signal
 from .. import util
 from .base import Service
+from distlib.markers import interpret
 from distlib.wheel import Wheel
 
 
+def split_marker(requirement):
+    # `name (>= 1.0); python_version < "3"`, URLs never have markers
+    if util.is_url(requirement) or ';' not in requirement:
+        return requirement, None
+    spec, marker = requirement.split(';', 1)
+    return spec.strip(), marker.strip()
+
+
+def marker_matches(marker, extras=()):
+    """Tell if a dependency is needed by the running interpreter
+
+    Markers are evaluated once for each extra requested, so dependencies
+    of the other extras (`extra == "name"`) are left out.
+    """
+    try:
+        return any(interpret(marker, {'extra': extra})
+                   for extra in (sorted(extras) or ['']))
+    except Exception:
+        # Markers we can't understand don't prevent dependencies from
+        # being installed, just like before we evaluated them
+        return True
+
+
 class Dependencer(Service):
 
     def __init__(self, *args, **kwargs):
         super(Dependencer, self).__init__(*args, **kwargs)
         self.dependency_found = Signal()
 
-    def handle(self, requester, data):
-        requirement = data['requirement']
-        dependencies = Wheel(data['wheel']).metadata.dependencies
+    def dependencies(self, wheel):
+        # Opening the wheel and parsing its metadata is only needed the
+        # first time we see it. See `Index.get_dependencies()`.
+        dependencies = self.index and self.index.get_dependencies(wheel)
+        if dependencies is None:
+            metadata = Wheel(wheel).metadata.dependencies
+            dependencies = {
+                'install': list(metadata.get('install', [])),
+                'extras': dict((section, list(items))
+                    for section, items in metadata.get('extras', {}).items()),
+            }
+            if self.index:
+                self.index.add_dependencies(wheel, dependencies)
+        return dependencies
+
+    def requirements(self, requirement, wheel):
+        """Dependencies of `wheel` needed by `requirement` in this environment"""
+        return self.select(requirement, self.dependencies(wheel))
+
+    def select(self, requirement, dependencies):
+        # `dependencies` are laid out like the ones `dependencies()`
+        # returns. Extras might also come as markers, like in the
+        # `Requires-Dist` fields of the metadata of a release.
         extra_sections = set(util.parse_requirement(requirement).extras or ())
 
         # Honor the `extras` section of the requirement we just received
-        found = dependencies.get('install', [])
+        found = list(dependencies.get('install', []))
         for section, items in dependencies.get('extras', {}).items():
             if section in extra_sections:
                 found.extend(items)
 
-        # Telling the world about the dependencies we found
+        # Leaving out the ones that are not needed in this environment
+        requirements = []
         for dependency in found:
+            spec, marker = split_marker(dependency)
+            if marker and not marker_matches(marker, extra_sections):
+                self.logger.debug(
+                    '%s: skipping dependency %s', requirement, dependency)
+                continue
+            requirements.append(util.safe_name(spec))
+        return requirements
+
+    def handle(self, requester, data):
+        requirement = data['requirement']
+
+        # Telling the world about the dependencies we found
+        for dependency in self.requirements(requirement, data['wheel']):
             self.emit('dependency_found', self.name,
-                      requirement=util.safe_name(dependency),
+                      requirement=dependency,
                       dependency_of=requirement)
 
         # Keep the message flowing
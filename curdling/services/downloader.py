@@ -1,14 +1,26 @@
 from __future__ import absolute_import, print_function, unicode_literals
-from ..exceptions import RequirementNotFound, UnknownURL, TooManyRedirects, ReportableError
+from ..exceptions import (
+    RequirementNotFound, UnknownURL, TooManyRedirects, ReportableError,
+    HostUnavailable,
+)
 from .. import util
+from ..wheel import Wheel
 from .base import Service
 from distlib import database, metadata, compat, locators
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
+import io
 import os
 import re
 import json
+import time
+import random
+import shutil
+import hashlib
 import urllib3
 import tempfile
+import threading
 import distlib.version
 
 
@@ -20,11 +32,85 @@ POOL_MAX_SIZE = 10
 # Number of max redirect follows. See `http_retrieve()` for details.
 REDIRECT_LIMIT = 20
 
+# Number of times a request is sent again after a connection error or a
+# server error (5xx). See `http_request()` for details.
+RETRY_LIMIT = 3
+
+# Seconds to wait before the first retry. The delay doubles on each attempt
+# and a random slice of it is actually used, so threads that failed at the
+# same time don't hit the server at the same time again.
+RETRY_BACKOFF = 0.5
+
+# Responses that are worth another try
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# A host that fails this many times in a row is left alone for the number
+# of seconds below. See `CircuitBreaker`.
+BREAKER_THRESHOLD = 5
+BREAKER_TIMEOUT = 30
+
+# Size of the blocks read from the network while downloading packages
+STREAM_CHUNK_SIZE = 2 ** 16
+
+# Digests we know how to check when they're informed in the fragment of a
+# download URL, like in `pkg-0.1.tar.gz#sha256=...`
+DIGEST_FRAGMENT = re.compile(r'^(md5|sha1|sha224|sha256|sha384|sha512)=([0-9a-fA-F]+)$')
+
+# Errors that mean the server couldn't be reached at all
+NETWORK_ERRORS = (urllib3.exceptions.HTTPError, HostUnavailable)
+
+# Number of threads of the pool shared by all the locators to retrieve
+# index pages concurrently. See `get_fetch_pool()`.
+FETCH_POOL_SIZE = 10
+
+# Max number of simultaneous requests the locators will send to a single
+# host, no matter how many threads are available in the pool above.
+HOST_CONCURRENCY = 4
+
+# Number of seconds we trust that a project doesn't exist in an index after
+# looking for it and not finding it. See `NegativeCache`.
+NOT_FOUND_TTL = 60 * 60
+
+# Lazily created by `get_fetch_pool()`
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+# One `HostLimiter` per limit. See `get_host_limiter()`.
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
 
 def get_locator(conf):
     curds = [CurdlingLocator(u) for u in conf.get('curdling_urls', [])]
+    jsons = [JsonLocator(u) for u in conf.get('json_urls', [])]
     pypi = [PyPiLocator(u) for u in conf.get('pypi_urls', [])]
-    return AggregatingLocator(*(curds + pypi), scheme='legacy')
+
+    # All the locators share the same record of projects not found
+    misses = get_negative_cache(conf)
+    limiter = get_host_limiter(conf.get('max_per_host', HOST_CONCURRENCY))
+    for locator in curds + jsons + pypi:
+        locator.misses = misses
+        locator.retries = conf.get('retries', RETRY_LIMIT)
+        locator.limiter = limiter
+    return AggregatingLocator(*(curds + jsons + pypi), scheme='legacy')
+
+
+def get_negative_cache(conf):
+    index = conf.get('index')
+    ttl = conf.get('not_found_ttl', NOT_FOUND_TTL)
+    if index is None or not ttl:
+        return None
+    return NegativeCache(index.cache_path('not-found.json'), ttl)
+
+
+def name_options(name):
+    # It sounds lame, but we're trying to match requirements with more than
+    # one word separated with either `_` or `-`. Notice that we prefer
+    # hyphens cause there is currently way more packages using hyphens than
+    # underscores in pypi.p.o. Let's wait for the best here.
+    if '-' in name or '_' in name:
+        return (name.replace('_', '-'), name.replace('-', '_'))
+    return (name,)
 
 
 def find_packages(locator, requirement, versions):
@@ -44,6 +130,30 @@ def find_packages(locator, requirement, versions):
     return result
 
 
+def pick_artifact(files, file_name=lambda f: f):
+    """Choose the best file to download among the ones of a release
+
+    Wheels compatible with the running interpreter are preferred, the most
+    specific ones first. Source distributions are only chosen when there
+    are no compatible wheels. Everything else is ignored.
+    """
+    wheels, sources = [], []
+    for item in files:
+        name = file_name(item)
+        if name.endswith('.whl'):
+            try:
+                rank = Wheel.from_name(name).compatibility()
+            except IndexError:  # Not a valid wheel name
+                continue
+            if rank is not None:
+                wheels.append((rank, item))
+        elif name.endswith(locators.Locator.source_extensions):
+            sources.append(item)
+    if wheels:
+        return max(wheels, key=lambda w: w[0])[1]
+    return sources[0] if sources else None
+
+
 def update_url_credentials(base_url, other_url):
     base = compat.urlparse(base_url)
     other = compat.urlparse(other_url)
@@ -66,30 +176,163 @@ def parse_url_and_revision(url):
     return parsed_url.geturl(), revision
 
 
-def http_retrieve(pool, url, attempt=0):
+def url_host(url):
+    parsed = compat.urlparse(url)
+    return '{0}:{1}'.format(parsed.hostname, parsed.port)
+
+
+def make_mirror(path, *command):
+    """Run the VCS `command` that creates the mirror at `path`
+
+    The command runs against a temporary path that is only renamed to
+    `path` when it succeeds, so a broken clone never looks like a mirror.
+    """
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    if os.path.isdir(temporary):
+        shutil.rmtree(temporary)
+    elif not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    util.execute_command(*(command + (temporary,)))
+    os.rename(temporary, path)
+
+
+def git_has_commit(repository, revision):
+    # Only full hashes are immutable, branches and tags might have moved
+    if not re.match(r'^[0-9a-f]{40}$', revision or ''):
+        return False
+    try:
+        util.execute_command(
+            'git', 'cat-file', '-e', '{0}^{{commit}}'.format(revision),
+            cwd=repository)
+        return True
+    except Exception:
+        return False
+
+
+def resolve_commit(kind, url, revision=None, offline=False):
+    """Find out which commit `revision` points to in the repository at `url`
+
+    Revisions that are immutable already are returned right away, the
+    others are asked to the server, unless we're `offline`. `None` means
+    that we couldn't tell.
+    """
+    try:
+        if kind == 'git':
+            if re.match(r'^[0-9a-f]{40}$', revision or ''):
+                return revision
+            if offline:
+                return None
+            revision = revision or 'HEAD'
+            output = util.command_output(
+                'git', 'ls-remote', url, revision, revision + '^{}').decode('utf-8')
+            refs = [line.split() for line in output.splitlines() if line.strip()]
+
+            # Annotated tags show up twice, the commit is in the `^{}` entry
+            peeled = [sha for sha, ref in refs if ref.endswith('^{}')]
+            return (peeled or [sha for sha, _ in refs] or [None])[0]
+        elif kind == 'hg':
+            if offline:
+                return None
+            output = util.command_output(
+                'hg', 'identify', '--debug', '-i', '-r', revision or 'default',
+                url).decode('utf-8').strip()
+            return output if re.match(r'^[0-9a-f]{40}$', output) else None
+        elif kind == 'svn':
+            if (revision or '').isdigit():
+                return revision
+            if offline:
+                return None
+            output = util.command_output(
+                'svn', 'info', '--show-item', 'last-changed-revision',
+                url).decode('utf-8').strip()
+            return output if output.isdigit() else None
+    except Exception:
+        return None
+
+
+def parse_url_and_digest(url):
+    parsed_url = compat.urlparse(url)
+    found = DIGEST_FRAGMENT.match(parsed_url.fragment)
+    if not found:
+        return url, None
+    return parsed_url._replace(fragment='').geturl(), found.groups()
+
+
+def add_url_digest(url, digest):
+    # The opposite of `parse_url_and_digest()`. URLs with other fragments
+    # are left alone.
+    url, _ = parse_url_and_digest(url)
+    if not digest or '#' in url:
+        return url
+    return '{0}#{1}={2}'.format(url, *digest)
+
+
+def http_retrieve(pool, url, attempt=0, retries=RETRY_LIMIT):
     if attempt >= REDIRECT_LIMIT:
         raise TooManyRedirects('Too many redirects')
 
     # Params to be passed to request. The `preload_content` must be set to
-    # False, otherwise `read()` wont honor `decode_content`.
+    # False, otherwise `read()` wont honor `decode_content`. urllib3 would
+    # also retry each request a few times by itself, on top of the retries
+    # done by `http_request()`.
     params = {
         'headers': util.get_auth_info_from_url(url),
         'preload_content': False,
         'redirect': False,
+        'retries': False,
     }
 
     # Request the url and ensure we've reached the final location
-    response = pool.request('GET', url, **params)
+    response = http_request(pool, url, params, retries)
     if 'location' in response.headers:
         location = response.headers['location']
         if location.startswith('/'):
             url = compat.urljoin(url, location)
         else:
             url = location
-        return http_retrieve(pool, url, attempt=attempt + 1)
+        return http_retrieve(pool, url, attempt=attempt + 1, retries=retries)
     return response, url
 
 
+def http_request(pool, url, params, retries=RETRY_LIMIT):
+    """Send a GET request to `url`, trying again `retries` times on failures
+
+    Connection errors are raised and server errors are returned as usual
+    when the last attempt fails too. Hosts that keep failing are skipped
+    for a while, see `CircuitBreaker`.
+    """
+    for attempt in range(retries + 1):
+        BREAKER.check(url)
+        try:
+            response = pool.request('GET', url, **params)
+        except urllib3.exceptions.HTTPError:
+            BREAKER.failure(url)
+            if attempt >= retries:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES:
+                BREAKER.success(url)
+                return response
+            BREAKER.failure(url)
+            if attempt >= retries:
+                return response
+            response.release_conn()
+        time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+def get_fetch_pool():
+    """Return the thread pool shared by all the locators
+
+    The pool is only created when the first locator actually needs to
+    fetch more than one page at once.
+    """
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPool(FETCH_POOL_SIZE)
+        return _fetch_pool
+
+
 def get_opener():
     http_proxy = os.getenv('http_proxy')
     if http_proxy:
@@ -102,7 +345,230 @@ def get_opener():
     return urllib3.PoolManager()
 
 
+def get_host_limiter(limit=HOST_CONCURRENCY):
+    """The `HostLimiter` shared by everybody using the same `limit`
+
+    Otherwise each new locator or downloader would be able to open `limit`
+    more connections to the same host.
+    """
+    with _host_limiters_lock:
+        if limit not in _host_limiters:
+            _host_limiters[limit] = HostLimiter(limit)
+        return _host_limiters[limit]
+
+
+class HostLimiter(object):
+    """Cap the number of simultaneous requests sent to each host
+
+    The time spent waiting for a free slot is recorded for each host, see
+    `HostLimiter.stats()`.
+    """
+
+    def __init__(self, limit=HOST_CONCURRENCY):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.waits = {}
+
+    def semaphore(self, url):
+        host = url_host(url)
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+    @contextmanager
+    def hold(self, url):
+        semaphore = self.semaphore(url)
+        started = time.time()
+        semaphore.acquire()
+        self.record(url_host(url), time.time() - started)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def record(self, host, waited):
+        with self.lock:
+            count, total, longest = self.waits.get(host, (0, 0.0, 0.0))
+            self.waits[host] = (count + 1, total + waited, max(longest, waited))
+
+    def stats(self):
+        """Number of requests, total and longest wait (in seconds) per host"""
+        with self.lock:
+            return dict(self.waits)
+
+
+HOST_LIMITER = get_host_limiter()
+
+
+class BandwidthLimiter(object):
+    """Keep the data read by all the threads under `rate` bytes per second
+
+    Readers that go over the limit sleep until the bytes they've read would
+    have been allowed, so the rate holds no matter how many threads share
+    the limiter.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.lock = threading.Lock()
+        self.allowance = self.rate
+        self.last = time.time()
+
+    def consume(self, size):
+        with self.lock:
+            now = time.time()
+            self.allowance = min(
+                self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= size
+            delay = max(-self.allowance / self.rate, 0)
+        if delay:
+            time.sleep(delay)
+
+    def throttle(self, chunks):
+        for chunk in chunks:
+            self.consume(len(chunk))
+            yield chunk
+
+
+class CircuitBreaker(object):
+    """Stop sending requests to hosts that keep failing
+
+    After `threshold` failures in a row, all the requests to a host fail
+    right away with `HostUnavailable` for `timeout` seconds. The first
+    request after that goes through and closes the circuit again if it
+    succeeds.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, timeout=BREAKER_TIMEOUT):
+        self.threshold = threshold
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.opened = {}
+
+    def check(self, url):
+        host = url_host(url)
+        with self.lock:
+            opened = self.opened.get(host)
+        if opened is not None and time.time() - opened < self.timeout:
+            raise HostUnavailable(
+                'Host `{0}\' failed too many times, giving up on `{1}\''.format(
+                    compat.urlparse(url).hostname, url))
+
+    def success(self, url):
+        host = url_host(url)
+        with self.lock:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+
+    def failure(self, url):
+        host = url_host(url)
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.threshold:
+                self.opened[host] = time.time()
+
+
+# Shared by all the services, they all talk to the same hosts
+BREAKER = CircuitBreaker()
+
+
+class NegativeCache(object):
+    """Remember which projects an index doesn't have for `ttl` seconds
+
+    Entries are written to `path` as soon as they're added, so the next
+    runs can skip lookups that failed recently without touching the
+    network.
+    """
+
+    def __init__(self, path, ttl=NOT_FOUND_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self._entries = None
+
+    def key(self, index, project):
+        # Credentials present in the index URL are not part of the key, we
+        # don't want them saved to the disk.
+        parsed = compat.urlparse(index)
+        netloc = parsed.netloc.rsplit('@', 1)[-1]
+        return '{0} {1}'.format(
+            parsed._replace(netloc=netloc).geturl().rstrip('/'),
+            util.safe_name(project))
+
+    def load(self):
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as fobj:
+                return json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    @property
+    def entries(self):
+        with self.lock:
+            if self._entries is None:
+                self._entries = self.load()
+            return self._entries
+
+    def has(self, index, project):
+        when = self.entries.get(self.key(index, project))
+        return when is not None and time.time() - when < self.ttl
+
+    def add(self, index, project):
+        self.update(self.key(index, project), time.time())
+
+    def discard(self, index, project):
+        self.update(self.key(index, project), None)
+
+    def update(self, key, value):
+        with self.lock:
+            # Other instances might have written to the same file since we
+            # read it, let's not lose their entries.
+            now = time.time()
+            entries = dict((k, v) for k, v in self.load().items()
+                if now - v < self.ttl)
+            entries.pop(key, None)
+            if value is not None:
+                entries[key] = value
+            self._entries = entries
+
+            # Write to a temporary file first so a crash never leaves a
+            # half written cache behind
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            temporary = '{0}.{1}'.format(self.path, os.getpid())
+            with io.open(temporary, 'w', encoding='utf-8') as fobj:
+                fobj.write(compat.text_type(json.dumps(entries)))
+            os.rename(temporary, self.path)
+
+
 class ComparableLocator(object):
+
+    # Projects that are known to be missing. See `get_locator()`.
+    misses = None
+
+    # Number of retries of each request. See `http_request()`.
+    retries = RETRY_LIMIT
+
+    # Caps the requests sent to each host. See `get_locator()`.
+    limiter = HOST_LIMITER
+
+    def is_missing(self, name):
+        return self.misses is not None and self.misses.has(self.base_url, name)
+
+    def get_dependencies(self, distribution):
+        # Requirements of a release informed by the index, when it has
+        # them. None means they're only known after retrieving the release.
+        return None
+
+    def not_found(self, name):
+        if self.misses is not None:
+            self.misses.add(self.base_url, name)
+
     def __eq__(self, other):
         return self.base_url == other.base_url
 
@@ -114,11 +580,22 @@ class AggregatingLocator(locators.AggregatingLocator):
 
     def locate(self, requirement, prereleases=True):
         pkg = util.parse_requirement(requirement)
+        error = None
         for locator in self.locators:
-            versions = locator.get_project(pkg.name)
+            # An index that can't be reached doesn't mean the package
+            # doesn't exist. The next indexes are tried and the error is
+            # only raised if none of them have the package.
+            try:
+                versions = locator.get_project(pkg.name)
+            except NETWORK_ERRORS as exc:
+                locators.logger.debug('locate(%s): %s failed: %s', requirement, locator, exc)
+                error = exc
+                continue
             packages = find_packages(locator, pkg, versions)
             if packages:
                 return packages
+        if error is not None:
+            raise error
 
 
 class PyPiLocator(locators.SimpleScrapingLocator, ComparableLocator):
@@ -126,22 +603,76 @@ class PyPiLocator(locators.SimpleScrapingLocator, ComparableLocator):
         super(PyPiLocator, self).__init__(url, **kwargs)
         self.opener = get_opener()
 
+        # Pages being retrieved in the shared pool. See `_prefetch()`.
+        self._prefetched = {}
+        self._prefetch_lock = threading.Lock()
+
+        # Pages that the server answered with 404
+        self._missing_pages = set()
+
     def _get_project(self, name):
-        # It sounds lame, but we're trying to match requirements with more than
-        # one word separated with either `_` or `-`. Notice that we prefer
-        # hyphens cause there is currently way more packages using hyphens than
-        # underscores in pypi.p.o. Let's wait for the best here.
-        options = [name]
-        if '-' in name or '_' in name:
-            options = (name.replace('_', '-'), name.replace('-', '_'))
+        if self.is_missing(name):
+            return None
+
+        options = name_options(name)
+        urls = [compat.urljoin(self.base_url, '{0}/'.format(
+            compat.quote(package_name))) for package_name in options]
+
+        # All the possible names are requested at once, but we still honor
+        # the order of preference above when reading the results.
+        if len(urls) > 1:
+            self._prefetch(urls)
 
         # Iterate over all the possible names a package can have.
-        for package_name in options:
-            url = compat.urljoin(self.base_url, '{0}/'.format(
-                compat.quote(package_name)))
-            found = self._fetch(url, package_name)
-            if found:
-                return found
+        error = None
+        try:
+            for package_name, url in zip(options, urls):
+                try:
+                    found = self._fetch(url, package_name)
+                except NETWORK_ERRORS as exc:
+                    error = exc
+                    continue
+                if found:
+                    return found
+
+            # Network errors are raised instead of reporting the project
+            # as missing, so the other indexes are tried. Only projects the
+            # server said it doesn't know are remembered.
+            if error is not None:
+                raise error
+            if all(url in self._missing_pages for url in urls):
+                self.not_found(name)
+        finally:
+            self._discard(urls)
+
+    def _prefetch(self, urls):
+        """Start retrieving all the `urls` in the shared pool
+
+        The pages are picked up by `_get_page()` afterwards, so the caller
+        can keep walking through the links serially while the round trips
+        to the server happen in parallel.
+        """
+        urls = list(urls)
+        if not urls:
+            return
+        pool = get_fetch_pool()
+        with self._prefetch_lock:
+            for url in urls:
+                if url not in self._prefetched:
+                    self._prefetched[url] = pool.apply_async(
+                        self.get_page, (url,))
+
+    def _discard(self, urls):
+        # Nobody is interested in these pages anymore
+        with self._prefetch_lock:
+            for url in urls:
+                self._prefetched.pop(url, None)
+                self._missing_pages.discard(url)
+
+    def _get_page(self, url):
+        with self._prefetch_lock:
+            pending = self._prefetched.pop(url, None)
+        return pending.get() if pending else self.get_page(url)
 
     def _visit_link(self, project_name, link):
         self._seen.add(link)
@@ -159,10 +690,23 @@ class PyPiLocator(locators.SimpleScrapingLocator, ComparableLocator):
     def _fetch(self, url, project_name, subvisit=False):
         locators.logger.debug('fetch(%s, %s)', url, project_name)
         versions = {}
-        page = self.get_page(url)
-        for link, rel in (page and page.links or []):
+        try:
+            page = self._get_page(url)
+        except NETWORK_ERRORS:
+            # Pages one level down are just extra places to look at
+            if not subvisit:
+                raise
+            page = None
+        links = [(link, not subvisit and self._should_queue(link, url, rel))
+                 for link, rel in (page and page.links or [])]
+
+        # All the pages one level down are requested at once, they'll be
+        # ready (or almost there) when we reach them in the loop below
+        self._prefetch(link for link, queued in links if queued)
+
+        for link, queued in links:
             # Let's instrospect one level down
-            if self._should_queue(link, url, rel) and not subvisit:
+            if queued:
                 versions.update(self._fetch(link, project_name, subvisit=True))
 
             # Let's not see anything twice, I saw this check on distlib it
@@ -183,28 +727,32 @@ class PyPiLocator(locators.SimpleScrapingLocator, ComparableLocator):
             url = compat.urljoin(ensure_slash(url), 'index.html')
 
         # The `retrieve()` method follows any eventual redirects, so the
-        # initial url might be different from the final one
-        try:
-            response, final_url = http_retrieve(self.opener, url)
-        except urllib3.exceptions.MaxRetryError:
-            return
-
-        content_type = response.headers.get('content-type', '')
-        if locators.HTML_CONTENT_TYPE.match(content_type):
+        # initial url might be different from the final one. The body is
+        # read while holding the host slot, since that's when the
+        # connection is actually being used.
+        with self.limiter.hold(url):
+            response, final_url = http_retrieve(
+                self.opener, url, retries=self.retries)
+            if response.status == 404:
+                self._missing_pages.add(url)
+            content_type = response.headers.get('content-type', '')
+            if not locators.HTML_CONTENT_TYPE.match(content_type):
+                return
             data = response.data
-            encoding = response.headers.get('content-encoding')
-            if encoding:
-                decoder = self.decoders[encoding]   # fail if not found
-                data = decoder(data)
-            encoding = 'utf-8'
-            m = locators.CHARSET.search(content_type)
-            if m:
-                encoding = m.group(1)
-            try:
-                data = data.decode(encoding)
-            except UnicodeError:
-                data = data.decode('latin-1')    # fallback
-            return locators.Page(data, final_url)
+
+        encoding = response.headers.get('content-encoding')
+        if encoding:
+            decoder = self.decoders[encoding]   # fail if not found
+            data = decoder(data)
+        encoding = 'utf-8'
+        m = locators.CHARSET.search(content_type)
+        if m:
+            encoding = m.group(1)
+        try:
+            data = data.decode(encoding)
+        except UnicodeError:
+            data = data.decode('latin-1')    # fallback
+        return locators.Page(data, final_url)
 
 
 class CurdlingLocator(locators.Locator, ComparableLocator):
@@ -217,27 +765,43 @@ class CurdlingLocator(locators.Locator, ComparableLocator):
         self.requirements_not_found = []
 
     def get_distribution_names(self):
-        return json.loads(
-            http_retrieve(self.opener,
-                compat.urljoin(self.url, 'api'))[0].data)
+        url = compat.urljoin(self.url, 'api')
+        with self.limiter.hold(url):
+            return json.loads(
+                http_retrieve(self.opener, url, retries=self.retries)[0].data)
 
     def _get_project(self, name):
+        # We already know the server doesn't have it, but it still needs
+        # to be reported, so the package can be uploaded to the server.
+        if self.is_missing(name):
+            self.requirements_not_found.append(name)
+            return None
+
         # Retrieve the info
         url = compat.urljoin(self.url, 'api/' + name)
-        try:
-            response, _ = http_retrieve(self.opener, url)
-        except urllib3.exceptions.MaxRetryError:
-            return None
+        with self.limiter.hold(url):
+            try:
+                response, _ = http_retrieve(self.opener, url, retries=self.retries)
+                data = response.data
+            except NETWORK_ERRORS:
+                return None
 
         if response.status == 200:
-            data = json.loads(response.data)
-            return dict((v['version'], self._get_distribution(v)) for v in data)
+            data = json.loads(data)
+            distributions = ((v['version'], self._get_distribution(v)) for v in data)
+            return dict((v, d) for v, d in distributions if d is not None)
         else:
             self.requirements_not_found.append(name)
+            self.not_found(name)
 
     def _get_distribution(self, version):
-        # Source url for the package
-        source_url = version['urls'][0]  # TODO: prefer whl files
+        # Source url for the package. Wheels that work in this interpreter
+        # are preferred, so we don't have to build anything. Versions that
+        # only have wheels for other platforms are skipped.
+        source_url = pick_artifact(
+            version['urls'], lambda u: os.path.basename(u['url']))
+        if source_url is None:
+            return None
 
         # Build the metadata
         mdata = metadata.Metadata(scheme=self.scheme)
@@ -248,6 +812,103 @@ class CurdlingLocator(locators.Locator, ComparableLocator):
         # Building the dist and associating the download url
         distribution = database.Distribution(mdata)
         distribution.locator = self
+        if source_url.get('sha256'):
+            distribution.digest = ('sha256', source_url['sha256'])
+        return distribution
+
+
+class JsonLocator(locators.Locator, ComparableLocator):
+    """Locate packages using the JSON API of PyPI (`<url>/<name>/json`)
+
+    All the releases of a project, their files and digests come in a single
+    document, so there's no HTML to scrape and no pages to follow.
+    """
+
+    def __init__(self, url, **kwargs):
+        super(JsonLocator, self).__init__(**kwargs)
+        self.base_url = url
+        self.opener = get_opener()
+
+    def _get_project(self, name):
+        if self.is_missing(name):
+            return None
+
+        # Same spellings tried by `PyPiLocator`, in the same order. Network
+        # errors are raised so the other indexes are tried, and only the
+        # projects the server said it doesn't know are remembered.
+        error, missing = None, 0
+        options = name_options(name)
+        for package_name in options:
+            url = '{0}/{1}/json'.format(
+                self.base_url.rstrip('/'), compat.quote(package_name))
+            with self.limiter.hold(url):
+                try:
+                    response, url = http_retrieve(self.opener, url, retries=self.retries)
+                    data = response.data
+                except NETWORK_ERRORS as exc:
+                    error = exc
+                    continue
+            if response.status == 200:
+                return self._get_versions(package_name, data, url)
+            missing += response.status == 404
+        if error is not None:
+            raise error
+        if missing == len(options):
+            self.not_found(name)
+        return None
+
+    def _get_versions(self, name, data, url):
+        try:
+            data = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return {}
+        name = data.get('info', {}).get('name', name)
+        versions = {}
+        for version, files in data.get('releases', {}).items():
+            artifact = pick_artifact(
+                [f for f in files if not f.get('yanked')],
+                lambda f: f['filename'])
+            if artifact:
+                versions[version] = self._get_distribution(
+                    name, version, artifact, url)
+        return versions
+
+    def get_dependencies(self, distribution):
+        # Each release has its own document with the requirements of the
+        # project in `info.requires_dist`. It's null for projects that
+        # don't have any as well as for the ones that didn't inform them.
+        url = '{0}/{1}/{2}/json'.format(self.base_url.rstrip('/'),
+            compat.quote(distribution.name), compat.quote(distribution.version))
+        with self.limiter.hold(url):
+            try:
+                response, url = http_retrieve(self.opener, url, retries=self.retries)
+                data = response.data
+            except NETWORK_ERRORS:
+                return None
+        if response.status != 200:
+            return None
+        try:
+            requires = json.loads(data.decode('utf-8')).get('info', {}).get('requires_dist')
+        except (ValueError, AttributeError):
+            return None
+        return list(requires) if requires is not None else None
+
+    def _get_distribution(self, name, version, artifact, url):
+        mdata = metadata.Metadata(scheme=self.scheme)
+        mdata.name = name
+        mdata.version = version
+        mdata.download_url = compat.urljoin(url, artifact['url'])
+
+        # Building the dist and associating the download url
+        distribution = database.Distribution(mdata)
+        distribution.locator = self
+
+        # Keep the strongest digest the server informed
+        digests = artifact.get('digests', {})
+        for algo in ('sha256', 'md5'):
+            if digests.get(algo):
+                distribution.digest = (algo, digests[algo])
+                break
         return distribution
 
 
@@ -255,11 +916,18 @@ class Finder(Service):
 
     def __init__(self, *args, **kwargs):
         super(Finder, self).__init__(*args, **kwargs)
-        self.opener = get_opener()
-        self.locator = get_locator(self.conf)
+
+        # Nothing is looked up remotely in offline mode
+        self.offline = self.conf.get('offline', False)
+        self.opener = None if self.offline else get_opener()
+        self.locator = None if self.offline else get_locator(self.conf)
 
     def handle(self, requester, data):
         requirement = data['requirement']
+        if self.offline:
+            raise RequirementNotFound(
+                'Requirement `{0}\' not found in the local index (offline mode)'.format(
+                    requirement))
         prereleases = self.conf.get('prereleases', True)
         distribution = self.locator.locate(requirement, prereleases)
         if not distribution:
@@ -267,41 +935,106 @@ class Finder(Service):
                 'Requirement `{0}\' not found'.format(requirement))
         return {
             'requirement': data['requirement'],
-            'url': distribution.metadata.download_url,
+            'url': self.get_download_url(distribution),
             'locator_url': distribution.locator.base_url,
         }
 
+    def get_download_url(self, distribution):
+        # The digest informed by the index travels with the URL, so the
+        # downloader can check the file while it's being retrieved
+        url = distribution.metadata.download_url
+        digest = getattr(distribution, 'digest', None)
+        if not digest and getattr(distribution, 'md5_digest', None):
+            digest = ('md5', distribution.md5_digest)
+        if not digest or '#' in url:
+            return url
+        return '{0}#{1}={2}'.format(url, *digest)
+
     def get_servers_to_update(self):
         failures = {}
-        for locator in self.locator.locators:
+        for locator in self.locator.locators if self.locator else []:
             if isinstance(locator, CurdlingLocator) and locator.requirements_not_found:
                 failures[locator.base_url] = locator.requirements_not_found
         return failures
 
+    def forget_not_found(self, server, package_name):
+        # Called when a package is uploaded to a server that didn't have it
+        for locator in self.locator.locators if self.locator else []:
+            if locator.base_url == server and locator.misses is not None:
+                locator.misses.discard(server, package_name)
+
 
 class Downloader(Service):
 
     def __init__(self, *args, **kwargs):
         super(Downloader, self).__init__(*args, **kwargs)
-        self.opener = get_opener()
-        self.locator = get_locator(self.conf)
+        self.offline = self.conf.get('offline', False)
+        self.opener = None if self.offline else get_opener()
+        self.locator = None if self.offline else get_locator(self.conf)
+
+        # Downloads respect the same limits of the locators, plus an
+        # optional limit for the bandwidth used by all of them together
+        self.limiter = get_host_limiter(
+            self.conf.get('max_per_host', HOST_CONCURRENCY))
+        rate = self.conf.get('limit_rate')
+        self.bandwidth = BandwidthLimiter(rate) if rate else None
 
         # List of packages that we're aware of, so people that want to send
         # jobs to the downloader can avoid duplications.
         self.processing_packages = set()
 
+        # Each local mirror of a VCS repository is used by one thread at a
+        # time. See `vcs_mirror()`.
+        self._mirror_locks = {}
+        self._mirror_locks_lock = threading.Lock()
+
     def queue(self, requester, **data):
         self.processing_packages.add(os.path.basename(data['url']))
         super(Downloader, self).queue(requester, **data)
 
     def handle(self, requester, data):
-        field_name, location = self.download(data['url'], data.get('locator_url'))
-        return {
+        # VCS requirements pinned to a commit we've already built don't
+        # have to be retrieved again
+        pinned_url = self.pin_vcs_url(data['url'])
+        if pinned_url:
+            wheel = self.index.get_build(pinned_url)
+            if wheel:
+                return {'requirement': data['requirement'], 'wheel': wheel}
+        if self.offline:
+            raise RequirementNotFound(
+                'URL `{0}\' has no build in the local index (offline mode)'.format(
+                    data['url']))
+
+        field_name, location = self.download(
+            pinned_url or data['url'], data.get('locator_url'),
+            data['requirement'])
+        result = {
             'requirement': data['requirement'],
             field_name: location,
         }
 
-    def download(self, url, locator_url=None):
+        # The curdler records the build of the pinned URL
+        if pinned_url:
+            result['pinned_url'] = pinned_url
+        return result
+
+    def pin_vcs_url(self, url):
+        """Point a VCS `url` to the commit its revision currently resolves to
+
+        Returns `None` for any other URL or if the commit can't be found.
+        """
+        found = re.match(r'^(git|hg|svn)\+(.+)$', url)
+        if not found or self.index is None:
+            return None
+        kind, address = found.groups()
+        address, revision = parse_url_and_revision(address)
+        commit = resolve_commit(kind, address, revision, self.offline)
+        if not commit:
+            return None
+        return '{0}+{1}@{2}'.format(kind, address, commit)
+
+    def download(self, url, locator_url=None, requirement=None):
+        url, digest = parse_url_and_digest(url)
         final_url = url
 
         # We're dealing with a requirement, not a link
@@ -341,10 +1074,70 @@ class Downloader(Service):
         # signs out of the scheme. Like in this example:
         #   https://launchpad.com/path/+download/dirspec-13.10.tar.gz
         url = re.sub('^([^\+]+)\+([^:]+\:)', r'\2', final_url)
-        return protocol_mapping[handler](url)
-
-    def _download_http(self, url):
-        response, final_url = http_retrieve(self.opener, url)
+        if protocol_mapping[handler] != self._download_http:
+            return protocol_mapping[handler](url)
+
+        # Files hosted by an index might also be available in the other ones
+        # we know about, so let's try them before giving up. They're only
+        # looked up when the first attempt fails.
+        def candidates():
+            yield url
+            for mirror in self.mirrors(url, locator_url, requirement):
+                yield mirror
+
+        error = None
+        for candidate in candidates():
+            try:
+                return self._download_http(candidate, digest)
+            except NETWORK_ERRORS + (ReportableError,) as exc:
+                self.logger.info('%s.download(): failed to retrieve %s: %s',
+                    self.name, candidate, exc)
+                error = error or exc
+        raise error
+
+    def mirrors(self, url, locator_url, requirement=None):
+        """Find the file of `url` in all the other indexes configured
+
+        The other locators look the project of `requirement` up again and
+        the files with the same name are used, wherever each index hosts
+        them. Their credentials are kept, like `download()` does for the
+        index that found the file.
+        """
+        if not locator_url or not requirement or self.locator is None \
+                or util.is_url(requirement):
+            return []
+        file_name = os.path.basename(compat.urlparse(url).path)
+        project_name = util.parse_requirement(requirement).name
+
+        urls = []
+        for locator in self.locator.locators:
+            if locator.base_url == locator_url:
+                continue
+            try:
+                versions = locator.get_project(project_name) or {}
+            except NETWORK_ERRORS:
+                continue
+            for distribution in versions.values():
+                # distlib also keeps a few dictionaries among the versions
+                download_url = getattr(getattr(
+                    distribution, 'metadata', None), 'download_url', None)
+                if not download_url:
+                    continue
+                download_url, _ = parse_url_and_digest(download_url)
+                mirror = update_url_credentials(locator.base_url, download_url)
+                if os.path.basename(compat.urlparse(download_url).path) == file_name \
+                        and mirror != url and mirror not in urls:
+                    urls.append(mirror)
+        return urls
+
+    def _download_http(self, url, digest=None):
+        # The slot is held until the whole file is read
+        with self.limiter.hold(url):
+            return self._retrieve_http(url, digest)
+
+    def _retrieve_http(self, url, digest):
+        response, final_url = http_retrieve(
+            self.opener, url, retries=self.conf.get('retries', RETRY_LIMIT))
         if final_url:
             url = final_url
         if response.status != 200:
@@ -358,38 +1151,96 @@ class Downloader(Service):
         # Define what kind of package we've got
         field_name = 'wheel' if url.endswith('.whl') else 'tarball'
 
-        # Now that we're sure that our request was successful
+        # Now that we're sure that our request was successful. The body is
+        # read raw, the curdler will deal with gzipped packages. It's
+        # checked against the digest while it's written to the index.
         header = response.headers.get('content-disposition', '')
         file_name = re.findall(r'filename=\"?([^;\"]+)', header)
-        return field_name, self.index.from_data(
-            file_name and file_name[0] or url,
-            response.read(cache_content=True, decode_content=False))
+        chunks = response.stream(STREAM_CHUNK_SIZE, decode_content=False)
+        if self.bandwidth:
+            chunks = self.bandwidth.throttle(chunks)
+        return field_name, self.index.from_stream(
+            file_name and file_name[0] or url, chunks, digest)
+
+    @contextmanager
+    def vcs_mirror(self, kind, url):
+        """Hold the local mirror of the repository at `url`
+
+        Mirrors live in the cache of the index and survive between runs,
+        so they only need to be updated instead of cloned again.
+        """
+        path = self.index.cache_path(
+            'vcs', kind, hashlib.sha1(url.encode('utf-8')).hexdigest())
+        with self._mirror_locks_lock:
+            lock = self._mirror_locks.setdefault(path, threading.Lock())
+        with lock:
+            yield path
 
     def _download_git(self, url):
         destination = tempfile.mkdtemp()
         url, revision = parse_url_and_revision(url)
-        util.execute_command('git', 'clone', url, destination)
-        if revision:
-            util.execute_command('git', 'reset', '--hard', revision,
-                cwd=destination)
+        if self.index is None:
+            util.execute_command('git', 'clone', url, destination)
+            if revision:
+                util.execute_command('git', 'reset', '--hard', revision,
+                    cwd=destination)
+            return 'directory', destination
+
+        with self.vcs_mirror('git', url) as mirror:
+            if not os.path.isdir(mirror):
+                make_mirror(mirror, 'git', 'clone', '-q', '--mirror', url)
+            elif not git_has_commit(mirror, revision):
+                util.execute_command('git', 'fetch', '-q', '--prune', 'origin',
+                    cwd=mirror)
+
+            # The working copy borrows the objects from the mirror, so
+            # nothing but the files of the requested revision is written
+            util.execute_command('git', 'clone', '-q', '--shared',
+                '--no-checkout', mirror, destination)
+            util.execute_command('git', 'reset', '-q', '--hard',
+                revision or 'HEAD', cwd=destination)
         return 'directory', destination
 
     def _download_hg(self, url):
         destination = tempfile.mkdtemp()
         url, revision = parse_url_and_revision(url)
-        util.execute_command('hg', 'clone', url, destination)
-        if revision:
-            util.execute_command('hg', 'update', '-q', revision,
-                cwd=destination)
+        if self.index is None:
+            util.execute_command('hg', 'clone', url, destination)
+            if revision:
+                util.execute_command('hg', 'update', '-q', revision,
+                    cwd=destination)
+            return 'directory', destination
+
+        with self.vcs_mirror('hg', url) as mirror:
+            if not os.path.isdir(mirror):
+                make_mirror(mirror, 'hg', 'clone', '-q', '-U', url)
+            else:
+                util.execute_command('hg', 'pull', '-q', cwd=mirror)
+
+            # Local clones hardlink the history of the mirror
+            util.execute_command('hg', 'clone', '-q', '-U', mirror, destination)
+        util.execute_command('hg', 'update', '-q', *([revision] if revision else []),
+            cwd=destination)
         return 'directory', destination
 
     def _download_svn(self, url):
         destination = tempfile.mkdtemp()
         url, revision = parse_url_and_revision(url)
-        params = ['svn', 'co', '-q']
-        if revision:
-            params.append('-r')
-            params.append(revision)
-        params += [url, destination]
-        util.execute_command(*params)
+        revision_params = ['-r', revision] if revision else []
+        if self.index is None:
+            params = ['svn', 'co', '-q'] + revision_params
+            params += [url, destination]
+            util.execute_command(*params)
+            return 'directory', destination
+
+        # Subversion has no local history to mirror, so we keep a checkout
+        # around and update it to the revision requested, which only
+        # transfers what changed.
+        with self.vcs_mirror('svn', url) as mirror:
+            if not os.path.isdir(mirror):
+                make_mirror(mirror, 'svn', 'co', '-q', *(revision_params + [url]))
+            else:
+                util.execute_command('svn', 'update', '-q', *revision_params,
+                    cwd=mirror)
+            util.execute_command('svn', 'export', '-q', '--force', mirror, destination)
         return 'directory', destination
@@ -38,6 +38,9 @@ def get_distribution_paths(name):
 class Installer(Service):
 
     def handle(self, requester, data):
+        # Wheels changed after being stored in the index aren't installed
+        if self.index is not None:
+            self.index.verify(data['wheel'])
         name = parse_requirement(data['requirement']).name
         wheel = Wheel(data['wheel'])
         wheel.install(get_distribution_paths(name))
@@ -12,7 +12,7 @@ class Uploader(Service):
 
     def __init__(self, *args, **kwargs):
         super(Uploader, self).__init__(*args, **kwargs)
-        self.opener = urllib3.PoolManager()
+        self.opener = None if self.conf.get('offline') else urllib3.PoolManager()
 
     def handle(self, requester, data):
         # Preparing the url to PUT the file
@@ -21,6 +21,10 @@ class Uploader(Service):
         file_name = os.path.basename(wheel)
         url = compat.urljoin(server, 'p/{0}'.format(file_name))
 
+        # Wheels changed after being stored in the index aren't uploaded
+        if self.index is not None:
+            self.index.verify(wheel)
+
         # Sending the file to the server. Both `method` and `url` parameters
         # for calling `request_encode_body()` must be `str()` instances, not
         # unicode.
@@ -1,9 +1,12 @@
 from __future__ import absolute_import, print_function, unicode_literals
 from functools import partial
+from ..exceptions import InvalidLockfile
 from ..index import Index
 from ..util import expand_requirements, safe_name, spaces, logger
 from ..version import __version__
+from .. import lockfile
 from ..services import curdler
+from ..services.downloader import NOT_FOUND_TTL, RETRY_LIMIT, HOST_CONCURRENCY
 
 from ..install import Install
 from ..uninstall import Uninstall
@@ -36,6 +39,19 @@ class StreamHandler(logging.StreamHandler):
             super(StreamHandler, self).__init__(stream=stream)
 
 
+def parse_rate(value):
+    """Read transfer rates like `512`, `200k` or `1.5M` as bytes per second"""
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    multiplier = units.get(value[-1:].lower(), 1)
+    try:
+        rate = float(value[:-1] if multiplier > 1 else value) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid rate: {0}'.format(value))
+    if rate <= 0:
+        raise argparse.ArgumentTypeError('invalid rate: {0}'.format(value))
+    return rate
+
+
 def add_parser_install(subparsers):
     parser = subparsers.add_parser(
         'install', help='Locate and install packages')
@@ -48,12 +64,66 @@ def add_parser_install(subparsers):
     parser.add_argument(
         '-c', '--curdling-index', action='append', default=[],
         help='Curdling compatible index URL. Repeat as many times as you need')
+    parser.add_argument(
+        '-j', '--json-index', action='append', default=[],
+        help='PyPi JSON API URL (eg.: https://pypi.python.org/pypi). Repeat as many times as you need')
     parser.add_argument(
         '-u', '--upload', action='store_true', default=False,
         help='Upload packages back to the curdling index')
     parser.add_argument(
         '-f', '--force', action='store_true', default=False,
         help='Skip checking if the requirement requested is already installed')
+    parser.add_argument(
+        '--offline', action='store_true', default=False,
+        help='Only use the packages available in the local index, never touch the network')
+    parser.add_argument(
+        '--not-found-ttl', type=int, default=NOT_FOUND_TTL, metavar='SECONDS',
+        help=('Seconds to remember that a package was not found in an index '
+              '(default: {0}, 0 disables it)'.format(NOT_FOUND_TTL)))
+    parser.add_argument(
+        '--retries', type=int, default=RETRY_LIMIT, metavar='N',
+        help=('Times to retry a request that failed with a network or server '
+              'error (default: {0})'.format(RETRY_LIMIT)))
+    parser.add_argument(
+        '--max-per-host', type=int, default=HOST_CONCURRENCY, metavar='N',
+        help=('Max number of simultaneous requests sent to each server '
+              '(default: {0})'.format(HOST_CONCURRENCY)))
+    parser.add_argument(
+        '--limit-rate', type=parse_rate, metavar='RATE',
+        help='Limit the download speed to RATE bytes per second (eg.: 200k, 1M)')
+    parser.add_argument(
+        '--build-memory', type=int, metavar='MB',
+        help=('Memory the builds running at the same time can use, in '
+              'megabytes (default: the memory available when it starts)'))
+    parser.add_argument(
+        '--build-dir', metavar='DIR',
+        help='Where packages are extracted to be built (eg.: a tmpfs mount)')
+    parser.add_argument(
+        '--build-timeout', type=int, metavar='SECONDS',
+        help='Kill builds that take longer than SECONDS')
+    parser.add_argument(
+        '--build-memory-limit', type=int, metavar='MB',
+        help='Max amount of memory each build can allocate, in megabytes')
+    parser.add_argument(
+        '--no-fast-builds', action='store_false', dest='fast_builds', default=True,
+        help='Always run setup.py, even for static pure Python packages')
+    parser.add_argument(
+        '--warm-builds', action='store_true', default=False,
+        help=('Build packages in processes forked from interpreters that '
+              'already imported setuptools'))
+    parser.add_argument(
+        '--build-jobs', type=int, default=1, metavar='N',
+        help='Number of files of a package compiled at the same time')
+    parser.add_argument(
+        '--compiler-cache', action='store_true', default=False,
+        help='Cache compiled objects with ccache, inside the local index')
+    parser.add_argument(
+        '--save-lockfile', metavar='FILE',
+        help='Save the packages chosen, with their versions and digests, to FILE')
+    parser.add_argument(
+        '--lockfile', metavar='FILE',
+        help=('Install the packages saved in FILE by --save-lockfile, without '
+              'looking up any requirements or dependencies'))
     parser.add_argument(
         'packages', metavar='REQUIREMENT', nargs='*',
         help='list of requirements to install')
@@ -155,6 +225,23 @@ def show_report(failed=None):
                 spaces(5, str(exception))))
 
 
+def show_build_stats(index, failed=None):
+    hits, misses = index.build_stats['hits'], index.build_stats['misses']
+    if hits or misses:
+        sys.stdout.write('Build cache: {0} hit{1}, {2} miss{3}\n'.format(
+            hits, '' if hits == 1 else 's',
+            misses, '' if misses == 1 else 'es'))
+
+
+def show_compiler_cache_stats(path, failed=None):
+    stats = curdler.compiler_cache_stats(path)
+    if stats is None:
+        sys.stdout.write('Compiler cache: {0}\n'.format(path))
+    else:
+        sys.stdout.write('Compiler cache: {0} ({1} hits, {2} misses)\n'.format(
+            path, stats['hits'], stats['misses']))
+
+
 def handle_install_exit(failed=None):
     raise SystemExit(int(failed != None))
 
@@ -168,6 +255,16 @@ def acceptable_file_type(filename):
 
 
 def get_install_command(args):
+    if args.lockfile and (args.packages or args.requirements):
+        raise SystemExit('Requirements can\'t be informed along with --lockfile')
+
+    locked = None
+    if args.lockfile:
+        try:
+            locked = lockfile.load(args.lockfile)
+        except InvalidLockfile as exc:
+            raise SystemExit(str(exc))
+
     index = Index(os.path.expanduser('~/.curds'))
     index.scan()
 
@@ -175,7 +272,23 @@ def get_install_command(args):
         'log_level': args.log_level,
         'pypi_urls': args.index or DEFAULT_PYPI_INDEX_LIST,
         'curdling_urls': args.curdling_index,
+        'json_urls': args.json_index,
         'force': args.force,
+        'offline': args.offline,
+        'not_found_ttl': args.not_found_ttl,
+        'retries': args.retries,
+        'max_per_host': args.max_per_host,
+        'limit_rate': args.limit_rate,
+        'build_memory': args.build_memory,
+        'build_dir': args.build_dir,
+        'build_timeout': args.build_timeout,
+        'build_memory_limit': args.build_memory_limit,
+        'build_jobs': args.build_jobs,
+        'warm_builds': args.warm_builds,
+        'fast_builds': args.fast_builds,
+        'compiler_cache': args.compiler_cache,
+        'lockfile': args.lockfile,
+        'save_lockfile': args.save_lockfile,
         'upload': args.upload,
         'index': index,
     })
@@ -186,11 +299,15 @@ def get_install_command(args):
     initial_requirements = get_packages_from_args(args)
 
     # Callbacks that show feedback for the user
-    if not args.quiet and initial_requirements:
+    if not args.quiet and (initial_requirements or locked):
         cmd.connect('update_retrieve_and_build', build_and_retrieve_progress)
         cmd.connect('update_install', partial(progress, 'Installing'))
         cmd.connect('update_upload', partial(progress, 'Uploading'))
         cmd.connect('finished', show_report)
+        cmd.connect('finished', partial(show_build_stats, index))
+        if cmd.curdler.compiler_cache:
+            cmd.connect('finished', partial(
+                show_compiler_cache_stats, cmd.curdler.compiler_cache))
 
     # This is the last thing called in the software. It will raise a
     # SystemExit to return the right code to the OS depending on the
@@ -207,6 +324,8 @@ def get_install_command(args):
             'main', tarball=pkg, requirement=metadata.name, directory=None)
     for pkg in initial_requirements:
         cmd.queue('main', requirement=pkg)
+    if locked is not None:
+        cmd.load_lockfile(locked)
     return cmd
 
 
@@ -21,8 +21,13 @@ from base64 import b64encode
 import io
 import os
 import re
+import sys
+import time
 import hashlib
 import logging
+import signal
+import tempfile
+import threading
 import subprocess
 import urllib3
 
@@ -33,9 +38,86 @@ LINK_PATTERN = re.compile(r'^([^\:]+):\/\/.+')
 
 ROOT_LOGGER = logging.getLogger('curdling')
 
+# How much of the output of a failed command goes to its error message
+ERROR_OUTPUT_SIZE = 4096
+
+
+# Parsed requirements kept by `parse_requirement()`. The same specs go
+# through it over and over while packages move through the pipeline.
+REQUIREMENT_CACHE_SIZE = 4096
+
 
 class Requirement(object):
-    name = None
+    """Parsed requirement, see `parse_requirement()`
+
+    Instances are shared by everyone who parses the same spec, so they
+    can't be changed after being created.
+    """
+
+    __slots__ = ('name', 'requirement', 'constraints', 'extras', 'marker', 'url', 'is_link')
+
+    def __init__(self, name, requirement, constraints=(), extras=(),
+                 marker=None, url=None, is_link=False):
+        set_field = super(Requirement, self).__setattr__
+        set_field('name', name)
+        set_field('requirement', requirement)
+        set_field('constraints', tuple(constraints or ()))
+        set_field('extras', tuple(extras or ()))
+        set_field('marker', marker)
+        set_field('url', url)
+        set_field('is_link', is_link)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Requirement objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Requirement objects are immutable')
+
+    def __repr__(self):
+        return '<Requirement {0!r}>'.format(self.requirement)
+
+
+class RequirementCache(object):
+    """Memo of the last `size` requirements parsed
+
+    It's shared by the threads of all the services, so it counts how many
+    lookups found what they wanted. See `requirement_cache_stats()`.
+    """
+
+    def __init__(self, size=REQUIREMENT_CACHE_SIZE):
+        self.size = size
+        self.entries = compat.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, spec, parse):
+        with self.lock:
+            if spec in self.entries:
+                # Moving it to the end, so it's the last one to be dropped
+                value = self.entries[spec] = self.entries.pop(spec)
+                self.stats['hits'] += 1
+                return value
+
+        value = parse(spec)
+        with self.lock:
+            self.stats['misses'] += 1
+            self.entries[spec] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stats = {'hits': 0, 'misses': 0}
+
+
+REQUIREMENT_CACHE = RequirementCache()
+
+
+def requirement_cache_stats():
+    with REQUIREMENT_CACHE.lock:
+        return dict(REQUIREMENT_CACHE.stats, size=len(REQUIREMENT_CACHE.entries))
 
 
 def is_url(requirement):
@@ -48,8 +130,10 @@ def safe_name(requirement):
 
 
 def safe_requirement(requirement):
-    safe = requirement.lower().replace('_', '-')
-    parsed = util.parse_requirement(safe)
+    return parse_requirement(requirement).requirement
+
+
+def format_requirement(parsed):
     output = parsed.name
     if parsed.extras:
         output += '[{0}]'.format(','.join(parsed.extras))
@@ -65,7 +149,7 @@ def safe_requirement(requirement):
 def safe_constraints(spec):
     if is_url(spec):
         return None
-    constraints = util.parse_requirement(spec).constraints or ()
+    constraints = parse_requirement(spec).constraints
     constraint = lambda k, v: \
         ('{0} {1}'.format(k, v)
          .replace('== ', '')
@@ -73,20 +157,25 @@ def safe_constraints(spec):
     return ', '.join(constraint(k, v) for k, v in constraints) or None
 
 
+def _parse_requirement(spec):
+    if is_url(spec):
+        return Requirement(spec, spec, url=spec, is_link=True)
+
+    # The constraints keep the versions just like they were written, the
+    # normalized requirement is all lower case
+    safe = util.parse_requirement(spec.lower().replace('_', '-'))
+    parsed = util.parse_requirement(spec)
+    return Requirement(
+        name=safe.name,
+        requirement=format_requirement(safe),
+        constraints=parsed.constraints,
+        extras=parsed.extras,
+        marker=getattr(parsed, 'marker', None),
+        url=parsed.url)
+
+
 def parse_requirement(spec):
-    if not is_url(spec):
-        requirement = util.parse_requirement(spec)
-        requirement.name = safe_name(requirement.name)
-        requirement.requirement = safe_requirement(spec)
-        requirement.is_link = False
-    else:
-        requirement = Requirement()
-        requirement.name = spec
-        requirement.requirement = spec
-        requirement.constraints = ()
-        requirement.is_link = True
-        requirement.extras = ()
-    return requirement
+    return REQUIREMENT_CACHE.get(spec, _parse_requirement)
 
 
 def split_name(fname):
@@ -150,13 +239,126 @@ def get_auth_info_from_url(url, proxy=False):
 
 
 def execute_command(name, *args, **kwargs):
+    # Callers interested in how much the command cost inform the `usage`
+    # dictionary or limits to what it can use. See `measure_command()`.
+    options = dict((key, kwargs.pop(key))
+        for key in ('usage', 'timeout', 'memory_limit', 'log') if key in kwargs)
+    if options and hasattr(os, 'wait4'):
+        measure_command(name, *args, **dict(kwargs, **options))
+    else:
+        command_output(name, *args, **kwargs)
+
+
+# Sets up a command from its own process and then replaces itself with
+# it. Running Python code between fork() and exec(), like `preexec_fn`
+# does, isn't safe with threads around. The arguments are `1' to start a
+# new session, the memory limit in bytes (`0' for none) and the command.
+COMMAND_WRAPPER = """
+import os, sys
+if sys.argv[1] == '1':
+    os.setsid()
+limit = int(sys.argv[2])
+if limit:
+    import resource
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+os.execvp(sys.argv[3], sys.argv[3:])
+"""
+
+# `subprocess' starts new sessions by itself since Python 3.2
+NEW_SESSION = sys.version_info >= (3, 2)
+
+
+def session_command(command, memory_limit=None):
+    # A new session allows killing the command along with the processes
+    # it started and the memory limit is inherited by all of them. Returns
+    # the command to run and the options to `subprocess.Popen()`.
+    options = {}
+    if NEW_SESSION:
+        options['start_new_session'] = True
+    if memory_limit or not NEW_SESSION:
+        command = (sys.executable, '-c', COMMAND_WRAPPER,
+                   '0' if NEW_SESSION else '1',
+                   str(memory_limit or 0)) + tuple(command)
+    return tuple(command), options
+
+
+def wait_command(pid, timeout=None):
+    if timeout is None:
+        return os.wait4(pid, 0)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = os.wait4(pid, os.WNOHANG)
+        if result[0]:
+            return result
+        time.sleep(0.1)
+    return None
+
+
+def measure_command(name, *args, **kwargs):
+    """Run a command and save its exit status, peak memory usage and duration
+
+    The process is reaped with `os.wait4()` to read its resource usage,
+    which includes the processes it waited for, like compilers. The
+    numbers are saved in the `usage` dictionary even when the command
+    fails. Commands running for longer than `timeout` seconds are killed
+    and `memory_limit` caps the address space of the command, in bytes.
+    Both the output and the errors are written to `log`, when informed.
+    """
+    usage = kwargs.pop('usage', {})
+    timeout = kwargs.pop('timeout', None)
+    memory_limit = kwargs.pop('memory_limit', None)
+    log = kwargs.pop('log', None)
+    kwargs.setdefault('env', os.environ)
+
+    started = time.time()
+    with (io.open(log, 'w+b') if log else tempfile.TemporaryFile()) as output:
+        with (output if log else tempfile.TemporaryFile()) as errors:
+            command, options = session_command((name,) + args, memory_limit)
+            command = subprocess.Popen(command,
+                stdout=output,
+                stderr=subprocess.STDOUT if log else errors,
+                **dict(kwargs, **options))
+            result = wait_command(command.pid, timeout)
+            killed = result is None
+            if killed:
+                try:
+                    os.killpg(command.pid, signal.SIGKILL)
+                except OSError:  # It just finished
+                    pass
+                result = os.wait4(command.pid, 0)
+            _, status, rusage = result
+            command.returncode = os.WEXITSTATUS(status) \
+                if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+            # Linux reports kilobytes, OS X reports bytes
+            scale = 1 if sys.platform == 'darwin' else 1024
+            usage.update({
+                'status': command.returncode,
+                'peak_rss': rusage.ru_maxrss * scale,
+                'duration': time.time() - started,
+            })
+
+            if command.returncode != 0:
+                errors.seek(0, os.SEEK_END)
+                errors.seek(max(errors.tell() - ERROR_OUTPUT_SIZE, 0))
+                message = errors.read()
+                if killed:
+                    message += 'Killed after {0} seconds\n'.format(timeout).encode('ascii')
+                if log:
+                    message += 'The full output is in {0}\n'.format(log).encode('utf-8')
+                raise Exception(message)
+    return usage
+
+
+def command_output(name, *args, **kwargs):
+    kwargs.setdefault('env', os.environ)
     command = subprocess.Popen((name,) + args,
-        env=os.environ,
         stderr=subprocess.PIPE, stdout=subprocess.PIPE,
         **kwargs)
-    _, errors = command.communicate()
+    output, errors = command.communicate()
     if command.returncode != 0:
         raise Exception(errors)
+    return output
 
 
 def logger(name):
@@ -137,6 +137,7 @@ class App(Flask):
         """
         pkg = request.files[package]
         self.index.from_data(package, pkg.read())
+        self.index.flush()
         return 'ok'
 
 
@@ -18,6 +18,7 @@
 import os
 import email
 import zipfile
+from distlib.wheel import COMPATIBLE_TAGS
 from .version import __version__
 
 
@@ -69,14 +70,14 @@ class Wheel(object):
         return wheel
 
     def name(self):
-        return '-'.join((
+        return '-'.join(piece for piece in (
             self.distribution,
             self.version,
             self.build,
             self.tags.pyver,
             self.tags.abi or 'none',
             self.tags.arch or 'any',
-        ))
+        ) if piece)
 
     def expand_tags(self):
         return ['-'.join([
@@ -85,6 +86,23 @@ class Wheel(object):
             self.tags.arch or 'any',
         ]) for pyver in self.tags.pyver.split('.')]
 
+    def compatibility(self, tags=None):
+        """Rank how well this wheel fits the running interpreter
+
+        Returns `None` if none of the tags of the wheel are present in
+        `tags` (defaults to the tags supported by the current
+        interpreter). Otherwise a tuple that sorts platform and ABI
+        specific matches after the generic ones is returned, so the
+        highest value means the best fit.
+        """
+        supported = set(COMPATIBLE_TAGS if tags is None else tags)
+        matches = [(arch != 'any', abi != 'none', not pyver.startswith('py'))
+            for pyver in self.tags.pyver.split('.')
+            for abi in (self.tags.abi or 'none').split('.')
+            for arch in (self.tags.arch or 'any').split('.')
+            if (pyver, abi, arch) in supported]
+        return max(matches) if matches else None
+
     def info(self):
         info = {
             'Wheel-Version': '1.0',  # Shamelessly hardcoded
@@ -100,6 +118,16 @@ class Wheel(object):
         info.update(self.information)
         return info
 
+    def wheel_file(self):
+        """Contents of the WHEEL file, the opposite of `read_wheel_file()`"""
+        info = self.info()
+        lines = []
+        for field in ('Wheel-Version', 'Generator', 'Root-Is-Purelib'):
+            lines.append('{0}: {1}'.format(field, info.pop(field)))
+        lines.extend('Tag: {0}'.format(tag) for tag in info.pop('Tag'))
+        lines.extend('{0}: {1}'.format(*field) for field in sorted(info.items()))
+        return '\n'.join(lines) + '\n'
+
     def dist_info_path(self):
         return '{0}-{1}.dist-info'.format(
             self.distribution, self.version)
@@ -0,0 +1,43 @@
+from __future__ import absolute_import, print_function, unicode_literals
+from curdling.buildserver import BuildServerPool
+
+import io
+import os
+import shutil
+import tempfile
+
+
+def test_build_server():
+    "BuildServer should run setup.py scripts in children of a warm interpreter"
+
+    # Given a package with a setup.py script
+    directory = tempfile.mkdtemp()
+    with io.open(os.path.join(directory, 'setup.py'), 'w') as script:
+        script.write('import sys\n'
+                     'print(sys.argv[1:])\n'
+                     'sys.exit(int(sys.argv[1]))\n')
+    log = os.path.join(directory, 'build.log')
+    pool = BuildServerPool(1)
+
+    try:
+        # When I run the script
+        usage = {}
+        pool.run(os.path.join(directory, 'setup.py'), ['0'], usage=usage, log=log)
+
+        # Then I see its output was saved in the log and how it went
+        io.open(log).read().should.equal("['0']\n")
+        usage['status'].should.equal(0)
+        usage.should.have.key('peak_rss')
+        usage.should.have.key('duration')
+
+        # And When the script fails; Then I see the error and the status
+        pool.run.when.called_with(
+            os.path.join(directory, 'setup.py'), ['3'], usage=usage).should.throw(
+                Exception, "['3']")
+        usage['status'].should.equal(3)
+
+        # And that the same server was used by both builds
+        len(pool.servers).should.equal(1)
+    finally:
+        pool.close()
+        shutil.rmtree(directory)
@@ -1,7 +1,14 @@
 from __future__ import absolute_import, print_function, unicode_literals
-from curdling.index import Index, PackageNotFound
+from curdling.exceptions import DigestMismatch
+from curdling.index import Index, PackageNotFound, CATALOG_FLUSH_SIZE
 from . import FIXTURE
 
+from mock import patch
+
+import hashlib
+import json
+import os
+
 
 def test_index_from_file():
     "It should be possible to index packages from files"
@@ -45,6 +52,172 @@ def test_index_from_data():
     index.delete()
 
 
+def test_index_from_stream_verify_digest():
+    "Index.from_stream() Should only index files that match their digest"
+
+    # Given the following index
+    index = Index(FIXTURE('index'))
+    data = open(FIXTURE('storage1/gherkin-0.1.0.tar.gz'), 'rb').read()
+    chunks = [data[:100], data[100:]]
+
+    # When I index a stream with the wrong digest; Then I see it fails
+    index.from_stream.when.called_with(
+        'gherkin-0.1.0.tar.gz', iter(chunks), ('md5', '0' * 32)).should.throw(
+            DigestMismatch, 'Digest mismatch for `gherkin-0.1.0.tar.gz\'')
+
+    # And that nothing was left behind
+    os.listdir(FIXTURE('index')).should.equal([])
+    index.get.when.called_with('gherkin==0.1.0').should.throw(PackageNotFound)
+
+    # When I index it with the right digest
+    index.from_stream(
+        'gherkin-0.1.0.tar.gz', iter(chunks),
+        ('md5', hashlib.md5(data).hexdigest()))
+
+    # Then I see it inside of the index
+    index.get('gherkin==0.1.0').should.equal(
+        FIXTURE('index/gherkin-0.1.0.tar.gz'),
+    )
+
+    # And that its sha256 was recorded, so the server API won't read the
+    # file again
+    sha256 = hashlib.sha256(data).hexdigest()
+    index.get_urlhash('gherkin-0.1.0.tar.gz', lambda u: u).should.equal({
+        'url': 'gherkin-0.1.0.tar.gz', 'sha256': sha256,
+    })
+    index.flush()
+    Index(FIXTURE('index')).digests['gherkin-0.1.0.tar.gz'].should.equal({
+        'sha256': sha256, 'size': len(data),
+    })
+
+    # And I clean the mess
+    index.delete()
+
+
+def test_index_builds():
+    "Index.get_build() Should find the wheels built from a source before"
+
+    # Given an index with a wheel
+    index = Index(FIXTURE('index'))
+    wheel = index.from_data('pkg-0.1-py27-none-any.whl', b'wheel')
+
+    # When I record the build of a pinned URL with credentials
+    index.add_build('git+https://u:p@srv/pkg.git@abc', wheel)
+
+    # Then I see it can be found later, with or without the credentials
+    index.get_build('git+https://srv/pkg.git@abc').should.equal(wheel)
+    index.flush()
+    Index(FIXTURE('index')).get_build('git+https://srv/pkg.git@abc').should.equal(wheel)
+
+    # But other commits were not built
+    index.get_build('git+https://srv/pkg.git@def').should.be.none
+
+    # And the credentials were not saved
+    open(index.cache_path('builds.json')).read().shouldnt.contain('u:p')
+
+    # And When the wheel is gone; Then the build is forgotten
+    os.remove(wheel)
+    index.get_build('git+https://srv/pkg.git@abc').should.be.none
+
+    # And I see how many lookups found a build
+    index.build_stats.should.equal({'hits': 1, 'misses': 2})
+
+    # And When the environment of the build changes; Then the builds are
+    # not used anymore
+    index.add_build('git+https://srv/pkg.git@abc', index.from_data(wheel, b'wheel'))
+    with patch('curdling.index.build_fingerprint', return_value='other'):
+        index.get_build('git+https://srv/pkg.git@abc').should.be.none
+
+    # And I clean the mess
+    index.delete()
+
+
+def test_index_catalog_batched_writes():
+    "Index.update_catalog() Should only write the catalogs after a few updates or when flushed"
+
+    # Given an index
+    index = Index(FIXTURE('index'))
+    path = index.cache_path('builds.json')
+
+    # When I save a build; Then I see nothing was written yet
+    index.add_build('pkg-0.1.tar.gz#sha256=abc', 'pkg-0.1-py27-none-any.whl')
+    os.path.exists(path).should.be.false
+
+    # And When I flush the index; Then I see the catalog on the disk
+    index.flush()
+    list(json.load(open(path)).values()).should.equal(['pkg-0.1-py27-none-any.whl'])
+
+    # And When lots of builds are saved; Then I see they were written along
+    for i in range(CATALOG_FLUSH_SIZE):
+        index.add_build('pkg-{0}.tar.gz#sha256=abc'.format(i), 'pkg-0.1-py27-none-any.whl')
+    json.load(open(path)).should.have.length_of(CATALOG_FLUSH_SIZE + 1)
+
+    # And I see no temporary files were left behind
+    os.listdir(index.cache_path()).should.equal(['builds.json'])
+
+    # And I clean the mess
+    index.delete()
+
+
+def test_index_verify():
+    "Index.verify() Should raise DigestMismatch when a file changed after being stored"
+
+    # Given an index with a wheel
+    index = Index(FIXTURE('index'))
+    wheel = index.from_data('pkg-0.1-py27-none-any.whl', b'wheel')
+
+    # When I verify it; Then I see nothing happens
+    index.verify(wheel)
+
+    # And When its contents change behind the index's back
+    with open(wheel, 'wb') as fobj:
+        fobj.write(b'whoops')
+
+    # Then I see it fails the verification
+    index.verify.when.called_with(wheel).should.throw(DigestMismatch)
+
+    # And I clean the mess
+    index.delete()
+
+
+def test_index_dependencies():
+    "Index.get_dependencies() Should remember the dependencies of each wheel by its digest"
+
+    # Given an index with a wheel
+    index = Index(FIXTURE('index'))
+    wheel = index.from_data('pkg-0.1-py27-none-any.whl', b'wheel')
+
+    # When I save its dependencies
+    index.add_dependencies(wheel, {'install': ['six'], 'extras': {}})
+
+    # Then I see they can be found later
+    index.flush()
+    Index(FIXTURE('index')).get_dependencies(wheel).should.equal(
+        {'install': ['six'], 'extras': {}})
+
+    # And When the wheel is replaced; Then they're forgotten
+    index.from_data('pkg-0.1-py27-none-any.whl', b'another wheel')
+    index.get_dependencies(wheel).should.be.none
+
+    # And I clean the mess
+    index.delete()
+
+
+def test_index_digest_external_files():
+    "Index.digest() Should hash files outside of the index without recording them"
+
+    # Given an index
+    index = Index(FIXTURE('index'))
+    path = FIXTURE('storage1/gherkin-0.1.0.tar.gz')
+
+    # When I get the digest of a file that lives somewhere else
+    digest = index.digest(path)
+
+    # Then I see it's right but it wasn't recorded
+    digest.should.equal(hashlib.sha256(open(path, 'rb').read()).hexdigest())
+    index.digests.should.equal({})
+
+
 def test_index_scan():
     "It should be possible to scan for already existing folders"
 
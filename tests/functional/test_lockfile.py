@@ -0,0 +1,73 @@
+from __future__ import absolute_import, print_function, unicode_literals
+from curdling import lockfile
+from curdling.exceptions import InvalidLockfile
+
+import io
+import os
+import shutil
+import tempfile
+
+
+def test_save_and_load():
+    "lockfile.save() Should write the packages sorted by name and lockfile.load() should read them back"
+
+    # Given a few packages
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'curdling.lock')
+    packages = [
+        lockfile.package('sure', '1.2.5', '/cache/sure-1.2.5-py27-none-any.whl', 'a' * 64,
+                         'https://pypi/sure-1.2.5.tar.gz#sha256=abc', 'https://pypi/simple/'),
+        lockfile.package('mock', '1.0.1', '/cache/mock-1.0.1-py27-none-any.whl', 'b' * 64),
+    ]
+
+    try:
+        # When I save and load them
+        lockfile.save(path, packages)
+        loaded = lockfile.load(path)
+
+        # Then I see the same packages, sorted by name, with only the
+        # file name of the wheels
+        [p['name'] for p in loaded].should.equal(['mock', 'sure'])
+        loaded[0].should.equal({
+            'name': 'mock',
+            'version': '1.0.1',
+            'wheel': 'mock-1.0.1-py27-none-any.whl',
+            'sha256': 'b' * 64,
+            'url': None,
+            'index': None,
+        })
+        loaded[1]['index'].should.equal('https://pypi/simple/')
+
+        # And no temporary files were left behind
+        os.listdir(directory).should.equal(['curdling.lock'])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_load_invalid():
+    "lockfile.load() Should complain about files it can't read"
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'curdling.lock')
+
+    try:
+        # Missing files
+        lockfile.load.when.called_with(path).should.throw(InvalidLockfile)
+
+        # Files that aren't JSON
+        with io.open(path, 'w') as fobj:
+            fobj.write('sure==1.2.5\n')
+        lockfile.load.when.called_with(path).should.throw(InvalidLockfile)
+
+        # Other versions of the format
+        with io.open(path, 'w') as fobj:
+            fobj.write('{"version": 2, "packages": []}')
+        lockfile.load.when.called_with(path).should.throw(
+            InvalidLockfile, 'Unknown format of the lockfile `{0}\''.format(path))
+
+        # Packages missing fields
+        with io.open(path, 'w') as fobj:
+            fobj.write('{"version": 1, "packages": [{"name": "sure"}]}')
+        lockfile.load.when.called_with(path).should.throw(
+            InvalidLockfile, 'Broken list of packages in the lockfile `{0}\''.format(path))
+    finally:
+        shutil.rmtree(directory)
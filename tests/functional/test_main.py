@@ -3,6 +3,8 @@ from mock import Mock
 from nose.tools import nottest
 import os
 import errno
+import shutil
+import tempfile
 
 from curdling import util
 from curdling.exceptions import ReportableError
@@ -21,6 +23,8 @@ DUMMY_PYPI = 'http://localhost:9000/simple/'
 
 DUMMY_PYPI_URL = lambda path: '{0}{1}'.format(DUMMY_PYPI, path)
 
+DUMMY_PYPI_JSON = 'http://localhost:9000/pypi/'
+
 
 def test_downloader_with_no_sources():
     "It should be possible to download packages from pip repos with no sources"
@@ -98,6 +102,25 @@ def test_finder_underscore_on_pkg_name():
     })
 
 
+def test_finder_json_locator():
+    "Finder#handle() should be able to locate packages using the JSON API"
+
+    # Given a finder component that only knows about the JSON index
+    finder = Finder(**{
+        'conf': {'json_urls': [DUMMY_PYPI_JSON]},
+    })
+
+    # When I try to find a package
+    url = finder.handle('main', {'requirement': 'gherkin (0.1.0)'})
+
+    # Then I see the link to the package came from the JSON document
+    url.should.equal({
+        'requirement': 'gherkin (0.1.0)',
+        'locator_url': DUMMY_PYPI_JSON,
+        'url': DUMMY_PYPI_URL('gherkin/gherkin-0.1.0.tar.gz'),
+    })
+
+
 def test_finder_not_found():
     "Finder#handle() should raise `ReportableError` if it can't find the package"
 
@@ -115,31 +138,35 @@ def test_finder_not_found():
 def test_curd_package():
     "It should possible to convert regular packages to wheels"
 
-    # Given that I have a storage containing a package
-    index = Index(FIXTURE('storage1'))
+    # Given that I have a storage containing a package, copied so the
+    # build history and logs don't end up in the fixtures
+    directory = tempfile.mkdtemp()
+    storage = os.path.join(directory, 'storage1')
+    shutil.copytree(FIXTURE('storage1'), storage)
+    index = Index(storage)
     index.scan()
 
     # And a curdling using that index
     curdling = Curdler(**{'index': index})
 
-    # When I request a curd to be created
-    package = curdling.handle('main', {
-        'tarball': index.get('gherkin==0.1.0;~whl'),
-        'requirement': 'gherkin (0.1.0)',
-    })
-
-    # Then I see it's a wheel package.
-    package['wheel'].should.match(
-        FIXTURE('storage1/gherkin-0.1.0-py\d+-none-any.whl'))
+    try:
+        # When I request a curd to be created
+        package = curdling.handle('main', {
+            'tarball': index.get('gherkin==0.1.0;~whl'),
+            'requirement': 'gherkin (0.1.0)',
+        })
 
-    # And that it's present in the index
-    package = index.get('gherkin==0.1.0;whl')
+        # Then I see it's a wheel package.
+        package['wheel'].should.match(
+            os.path.join(storage, 'gherkin-0.1.0-py\d+-none-any.whl'))
 
-    # And that the file was created in the file system
-    os.path.exists(package).should.be.true
+        # And that it's present in the index
+        package = index.get('gherkin==0.1.0;whl')
 
-    # And I delete the file
-    os.unlink(package)
+        # And that the file was created in the file system
+        os.path.exists(package).should.be.true
+    finally:
+        shutil.rmtree(directory)
 
 
 def test_install_package():
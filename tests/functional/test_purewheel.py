@@ -0,0 +1,57 @@
+from __future__ import absolute_import, print_function, unicode_literals
+from curdling.purewheel import build_wheel
+from distlib.wheel import Wheel
+
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+
+def write(root, name, contents):
+    path = os.path.join(root, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, 'w') as fobj:
+        fobj.write(contents)
+
+
+def test_build_wheel():
+    "build_wheel() Should assemble wheels of static pure Python packages"
+
+    # Given the source distribution of a static pure Python package
+    root = tempfile.mkdtemp()
+    write(root, 'setup.py', 'from setuptools import setup\nsetup()\n')
+    write(root, 'setup.cfg',
+          '[options]\npackages = gherkin\ninstall_requires = six\n')
+    write(root, 'PKG-INFO',
+          'Metadata-Version: 1.1\nName: gherkin\nVersion: 0.1.0\n')
+    write(root, 'gherkin/__init__.py', 'x = 1\n')
+    write(root, 'gherkin/README', 'not python\n')
+
+    try:
+        # When I build its wheel
+        path = build_wheel(os.path.join(root, 'setup.py'), os.path.join(root, 'dist'))
+
+        # Then I see the wheel has the Python files and the metadata
+        os.path.basename(path).should.match(r'^gherkin-0.1.0-py\d-none-any.whl$')
+        sorted(zipfile.ZipFile(path).namelist()).should.equal([
+            'gherkin-0.1.0.dist-info/METADATA',
+            'gherkin-0.1.0.dist-info/RECORD',
+            'gherkin-0.1.0.dist-info/WHEEL',
+            'gherkin/__init__.py',
+        ])
+
+        # And that the wheel is valid and declares its dependencies
+        wheel = Wheel(path)
+        wheel.verify()
+        wheel.metadata.run_requires.should.equal(['six'])
+        zipfile.ZipFile(path).read('gherkin-0.1.0.dist-info/METADATA').decode(
+            'utf-8').should.match(r'^Metadata-Version: 2.0\n')
+
+        # And When setup.py does anything else; Then I see no wheel is built
+        write(root, 'setup.py', 'from setuptools import setup\nsetup(name="x")\n')
+        build_wheel(os.path.join(root, 'setup.py'), os.path.join(root, 'dist')).should.be.none
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,30 @@
+from __future__ import absolute_import, print_function, unicode_literals
+from curdling import util
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+
+def test_measure_command_memory_limit():
+    "measure_command() Should run the command in its own session with the memory limit"
+
+    # Given a command that prints its session and memory limit
+    directory = tempfile.mkdtemp()
+    log = os.path.join(directory, 'command.log')
+    script = ('import os, resource\n'
+              'print(os.getsid(0) == os.getpid())\n'
+              'print(resource.getrlimit(resource.RLIMIT_AS)[0])\n')
+
+    try:
+        # When I run it with a memory limit
+        util.measure_command(sys.executable, '-c', script,
+                             memory_limit=2**30, log=log)
+
+        # Then I see it started a new session and got the limit
+        with io.open(log) as output:
+            output.read().split().should.equal(['True', str(2**30)])
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+from mock import patch, Mock
+from curdling import buildserver
+from curdling.exceptions import BuildServerUnavailable
+from curdling.services import curdler
+
+import os
+import subprocess
+import sys
+
+
+@patch('curdling.buildserver.os.path.exists')
+def test_needs_isolation(exists):
+    "needs_isolation() Should tell which packages can't be built by warm servers"
+
+    # Given a package without a pyproject.toml file
+    exists.return_value = False
+
+    # When I check if packages need isolation; Then I see only the
+    # build tools do
+    buildserver.needs_isolation('/tmp/pkg/setup.py', 'pkg').should.be.false
+    buildserver.needs_isolation('/tmp/pkg/setup.py', 'Setuptools').should.be.true
+
+    # And When the package has a pyproject.toml file; Then it needs isolation
+    exists.return_value = True
+    buildserver.needs_isolation('/tmp/pkg/setup.py', 'pkg').should.be.true
+    exists.assert_called_with('/tmp/pkg/pyproject.toml')
+
+
+def test_bootstrap_only_imports_the_standard_library():
+    "buildserver.BOOTSTRAP Should import the server without any third party package"
+
+    # Given the command used to start the servers, that reports the
+    # modules of curdling and its dependencies loaded before serving
+    path = os.path.dirname(os.path.dirname(os.path.abspath(buildserver.__file__)))
+    command = buildserver.BOOTSTRAP.format(path).replace(
+        'serve()', 'print(sorted(m for m in sys.modules if m.split(".")[0] in '
+        '("curdling", "distlib", "urllib3", "setuptools", "pkg_resources")))')
+
+    # When I run it
+    output = subprocess.check_output([sys.executable, '-S', '-c', command])
+
+    # Then I see only the server and the exceptions were imported
+    output.decode('utf-8').strip().should.equal(
+        str(sorted(['curdling', 'curdling.buildserver', 'curdling.exceptions'])))
+
+
+@patch('curdling.buildserver.BuildServer')
+def test_build_server_pool_reuses_servers(BuildServer):
+    "BuildServerPool.run() Should reuse the servers that are still working"
+
+    # Given a pool of build servers
+    pool = buildserver.BuildServerPool(2)
+    server = BuildServer.return_value.start.return_value
+
+    # When I run two builds
+    pool.run('/tmp/pkg/setup.py', ['bdist_wheel'], usage={})
+    pool.run('/tmp/pkg/setup.py', ['bdist_wheel'], usage={})
+
+    # Then I see the same server was used
+    BuildServer.return_value.start.call_count.should.equal(1)
+    server.run.call_count.should.equal(2)
+
+    # And When the server dies
+    server.run.side_effect = BuildServerUnavailable('Broken pipe')
+    pool.run.when.called_with(
+        '/tmp/pkg/setup.py', ['bdist_wheel']).should.throw(BuildServerUnavailable)
+
+    # Then I see it was stopped and removed from the pool
+    server.stop.assert_called_once_with()
+    pool.servers.should.equal([])
+    pool.idle.should.equal([])
+
+
+@patch('curdling.services.curdler.os.listdir', Mock(return_value=['pkg.whl']))
+@patch('curdling.services.curdler.execute_command')
+def test_run_script_build_servers(execute_command):
+    "run_setup_script() Should use the build servers and fall back to a new interpreter"
+
+    # Given a pool of build servers
+    servers = Mock()
+
+    # When I run a script with the servers
+    curdler.run_setup_script('/tmp/pkg/setup.py', 'bdist_wheel', servers=servers, usage={})
+
+    # Then I see the build server ran the script
+    servers.run.assert_called_once_with(
+        '/tmp/pkg/setup.py', ['bdist_wheel'], usage={})
+    execute_command.called.should.be.false
+
+    # And When the servers stop working
+    servers.run.side_effect = BuildServerUnavailable('Broken pipe')
+    curdler.run_setup_script('/tmp/pkg/setup.py', 'bdist_wheel', servers=servers)
+
+    # Then I see the script was run by a new interpreter
+    execute_command.call_count.should.equal(1)
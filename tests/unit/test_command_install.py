@@ -156,6 +156,133 @@ def test_handle_filter_compatible_requirements():
     install.mapping.requirements.should.equal(set(['package (1.0)']))
 
 
+def test_handle_conflicting_requirements():
+    "Install#handle() Should hand requirements that conflict with the ones filed before to the resolver instead of retrieving them"
+
+    # Given that I have the install command
+    index = Index('')
+    index.storage = {}
+    install = Install(conf={'index': index})
+
+    # And I mock the finder service end-point
+    install.finder.queue = Mock()
+    install.pipeline()
+
+    # When two packages need versions of the same package that don't intersect
+    install.handle('tests', requirement='lib (>= 2.0)', dependency_of='app')
+    install.handle('tests', requirement='lib (< 2.0)', dependency_of='other')
+
+    # Then I see only the first one was retrieved
+    install.finder.queue.assert_called_once_with(
+        'tests', requirement='lib (>= 2.0)', dependency_of='app')
+
+    # And Then I see the conflict was filed apart from the requirements
+    install.mapping.conflicts.should.equal({'lib (< 2.0)': ['lib (>= 2.0)']})
+    install.mapping.dependencies['lib (< 2.0)'].should.equal(['other'])
+    install.mapping.requirements.should.equal(set(['lib (>= 2.0)']))
+    install.mapping.errors.should.be.empty
+
+    # And When another requirement agrees with the ones filed
+    install.handle('tests', requirement='lib (>= 2.1)', dependency_of='another')
+
+    # Then I see it's retrieved as usual
+    install.finder.queue.call_count.should.equal(2)
+    install.mapping.conflicts.should_not.have.key('lib (>= 2.1)')
+
+
+def test_handle_conflict_resolved_through_conflicting_requirement():
+    "Install#load_installer() Should be able to choose a requirement that conflicted with others when it was found"
+
+    # Given an index with an older version of `app' that doesn't need
+    # `lib' and a version of `lib' that `other' accepts
+    index = Index('')
+    index.storage = {
+        'app': {'0.9': ['app-0.9-py27-none-any.whl']},
+        'lib': {'1.0': ['lib-1.0-py27-none-any.whl']},
+    }
+    install = Install(conf={'index': index})
+    install.finder.queue = Mock()
+    install.pipeline()
+    install.installer.queue = Mock(__name__=str('queue'))
+
+    # And that the requirements are retrieved from the network
+    install.set_wheel = install.set_tarball = Mock(return_value=False)
+
+    # And two primary requirements whose dependencies conflict
+    install.handle('tests', requirement='app (>= 0.9)')
+    install.handle('tests', requirement='other')
+    install.handle('tests', requirement='lib (>= 2.0)', dependency_of='app (>= 0.9)')
+    install.handle('tests', requirement='lib (< 2.0)', dependency_of='other')
+    install.mapping.conflicts.should.have.key('lib (< 2.0)')
+
+    # And the requirements retrieved were built
+    built = {
+        'app (>= 0.9)': 'app-1.0-py27-none-any.whl',
+        'other': 'other-1.0-py27-none-any.whl',
+        'lib (>= 2.0)': 'lib-2.0-py27-none-any.whl',
+    }
+    for queued in install.finder.queue.call_args_list:
+        requirement = queued[1]['requirement']
+        install.mapping.wheels[requirement] = built[requirement]
+    install.dependencer.requirements = Mock(side_effect=lambda requirement, wheel: {
+        'app-1.0-py27-none-any.whl': ['lib (>= 2.0)'],
+        'app-0.9-py27-none-any.whl': [],
+        'other-1.0-py27-none-any.whl': ['lib (< 2.0)'],
+        'lib-1.0-py27-none-any.whl': [],
+        'lib-2.0-py27-none-any.whl': [],
+    }[wheel])
+
+    # When I load the installer
+    names, errors = install.load_installer()
+
+    # Then I see a version of `lib' that satisfies the requirement that
+    # conflicted was chosen, along with the older `app'
+    errors.should.be.empty
+    sorted(install.installer.queue.call_args_list, key=lambda i: i[1]['wheel']).should.equal([
+        call('main', requirement='app (0.9)', wheel='app-0.9-py27-none-any.whl'),
+        call('main', requirement='lib (1.0)', wheel='lib-1.0-py27-none-any.whl'),
+        call('main', requirement='other', wheel='other-1.0-py27-none-any.whl'),
+    ])
+
+
+def test_handle_conflict_not_resolved():
+    "Install#load_installer() Should report requirements that conflicted with others when the resolver can't satisfy them"
+
+    # Given an install command with an empty index
+    index = Index('')
+    index.storage = {}
+    install = Install(conf={'index': index})
+    install.finder.queue = Mock()
+    install.pipeline()
+    install.installer.queue = Mock(__name__=str('queue'))
+    install.set_wheel = install.set_tarball = Mock(return_value=False)
+
+    # And two primary requirements whose dependencies conflict
+    install.handle('tests', requirement='app')
+    install.handle('tests', requirement='other')
+    install.handle('tests', requirement='lib (>= 2.0)', dependency_of='app')
+    install.handle('tests', requirement='lib (< 2.0)', dependency_of='other')
+    install.mapping.wheels.update({
+        'app': 'app-1.0-py27-none-any.whl',
+        'other': 'other-1.0-py27-none-any.whl',
+        'lib (>= 2.0)': 'lib-2.0-py27-none-any.whl',
+    })
+    install.dependencer.requirements = Mock(side_effect=lambda requirement, wheel: {
+        'app-1.0-py27-none-any.whl': ['lib (>= 2.0)'],
+        'other-1.0-py27-none-any.whl': ['lib (< 2.0)'],
+        'lib-2.0-py27-none-any.whl': [],
+    }[wheel])
+
+    # When I load the installer
+    names, errors = install.load_installer()
+
+    # Then I see the requirement that conflicted is reported
+    errors.should.have.key('lib')
+    errors['lib'].should.have.key('lib (< 2.0)')
+    errors['lib']['lib (< 2.0)']['dependency_of'].should.equal(['other'])
+    errors['lib']['lib (< 2.0)']['exception'].should.be.a(VersionConflict)
+
+
 def test_handle_filter_dups():
     "Install#handle() Should skip duplicated requirements"
 
@@ -506,6 +633,183 @@ def test_load_installer_handle_version_conflicts():
         'Requirement: package (0.2, 0.1), Available versions: 0.2, 0.1')
 
 
+def test_load_installer_resolves_version_conflicts():
+    "Install#load_installer() Should look for versions that work together when the best versions of each package conflict"
+
+    # Given an index with an older version of a package
+    index = Index('')
+    index.storage = {'app': {'1.0': ['app-1.0-py27-none-any.whl'],
+                             '2.0': ['app-2.0-py27-none-any.whl']}}
+    install = Install(conf={'index': index})
+    install.pipeline()
+    install.installer.queue = Mock(__name__=str('queue'))
+
+    # And two primary requirements that need different versions of `lib'
+    install.mapping.requirements = set(['app', 'other', 'lib (>= 2.0)', 'lib (< 2.0)'])
+    install.mapping.wheels = {
+        'app': 'app-2.0-py27-none-any.whl',
+        'other': 'other-1.0-py27-none-any.whl',
+        'lib (>= 2.0)': 'lib-2.0-py27-none-any.whl',
+        'lib (< 2.0)': 'lib-1.0-py27-none-any.whl',
+    }
+    install.mapping.dependencies = {
+        'app': [None],
+        'other': [None],
+        'lib (>= 2.0)': ['app'],
+        'lib (< 2.0)': ['other'],
+    }
+
+    # And the older `app' doesn't need `lib' at all
+    install.dependencer.requirements = Mock(side_effect=lambda requirement, wheel: {
+        'app-2.0-py27-none-any.whl': ['lib (>= 2.0)'],
+        'app-1.0-py27-none-any.whl': [],
+        'other-1.0-py27-none-any.whl': ['lib (< 2.0)'],
+        'lib-1.0-py27-none-any.whl': [],
+        'lib-2.0-py27-none-any.whl': [],
+    }[wheel])
+
+    # When I load the installer
+    names, errors = install.load_installer()
+
+    # Then I see the conflict was solved
+    errors.should.be.empty
+    names.should.equal(set(['app', 'other', 'lib']))
+
+    # And the older `app' was taken from the index
+    sorted(install.installer.queue.call_args_list, key=lambda i: i[1]['wheel']).should.equal([
+        call('main', requirement='app (1.0)', wheel='app-1.0-py27-none-any.whl'),
+        call('main', requirement='lib (< 2.0)', wheel='lib-1.0-py27-none-any.whl'),
+        call('main', requirement='other', wheel='other-1.0-py27-none-any.whl'),
+    ])
+
+
+def test_load_installer_resolves_version_conflicts_along_other_errors():
+    "Install#load_installer() Should resolve conflicts even when other packages failed"
+
+    # Given an index with an older version of a package
+    index = Index('')
+    index.storage = {'app': {'1.0': ['app-1.0-py27-none-any.whl']}}
+    install = Install(conf={'index': index})
+    install.pipeline()
+    install.installer.queue = Mock(__name__=str('queue'))
+
+    # And two primary requirements that need different versions of `lib'
+    install.mapping.requirements = set(['app', 'other', 'lib (>= 2.0)', 'lib (< 2.0)', 'broken'])
+    install.mapping.wheels = {
+        'app': 'app-2.0-py27-none-any.whl',
+        'other': 'other-1.0-py27-none-any.whl',
+        'lib (>= 2.0)': 'lib-2.0-py27-none-any.whl',
+        'lib (< 2.0)': 'lib-1.0-py27-none-any.whl',
+    }
+    install.mapping.dependencies = {
+        'app': [None],
+        'other': [None],
+        'lib (>= 2.0)': ['app'],
+        'lib (< 2.0)': ['other'],
+        'broken': [None],
+    }
+    install.dependencer.requirements = Mock(side_effect=lambda requirement, wheel: {
+        'app-2.0-py27-none-any.whl': ['lib (>= 2.0)'],
+        'app-1.0-py27-none-any.whl': [],
+        'other-1.0-py27-none-any.whl': ['lib (< 2.0)'],
+        'lib-1.0-py27-none-any.whl': [],
+        'lib-2.0-py27-none-any.whl': [],
+    }[wheel])
+
+    # And another primary requirement that couldn't be built
+    install.mapping.errors['broken']['broken'] = {
+        'exception': ReportableError('Beep-Bop'),
+        'dependency_of': [None],
+    }
+
+    # When I load the installer
+    names, errors = install.load_installer()
+
+    # Then I see only the package that failed is reported
+    list(errors).should.equal(['broken'])
+
+    # And the conflict was solved anyway
+    names.should.equal(set(['app', 'other', 'lib']))
+    sorted(install.installer.queue.call_args_list, key=lambda i: i[1]['wheel']).should.equal([
+        call('main', requirement='app (1.0)', wheel='app-1.0-py27-none-any.whl'),
+        call('main', requirement='lib (< 2.0)', wheel='lib-1.0-py27-none-any.whl'),
+        call('main', requirement='other', wheel='other-1.0-py27-none-any.whl'),
+    ])
+
+
+def test_load_installer_resolves_version_conflicts_with_remote_versions():
+    "Install#load_installer() Should try the versions the indexes know about, retrieving only the chosen ones"
+
+    # Given an install command with an empty index
+    index = Index('')
+    index.storage = {}
+    install = Install(conf={'index': index})
+    install.pipeline()
+    install.installer.queue = Mock(__name__=str('queue'))
+
+    # And two primary requirements that need different versions of `lib'
+    install.mapping.requirements = set(['app', 'other', 'lib (>= 2.0)', 'lib (< 2.0)'])
+    install.mapping.wheels = {
+        'app': 'app-2.0-py27-none-any.whl',
+        'other': 'other-1.0-py27-none-any.whl',
+        'lib (>= 2.0)': 'lib-2.0-py27-none-any.whl',
+        'lib (< 2.0)': 'lib-1.0-py27-none-any.whl',
+    }
+    install.mapping.dependencies = {
+        'app': [None],
+        'other': [None],
+        'lib (>= 2.0)': ['app'],
+        'lib (< 2.0)': ['other'],
+    }
+    install.dependencer.requirements = Mock(side_effect=lambda requirement, wheel: {
+        'app-2.0-py27-none-any.whl': ['lib (>= 2.0)'],
+        'other-1.0-py27-none-any.whl': ['lib (< 2.0)'],
+        'lib-1.0-py27-none-any.whl': [],
+        'lib-2.0-py27-none-any.whl': [],
+    }[wheel])
+
+    # And an index that knows an older `app' that doesn't need `lib'
+    locator = Mock(base_url='http://pypi.o/simple')
+    locator.get_dependencies.return_value = []
+    release = Mock(version='1.0', locator=locator, digest=None, md5_digest=None)
+    release.name = 'app'
+    release.metadata.download_url = 'http://pypi.o/app-1.0.tar.gz'
+    locator.get_project.side_effect = lambda name: {'1.0': release} if name == 'app' else {}
+    install.finder.locator = Mock(locators=[locator])
+
+    # And the release can be retrieved and built
+    install.downloader.handle = Mock(return_value={
+        'requirement': 'app (1.0)', 'tarball': 'app-1.0.tar.gz'})
+    install.curdler.handle = Mock(return_value={
+        'requirement': 'app (1.0)', 'wheel': 'app-1.0-py27-none-any.whl'})
+    index.digest = Mock(return_value='f' * 64)
+
+    # When I load the installer
+    names, errors = install.load_installer()
+
+    # Then I see the conflict was solved with the remote `app'
+    errors.should.be.empty
+    sorted(install.installer.queue.call_args_list, key=lambda i: i[1]['wheel']).should.equal([
+        call('main', requirement='app (1.0)', wheel='app-1.0-py27-none-any.whl'),
+        call('main', requirement='lib (< 2.0)', wheel='lib-1.0-py27-none-any.whl'),
+        call('main', requirement='other', wheel='other-1.0-py27-none-any.whl'),
+    ])
+
+    # And its dependencies were read from the index, so only the
+    # chosen release was retrieved
+    install.downloader.handle.assert_called_once_with('main', {
+        'requirement': 'app (1.0)',
+        'url': 'http://pypi.o/app-1.0.tar.gz',
+        'locator_url': 'http://pypi.o/simple',
+    })
+    install.mapping.sources['app (1.0)'].should.equal({
+        'url': 'http://pypi.o/app-1.0.tar.gz',
+        'index': 'http://pypi.o/simple',
+        'sha256': 'f' * 64,
+    })
+    index.digest.assert_called_once_with('app-1.0.tar.gz')
+
+
 def test_load_installer_forward_errors():
     "Install#load_installer() Should forward errors from other services when `installable_packages` != `initial_requirements`"
 
@@ -543,3 +847,123 @@ def test_load_installer_forward_errors():
     errors['package']['package']['exception'].should.be.a(ReportableError)
     str(errors['package']['package']['exception']).should.equal(
         'Requirement `package\' not found')
+
+
+def test_offline_mode():
+    "Install() Should not create network openers nor upload anything in offline mode"
+
+    # Given an install command in offline mode that would upload packages
+    install = Install(conf={'index': Mock(), 'offline': True, 'upload': True})
+    install.retrieve_and_build = Mock(return_value=[])
+    install.upload = Mock()
+
+    # Then I see that no openers were created
+    install.finder.opener.should.be.none
+    install.downloader.opener.should.be.none
+    install.uploader.opener.should.be.none
+
+    # And When I run it; Then I see nothing was uploaded
+    install.run()
+    install.upload.called.should.be.false
+
+
+def test_pipeline_locked_skips_dependencer():
+    "Install#pipeline() Should send the wheels built to the installer when installing from a lockfile"
+
+    # Given that I have the install command reading a lockfile
+    install = Install(conf={'lockfile': 'curdling.lock'})
+    install.dependencer.queue = Mock(__name__=str('queue'))
+    install.pipeline()
+
+    # When the curdler builds a package
+    install.curdler.emit('finished', 'tests', requirement='pkg (0.1)', wheel='pkg.whl')
+
+    # Then I see it's ready to be installed without looking for dependencies
+    install.mapping.wheels.should.equal({'pkg (0.1)': 'pkg.whl'})
+    install.dependencer.queue.called.should.be.false
+
+
+def test_pipeline_records_download_digests():
+    "Install#pipeline() Should remember the digest of the files downloaded over HTTP"
+
+    # Given that I have the install command with an index
+    index = Mock(**{'digest.return_value': 'a' * 64})
+    install = Install(conf={'index': index})
+    install.curdler.queue = Mock(__name__=str('queue'))
+    install.pipeline()
+
+    # And the finder found a package in an index
+    install.mapping.sources['pkg'] = {'url': 'http://srv/pkg-0.1.tar.gz', 'index': None}
+
+    # When the downloader retrieves it
+    install.downloader.emit('finished', 'tests', requirement='pkg', tarball='/cache/pkg-0.1.tar.gz')
+
+    # Then I see the digest of the tarball was recorded
+    install.mapping.sources['pkg']['sha256'].should.equal('a' * 64)
+    index.digest.assert_called_once_with('/cache/pkg-0.1.tar.gz')
+
+    # And When a VCS URL is retrieved; Then I see no digest is recorded
+    install.downloader.emit('finished', 'tests',
+        requirement='git+https://srv/pkg.git', wheel='/cache/pkg-0.1-py27-none-any.whl')
+    install.mapping.sources.shouldnt.have.key('git+https://srv/pkg.git')
+
+
+@patch('curdling.install.lockfile.save')
+def test_save_lockfile(save):
+    "Install#save_lockfile() Should save the version, digest and source of the chosen packages"
+
+    # Given that I have the install command with a few packages chosen
+    index = Mock(**{'catalog.return_value': {}, 'digest.return_value': 'f' * 64})
+    install = Install(conf={'index': index})
+    install.chosen = {'pkg': 'pkg (>= 0.1)'}
+    install.mapping.wheels = {'pkg (>= 0.1)': '/cache/pkg-0.1-py27-none-any.whl'}
+    install.mapping.sources = {'pkg (>= 0.1)': {
+        'url': 'http://srv/pkg-0.1.tar.gz', 'index': 'http://srv/simple',
+        'sha256': 'a' * 64}}
+
+    # When I save the lockfile
+    install.save_lockfile('curdling.lock')
+
+    # Then I see everything needed to install the same packages again
+    save.assert_called_once_with('curdling.lock', [{
+        'name': 'pkg',
+        'version': '0.1',
+        'wheel': 'pkg-0.1-py27-none-any.whl',
+        'sha256': 'f' * 64,
+        'url': 'http://srv/pkg-0.1.tar.gz#sha256=' + 'a' * 64,
+        'index': 'http://srv/simple',
+    }])
+    index.digest.assert_called_once_with('/cache/pkg-0.1-py27-none-any.whl')
+
+
+def test_load_lockfile():
+    "Install#load_lockfile() Should use the wheels of the index and only look up packages saved without a URL"
+
+    # Given that I have the install command reading a lockfile
+    install = Install(conf={'lockfile': 'curdling.lock'})
+    install.pipeline()
+    install.finder.queue = Mock()
+    install.downloader.queue = Mock()
+
+    # And only the wheel of `first' is in the local index
+    install.locked_wheel = Mock(side_effect=lambda package:
+        '/cache/first-0.1-py27-none-any.whl' if package['name'] == 'first' else None)
+
+    # When I load the lockfile
+    install.load_lockfile([
+        {'name': 'first', 'version': '0.1', 'url': None, 'index': None},
+        {'name': 'second', 'version': '0.2', 'url': 'http://srv/second-0.2.tar.gz',
+         'index': 'http://srv/simple'},
+        {'name': 'third', 'version': '0.3', 'url': None, 'index': None},
+    ])
+
+    # Then I see the wheel of the index is ready to be installed
+    install.mapping.wheels.should.equal({'first (0.1)': '/cache/first-0.1-py27-none-any.whl'})
+
+    # And the other packages are retrieved pinned to the saved versions
+    install.downloader.queue.assert_called_once_with(
+        'main', requirement='second (0.2)', url='http://srv/second-0.2.tar.gz',
+        locator_url='http://srv/simple')
+    install.finder.queue.assert_called_once_with('main', requirement='third (0.3)')
+    install.mapping.requirements.should.equal(
+        set(['first (0.1)', 'second (0.2)', 'third (0.3)']))
@@ -55,6 +55,28 @@ def test_index_ensure_path_for_existing_dirs(patched_os):
     patched_os.makedirs.called.should.be.false
 
 
+@patch('curdling.index.os')
+def test_index_scan_skip_hidden_entries(patched_os):
+    "Index.scan() Should skip the hidden entries used to store caches"
+
+    # Given an index directory containing a package and the cache directory
+    patched_os.path.isdir.return_value = True
+    patched_os.path.join = os.path.join
+    patched_os.path.basename = os.path.basename
+    patched_os.listdir.return_value = ['.cache', 'gherkin-0.1.0.tar.gz']
+
+    # When I scan the index
+    index = Index('/index')
+    index.scan()
+
+    # Then I see only the package was indexed
+    dict(index.storage).should.equal({
+        'gherkin': {'0.1.0': ['gherkin-0.1.0.tar.gz']},
+    })
+    index.cache_path('not-found.json').should.equal(
+        '/index/.cache/not-found.json')
+
+
 def test_index_feed_backend():
     "It should be possible to save package paths granularly"
 
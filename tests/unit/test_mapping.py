@@ -1,5 +1,5 @@
 from __future__ import absolute_import, print_function, unicode_literals
-from curdling.mapping import Mapping
+from curdling.mapping import Mapping, RequirementSet
 from curdling import exceptions
 
 
@@ -272,3 +272,90 @@ def test_best_version_with_no_wheels():
         exceptions.VersionConflict,
         'Requirement: pkg, no available versions were found'
     )
+
+
+def test_requirement_set_index():
+    "RequirementSet should keep the requirements indexed by package name while it changes"
+
+    # Given a set of requirements
+    requirements = RequirementSet(['sure (1.2.1)', 'forbiddenfruit (0.1.1)'])
+
+    # When I add and discard requirements
+    requirements.add('forbiddenfruit (>= 0.0.5)')
+    requirements.add('forbiddenfruit (0.1.1)')
+    requirements.discard('sure (1.2.1)')
+    requirements -= set(['not-there'])
+
+    # Then I see it still works as a set
+    requirements.should.equal(set(['forbiddenfruit (0.1.1)', 'forbiddenfruit (>= 0.0.5)']))
+
+    # And that the requirements can be found by package name
+    requirements.named('forbiddenfruit').should.equal(
+        ['forbiddenfruit (0.1.1)', 'forbiddenfruit (>= 0.0.5)'])
+    requirements.named('sure').should.equal([])
+    requirements.package_names().should.equal(set(['forbiddenfruit']))
+
+
+def test_requirement_set_in_place_operators():
+    "RequirementSet should keep its index when changed by the in-place set operators"
+
+    # Given a set of requirements
+    requirements = RequirementSet(['lib (>= 1.0)', 'lib (< 3.0)', 'sure (1.2.1)'])
+    requirements.version_range('lib')
+
+    # When I intersect it with other requirements
+    requirements &= set(['lib (>= 1.0)', 'sure (1.2.1)', 'other'])
+
+    # Then I see the index and the ranges follow it
+    requirements.should.equal(set(['lib (>= 1.0)', 'sure (1.2.1)']))
+    requirements.named('lib').should.equal(['lib (>= 1.0)'])
+    requirements.version_range('lib').upper.should.be.none
+
+    # And When I use a symmetric difference
+    requirements ^= set(['sure (1.2.1)', 'lib (< 2.0)'])
+
+    # Then I see the requirements in both sets are gone and the others
+    # were added
+    requirements.should.equal(set(['lib (>= 1.0)', 'lib (< 2.0)']))
+    requirements.package_names().should.equal(set(['lib']))
+    requirements.version_range('lib').upper.shouldnt.be.none
+
+    # And the methods do the same
+    requirements.intersection_update(['lib (< 2.0)'])
+    requirements.named('lib').should.equal(['lib (< 2.0)'])
+    requirements.symmetric_difference_update(['lib (< 2.0)'])
+    requirements.package_names().should.be.empty
+
+
+def test_mapping_requirements_assignment():
+    "Mapping#requirements Should index plain sets assigned to it"
+
+    # Given a mapping
+    mapping = Mapping()
+
+    # When I assign a plain set to its requirements
+    mapping.requirements = set(['sure (1.2.1)', 'sure (>= 1.0)'])
+
+    # Then I see they can be found by package name
+    sorted(mapping.get_requirements_by_package_name('sure')).should.equal(
+        ['sure (1.2.1)', 'sure (>= 1.0)'])
+
+
+def test_conflicting_requirements():
+    "Mapping#conflicting_requirements() Should find the requirements that can't be satisfied along with a new one"
+
+    # Given a mapping with a few requirements of the same package
+    mapping = Mapping()
+    mapping.requirements.add('lib (>= 1.0)')
+    mapping.requirements.add('lib (>= 2.0)')
+
+    # When I check compatible and incompatible requirements
+    mapping.conflicting_requirements('lib (< 3.0)').should.be.empty
+    mapping.conflicting_requirements('other (< 1.0)').should.be.empty
+
+    # Then I see only the ones that conflict by themselves
+    mapping.conflicting_requirements('lib (< 2.0)').should.equal(['lib (>= 2.0)'])
+
+    # And the range is computed again when requirements are discarded
+    mapping.requirements.discard('lib (>= 2.0)')
+    mapping.conflicting_requirements('lib (< 2.0)').should.be.empty
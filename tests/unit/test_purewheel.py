@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+from curdling import purewheel
+from distlib.compat import configparser
+
+
+def config(text):
+    parser = configparser.RawConfigParser()
+    if hasattr(parser, 'read_string'):
+        parser.read_string(text)
+    else:  # Python 2
+        import io
+        parser.readfp(io.StringIO(text))
+    return parser
+
+
+def test_is_trivial_setup():
+    "is_trivial_setup() Should only accept scripts that just call setup()"
+
+    purewheel.is_trivial_setup(
+        '"Docstring"\n'
+        'from setuptools import setup\n'
+        'setup()\n').should.be.true
+    purewheel.is_trivial_setup(
+        'import setuptools\n'
+        'if __name__ == "__main__":\n'
+        '    setuptools.setup()\n').should.be.true
+
+    # Any argument or code might change the result of the build
+    purewheel.is_trivial_setup(
+        'from setuptools import setup\n'
+        'setup(name="pkg")\n').should.be.false
+    purewheel.is_trivial_setup(
+        'from setuptools import setup, Extension\n'
+        'setup()\n').should.be.false
+    purewheel.is_trivial_setup(
+        'import os\n'
+        'from setuptools import setup\n'
+        'setup()\n').should.be.false
+    purewheel.is_trivial_setup('setup(').should.be.false
+
+
+def test_static_options():
+    "static_options() Should read the packages and the dependencies of setup.cfg"
+
+    # Given a static setup.cfg file
+    parser = config(
+        '[options]\n'
+        'packages =\n'
+        '    pkg\n'
+        '    pkg.sub\n'
+        'install_requires = six>=1.0\n'
+        '[options.extras_require]\n'
+        'test = mock\n'
+        '[bdist_wheel]\n'
+        'universal = 1\n'
+        '[egg_info]\n'
+        'tag_build =\n'
+        'tag_date = 0\n')
+
+    # When I read its options; Then I see everything was found
+    purewheel.static_options(parser).should.equal({
+        'packages': ['pkg', 'pkg.sub'],
+        'py_modules': [],
+        'install_requires': ['six>=1.0'],
+        'extras': {'test': ['mock']},
+        'universal': True,
+    })
+
+
+def test_static_options_ambiguous():
+    "static_options() Should refuse options that need the real build"
+
+    purewheel.static_options(config('[metadata]\nname = pkg\n')).should.be.none
+    purewheel.static_options(config(
+        '[options]\npackages = find:\n')).should.be.none
+    purewheel.static_options(config(
+        '[options]\npackages = pkg\npackage_dir = =src\n')).should.be.none
+    purewheel.static_options(config(
+        '[options]\npackages = pkg\n'
+        '[options.entry_points]\nconsole_scripts = pkg = pkg:main\n')).should.be.none
+    purewheel.static_options(config(
+        '[options]\npackages = pkg\n'
+        '[egg_info]\ntag_build = dev\n')).should.be.none
+
+
+def test_requirement_field():
+    "requirement_field() Should add the extra to the markers of a requirement"
+
+    purewheel.requirement_field('six>=1.0').should.equal('six>=1.0')
+    purewheel.requirement_field('mock', 'test').should.equal('mock; extra == "test"')
+    purewheel.requirement_field('enum34 ; python_version < "3.4"', 'test').should.equal(
+        'enum34; (python_version < "3.4") and extra == "test"')
@@ -0,0 +1,171 @@
+from __future__ import absolute_import, print_function, unicode_literals
+from mock import Mock
+from curdling.exceptions import VersionConflict
+from curdling.resolver import Candidate, Resolver, VersionRange, satisfies
+
+import sys
+
+
+def provider(packages):
+    # {'name': {'version': ['dependency', ...]}} -> the functions the
+    # resolver expects
+    def candidates(package_name):
+        versions = packages.get(package_name, {})
+        return [Candidate(v, '{0}-{1}.whl'.format(package_name, v))
+                for v in sorted(versions, reverse=True)]
+
+    def dependencies(requirement, wheel):
+        package_name, version = wheel[:-len('.whl')].split('-')
+        return packages[package_name][version]
+    return candidates, Mock(side_effect=dependencies)
+
+
+def test_satisfies():
+    "satisfies() Should tell if a version matches a requirement"
+    satisfies('package (>= 1.0)', '1.1').should.be.true
+    satisfies('package (< 1.0)', '1.1').should.be.false
+    satisfies('http://example.com/package.tar.gz', '1.1').should.be.true
+
+
+def test_resolve_newest_versions():
+    "Resolver#resolve() Should pick the newest versions when there are no conflicts"
+
+    # Given two packages where the first one depends on the second
+    candidates, dependencies = provider({
+        'app': {'2.0': ['lib (>= 1.0)'], '1.0': []},
+        'lib': {'1.0': [], '1.1': []},
+    })
+
+    # When I resolve the requirements
+    pinned = Resolver(candidates, dependencies).resolve(['app'])
+
+    # Then the newest version of each package is chosen
+    pinned.should.equal({
+        'app': Candidate('2.0', 'app-2.0.whl'),
+        'lib': Candidate('1.1', 'lib-1.1.whl'),
+    })
+
+
+def test_resolve_backtracks():
+    "Resolver#resolve() Should try older versions of a package when the newest leads to a conflict"
+
+    # Given that the newest version of `app' needs a `lib' the user doesn't want
+    candidates, dependencies = provider({
+        'app': {'2.0': ['lib (>= 2.0)'], '1.0': ['lib (>= 1.0)']},
+        'lib': {'1.0': [], '2.0': []},
+    })
+
+    # When I resolve the requirements
+    pinned = Resolver(candidates, dependencies).resolve(['app', 'lib (< 2.0)'])
+
+    # Then the older `app' is chosen
+    pinned['app'].version.should.equal('1.0')
+    pinned['lib'].version.should.equal('1.0')
+
+
+def test_resolve_reads_only_needed_dependencies():
+    "Resolver#resolve() Should only read the dependencies of the candidates it tries"
+
+    # Given a package with a few versions
+    candidates, dependencies = provider({
+        'app': {'3.0': [], '2.0': [], '1.0': []},
+    })
+
+    # When I resolve the requirements
+    Resolver(candidates, dependencies).resolve(['app'])
+
+    # Then only the dependencies of the newest version were read
+    dependencies.call_count.should.equal(1)
+
+
+def test_resolve_skips_unreadable_candidates():
+    "Resolver#resolve() Should leave out the candidates whose dependencies can't be read"
+
+    # Given that the dependencies of the newest `app' can't be read
+    candidates, dependencies = provider({
+        'app': {'2.0': None, '1.0': []},
+    })
+
+    # When I resolve the requirements
+    pinned = Resolver(candidates, dependencies).resolve(['app'])
+
+    # Then the older `app' is chosen
+    pinned['app'].version.should.equal('1.0')
+
+
+def test_resolve_conflict_explanation():
+    "Resolver#resolve() Should explain a conflict with only the requirements that can't be satisfied together"
+
+    # Given that two packages need versions of `lib' that don't intersect
+    candidates, dependencies = provider({
+        'a': {'1.0': ['lib (>= 2.0)']},
+        'b': {'1.0': ['lib (< 2.0)', 'other']},
+        'lib': {'1.0': [], '2.0': []},
+        'other': {'1.0': []},
+    })
+
+    # When I resolve the requirements
+    resolver = Resolver(candidates, dependencies)
+    resolver.resolve.when.called_with(['a', 'b', 'lib']).should.throw(
+        VersionConflict,
+        'Requirement: lib: lib (>= 2.0) (required by a (1.0)), '
+        'lib (< 2.0) (required by b (1.0)), '
+        'Available versions: 2.0, 1.0')
+
+
+def test_resolve_gives_up():
+    "Resolver#resolve() Should give up after trying too many times"
+
+    # Given packages that will never be resolved
+    candidates, dependencies = provider({
+        'a': {'1.0': ['c (>= 2.0)'], '2.0': ['c (>= 2.0)']},
+        'b': {'1.0': [], '2.0': []},
+        'c': {'1.0': []},
+    })
+
+    # When I resolve them with a tiny number of rounds
+    resolver = Resolver(candidates, dependencies, max_rounds=2)
+
+    # Then I see it gave up
+    resolver.resolve.when.called_with(['a', 'b']).should.throw(
+        VersionConflict, 'Gave up resolving the requirements after 2 attempts')
+
+
+def test_version_range():
+    "VersionRange() Should tell if the constraints of requirements can be satisfied together"
+    r = VersionRange.from_requirement
+    r('lib (>= 2.0)').intersect(r('lib (< 2.0)')).empty.should.be.true
+    r('lib (>= 2.0)').intersect(r('lib (<= 2.0)')).empty.should.be.false
+    r('lib (== 1.0)').intersect(r('lib (!= 1.0)')).empty.should.be.true
+    r('lib (== 1.0)').intersect(r('lib (> 0.9, < 1.1)')).empty.should.be.false
+    r('lib (~= 1.4.5)').intersect(r('lib (>= 1.5)')).empty.should.be.true
+    r('lib (~= 1.4)').intersect(r('lib (>= 1.5)')).empty.should.be.false
+
+
+def test_version_range_unknown_constraints():
+    "VersionRange() Should not restrict the versions with constraints it can't represent"
+    r = VersionRange.from_requirement
+    r('lib (== 1.0.*)').intersect(r('lib (< 0.1)')).empty.should.be.false
+    r('http://example.com/lib.tar.gz').intersect(r('lib (< 0.1)')).empty.should.be.false
+
+
+def test_resolve_long_chain_of_dependencies():
+    "Resolver#resolve() Should not hit the recursion limit with long chains of dependencies"
+
+    # Given a few thousand packages, each one depending on the next
+    size = sys.getrecursionlimit() * 2
+    packages = dict(('p{0}'.format(i), {'1.0': ['p{0}'.format(i + 1)]})
+                    for i in range(size))
+    packages['p{0}'.format(size)] = {'1.0': ['p0 (< 1.0)']}
+    candidates, dependencies = provider(packages)
+
+    # When the last one can't be satisfied, Then I see it as a conflict
+    Resolver(candidates, dependencies).resolve.when.called_with(['p0']).should.throw(
+        VersionConflict,
+        'Requirement: p0: p0 (< 1.0) (required by p{0} (1.0)), '
+        'Available versions: 1.0'.format(size))
+
+    # And when the last one is fine, Then all of them are pinned
+    packages['p{0}'.format(size)] = {'1.0': []}
+    pinned = Resolver(candidates, dependencies).resolve(['p0'])
+    len(pinned).should.equal(size + 1)
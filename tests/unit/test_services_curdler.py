@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 from mock import call, patch, Mock, ANY
+from curdling.exceptions import BuildError
 from curdling.services import curdler
+from curdling.services.base import SENTINEL
+from contextlib import closing
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
 
 
 @patch('curdling.services.curdler.io')
@@ -34,59 +44,6 @@ def test_guess_file_type_no_matching_type(io):
         )
 
 
-@patch('curdling.services.curdler.guess_file_type')
-@patch('curdling.services.curdler.zipfile.ZipFile')
-def test_unpack(ZipFile, guess_file_type):
-    "unpack() Should unpack zip files and return the names inside of the archive"
-
-    # Given a zip package
-    guess_file_type.return_value = 'zip'
-    ZipFile.return_value.namelist.return_value = ['file.py', 'setup.py']
-
-    # When I try to unpack a file
-    open_archive, namelist = curdler.unpack('package.zip')
-
-    # Then I see it returned an open archive
-    open_archive.should.equal(ZipFile.return_value)
-
-    # Then I see the right name list being returned
-    namelist.should.equal(['file.py', 'setup.py'])
-
-
-@patch('curdling.services.curdler.guess_file_type')
-@patch('curdling.services.curdler.tarfile.open')
-def test_unpack_tarball(tarfile_open, guess_file_type):
-    "unpack() Should unpack .gz files and return the names inside of the archive"
-
-    # Given a zip package
-    guess_file_type.return_value = 'gz'
-    file1, file2 = Mock(), Mock()
-    file1.name, file2.name = 'file.py', 'setup.py'
-    tarfile_open.return_value.getmembers.return_value = [file1, file2]
-
-    # When I try to unpack a file
-    open_archive, namelist = curdler.unpack('package.tar.gz')
-
-    # Then I see it returned an open archive
-    open_archive.should.equal(tarfile_open.return_value)
-
-    # Then I see the right name list being returned
-    namelist.should.equal(['file.py', 'setup.py'])
-
-
-
-@patch('curdling.services.curdler.guess_file_type')
-def test_unpack_error(guess_file_type):
-    "unpack() Should raise `UnpackingError` on unknown files"
-
-    guess_file_type.return_value = None
-
-    # When I try to guess the file type; Then I see it raises an exception
-    curdler.unpack.when.called_with('pkg.abc').should.throw(
-        curdler.UnpackingError, 'Unknown compress format for file pkg.abc'
-    )
-
-
 def test_find_setup_script():
     "find_setup_script() Should return the setup.py script in the root of an archive's file list"
 
@@ -126,21 +83,149 @@ def test_cant_find_setup_script():
     )
 
 
-@patch('curdling.services.curdler.unpack')
-def test_get_setup_from_package(unpack):
-    "get_setup_from_package() Should unpack a tarball or zip file and return its setup.py script"
+def make_tarball(directory, members):
+    path = os.path.join(directory, 'pkg-0.1.tar.gz')
+    with closing(tarfile.open(path, 'w:gz')) as fp:
+        for member, contents in members:
+            if not isinstance(member, tarfile.TarInfo):
+                member = tarfile.TarInfo(member)
+            member.size = len(contents)
+            fp.addfile(member, io.BytesIO(contents))
+    return path
+
+
+def test_get_setup_from_package():
+    "get_setup_from_package() Should extract only the directory of the package that contains the setup.py script"
+
+    # Given a tarball with the package and some other directory
+    directory = tempfile.mkdtemp()
+    package = make_tarball(directory, [
+        ('pkg-0.1/tests/data/setup.py', b''),
+        ('pkg-0.1/setup.py', b'from setuptools import setup'),
+        ('pkg-0.1/pkg.py', b''),
+        ('other/file.txt', b''),
+    ])
+    destination = os.path.join(directory, 'build')
+
+    try:
+        # When I try to retrieve the setup script
+        setup_py = curdler.get_setup_from_package(package, destination)
+
+        # Then I see that the setup script in the root of the package
+        # was found
+        setup_py.should.equal(os.path.join(destination, 'pkg-0.1/setup.py'))
+
+        # And that only the package directory was extracted
+        os.listdir(destination).should.equal(['pkg-0.1'])
+        os.path.isfile(os.path.join(destination, 'pkg-0.1/pkg.py')).should.be.true
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_extract_tarball_root_after_other_directories():
+    "extract_tarball() Should find the package even when other directories come first in the archive"
+
+    # Given a tarball starting with files that aren't part of the package,
+    # one of them even pointing outside of the destination
+    directory = tempfile.mkdtemp()
+    package = make_tarball(directory, [
+        ('other/file.txt', b''),
+        ('notes.txt', b''),
+        ('../outside.txt', b''),
+        ('pkg-0.1/pkg.py', b''),
+        ('pkg-0.1/setup.py', b''),
+    ])
+    destination = os.path.join(directory, 'build')
+
+    try:
+        # When I extract it
+        setup_py = curdler.extract_tarball(package, destination)
+
+        # Then I see the setup script of the package was found
+        setup_py.should.equal('pkg-0.1/setup.py')
+
+        # And that only the package directory was extracted
+        os.listdir(destination).should.equal(['pkg-0.1'])
+        os.path.exists(os.path.join(directory, 'outside.txt')).should.be.false
+        sorted(os.listdir(os.path.join(destination, 'pkg-0.1'))).should.equal(
+            ['pkg.py', 'setup.py'])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_extract_tarball_without_root():
+    "extract_tarball() Should keep everything when the setup.py script is on the top of the archive"
+
+    # Given a tarball without a directory for the package
+    directory = tempfile.mkdtemp()
+    package = make_tarball(directory, [
+        ('pkg/__init__.py', b''),
+        ('setup.py', b''),
+    ])
+    destination = os.path.join(directory, 'build')
+
+    try:
+        # When I extract it; Then I see all the files are there
+        curdler.extract_tarball(package, destination).should.equal('setup.py')
+        sorted(os.listdir(destination)).should.equal(['pkg', 'setup.py'])
+    finally:
+        shutil.rmtree(directory)
+
 
-    # Given the following name list of a package
-    fp = Mock()
-    unpack.return_value = fp, ['pkg-0.1/setup.py', 'pkg-0.1/pkg.py']
+def test_extract_zip():
+    "extract_zip() Should extract only the directory of the package that contains the setup.py script"
 
-    # When I try to retrieve the setup script
-    setup_py = curdler.get_setup_from_package('I am a package', '/tmp')
+    # Given a zip file with the package and some other directory
+    directory = tempfile.mkdtemp()
+    package = os.path.join(directory, 'pkg-0.1.zip')
+    with closing(zipfile.ZipFile(package, 'w')) as fp:
+        fp.writestr('other/file.txt', b'')
+        fp.writestr('pkg-0.1/setup.py', b'')
+        fp.writestr('pkg-0.1/pkg.py', b'')
+    destination = os.path.join(directory, 'build')
 
-    # Then I see that the package was extracted and that the setup
-    # script was found
-    setup_py.should.equal('/tmp/pkg-0.1/setup.py')
+    try:
+        # When I extract it; Then I see the setup script was found
+        curdler.extract_zip(package, destination).should.equal('pkg-0.1/setup.py')
 
+        # And that only the package directory was extracted
+        os.listdir(destination).should.equal(['pkg-0.1'])
+    finally:
+        shutil.rmtree(directory)
+
+
+@patch('curdling.services.curdler.guess_file_type')
+def test_get_setup_from_package_unknown_format(guess_file_type):
+    "get_setup_from_package() Should raise `UnpackingError` on unknown files"
+
+    guess_file_type.return_value = None
+
+    # When I try to extract the file; Then I see it raises an exception
+    curdler.get_setup_from_package.when.called_with('pkg.abc', '/tmp/build').should.throw(
+        curdler.UnpackingError, 'Unknown compress format for file pkg.abc'
+    )
+
+
+def test_get_setup_from_package_outside_destination():
+    "get_setup_from_package() Should refuse to create files outside of the destination"
+
+    # Given a tarball with a link pointing outside of the package
+    directory = tempfile.mkdtemp()
+    link = tarfile.TarInfo('pkg-0.1/passwd')
+    link.type, link.linkname = tarfile.SYMTYPE, '../../../etc/passwd'
+    package = make_tarball(directory, [
+        ('pkg-0.1/setup.py', b''),
+        (link, b''),
+    ])
+
+    try:
+        # When I try to retrieve the setup script; Then I see it fails
+        curdler.get_setup_from_package.when.called_with(
+            package, os.path.join(directory, 'build')).should.throw(
+                curdler.UnpackingError,
+                "File `pkg-0.1/../../../etc/passwd' would be extracted outside of the package")
+    finally:
+        shutil.rmtree(directory)
 
 
 @patch('curdling.services.curdler.os.listdir')
@@ -174,7 +259,11 @@ def test_curdler_service(rmtree, run_setup_script, get_setup_from_package, mkdte
     destination = mkdtemp.return_value
 
     # Given a curdler service instance
-    service = curdler.Curdler(index=Mock())
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}))
+
+    # And that the package was never built before
+    service.index.digest.return_value = 'abc'
+    service.index.get_build.return_value = None
 
     # When I execute the service
     service.handle('tests', {
@@ -188,16 +277,73 @@ def test_curdler_service(rmtree, run_setup_script, get_setup_from_package, mkdte
 
     # And then I see that the `setup.py` script was run
     run_setup_script.assert_called_once_with(
-        get_setup_from_package.return_value, 'bdist_wheel')
+        get_setup_from_package.return_value, 'bdist_wheel', usage=ANY, log=ANY)
 
     # And then I see that the wheel file should indexed
     service.index.from_file.assert_called_once_with(
         run_setup_script.return_value)
 
+    # And recorded as the build of the contents of the package
+    service.index.get_build.assert_called_once_with('sha256:abc')
+    service.index.add_build.assert_called_once_with(
+        'sha256:abc', service.index.from_file.return_value)
+
     # And then the temporary destination is removed afterwards
     rmtree.assert_called_once_with(destination)
 
 
+@patch('curdling.services.curdler.get_setup_from_package')
+@patch('curdling.services.curdler.run_setup_script')
+def test_curdler_service_build_cache(run_setup_script, get_setup_from_package):
+    "Curdler.handle() Should not build packages with the same contents twice"
+
+    # Given a curdler service whose index has a build of the package
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}))
+    service.index.digest.return_value = 'abc'
+    service.index.get_build.return_value = '/curds/pkg-0.1-py27-none-any.whl'
+
+    # When I execute the service
+    result = service.handle('tests', {
+        'requirement': 'pkg',
+        'tarball': 'another-name.tar.gz',
+    })
+
+    # Then I see the wheel built before was used
+    result.should.equal({
+        'requirement': 'pkg',
+        'wheel': '/curds/pkg-0.1-py27-none-any.whl',
+    })
+    service.index.digest.assert_called_once_with('another-name.tar.gz')
+    service.index.get_build.assert_called_once_with('sha256:abc')
+
+    # And that nothing was unpacked or built
+    get_setup_from_package.called.should.be.false
+    run_setup_script.called.should.be.false
+
+
+@patch('curdling.services.curdler.tempfile.mkdtemp')
+@patch('curdling.services.curdler.run_setup_script')
+@patch('curdling.services.curdler.shutil.rmtree')
+def test_curdler_service_record_pinned_builds(rmtree, run_setup_script, mkdtemp):
+    "Curdler.handle() Should record the wheels built from pinned VCS URLs in the index"
+
+    # Given a curdler service instance
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}))
+
+    # When I build a directory retrieved from a pinned URL
+    result = service.handle('tests', {
+        'requirement': 'git+http://srv/pkg.git',
+        'directory': '/tmp/pkg',
+        'pinned_url': 'git+http://srv/pkg.git@' + 'a' * 40,
+    })
+
+    # Then I see the wheel was recorded as the build of that URL
+    service.index.add_build.assert_called_once_with(
+        'git+http://srv/pkg.git@' + 'a' * 40,
+        service.index.from_file.return_value)
+    result['wheel'].should.equal(service.index.from_file.return_value)
+
+
 @patch('curdling.services.curdler.tempfile.mkdtemp')
 @patch('curdling.services.curdler.run_setup_script')
 @patch('curdling.services.curdler.shutil.rmtree')
@@ -206,7 +352,7 @@ def test_curdler_service_build_directory(rmtree, run_setup_script, mkdtemp):
     destination = mkdtemp.return_value
 
     # Given a curdler service instance
-    service = curdler.Curdler(index=Mock())
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}))
 
     # When I execute the service
     service.handle('tests', {
@@ -216,7 +362,7 @@ def test_curdler_service_build_directory(rmtree, run_setup_script, mkdtemp):
 
     # And then I see that the `setup.py` script was run
     run_setup_script.assert_called_once_with(
-        '/tmp/pkg/setup.py', 'bdist_wheel')
+        '/tmp/pkg/setup.py', 'bdist_wheel', usage=ANY, log=ANY)
 
     # And then I see that the wheel file should indexed
     service.index.from_file.assert_called_once_with(
@@ -238,7 +384,7 @@ def test_curdler_service_error(rmtree, run_setup_script, mkdtemp):
     destination = mkdtemp.return_value
 
     # Given a curdler service instance
-    service = curdler.Curdler(index=Mock())
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}))
 
     # And then I create a problem in the `run_setup_script` to
     # simulate a build error
@@ -257,3 +403,247 @@ def test_curdler_service_error(rmtree, run_setup_script, mkdtemp):
         call(destination),
         call('/tmp/pkg'),
     ])
+
+
+@patch('curdling.services.curdler.execute_command')
+@patch('curdling.services.curdler.os.listdir')
+def test_run_script_usage(listdir, execute_command):
+    "run_setup_script() Should forward the `usage` dictionary to execute_command()"
+
+    # Given a patch for `os.listdir` and `execute_command`
+    listdir.return_value = ['wheel-file.whl']
+    usage = {}
+
+    # When I run the script informing where the usage should be saved
+    curdler.run_setup_script("/tmp/pkg/setup.py", 'bdist_wheel', usage=usage)
+
+    # Then I see the dictionary was handed to `execute_command()`
+    execute_command.assert_called_once_with(
+        ANY, '-c', ANY, 'bdist_wheel', cwd='/tmp/pkg', usage=usage)
+
+
+def test_build_scheduler_estimate():
+    "BuildScheduler.estimate() Should use the history of the builds or the defaults"
+
+    # Given a scheduler that built a package before
+    scheduler = curdler.BuildScheduler(slots=2)
+    scheduler.record('lxml', {'peak_rss': 2**30, 'duration': 90.0, 'extra': 1})
+
+    # When I estimate the builds of that package and of a new one
+    # Then I see the history is used when available
+    scheduler.estimate('lxml').should.equal({'peak_rss': 2**30, 'duration': 90.0})
+    scheduler.history['lxml'].should.equal({'peak_rss': 2**30, 'duration': 90.0, 'status': 0})
+    scheduler.estimate('sure').should.equal({
+        'peak_rss': curdler.DEFAULT_BUILD_RSS,
+        'duration': curdler.DEFAULT_BUILD_DURATION,
+    })
+
+
+def test_build_scheduler_history_in_the_index():
+    "BuildScheduler should save the history in the `build-history` catalog of the index"
+
+    # Given a scheduler with an index
+    index = Mock(**{'catalog.return_value': {}})
+    scheduler = curdler.BuildScheduler(slots=2, index=index)
+
+    # When a build finishes informing its usage
+    with scheduler.slot('sure') as usage:
+        usage.update(peak_rss=1024, duration=1.5)
+
+    # Then I see it was saved in the index
+    index.update_catalog.assert_called_once_with(
+        'build-history', 'sure', {'peak_rss': 1024, 'duration': 1.5, 'status': 0})
+
+
+def test_build_scheduler_admits():
+    "BuildScheduler.admits() Should only start builds that fit in the slots and in the memory budget"
+
+    # Given a scheduler with two slots and 1GB of memory
+    scheduler = curdler.BuildScheduler(slots=2, budget=2**30)
+
+    # When nothing is running; Then even builds bigger than the budget start
+    scheduler.admits(2**31).should.be.true
+
+    # When a build is running and 768MB are committed
+    scheduler.running, scheduler.committed = 1, 768 * 2**20
+
+    # Then I see only builds that fit in the remaining memory start
+    scheduler.admits(256 * 2**20).should.be.true
+    scheduler.admits(512 * 2**20).should.be.false
+
+    # And that no build starts when all the slots are taken
+    scheduler.running = 2
+    scheduler.admits(1).should.be.false
+
+
+def test_build_scheduler_slot_releases_on_errors():
+    "BuildScheduler.slot() Should release the slot and record failed builds"
+
+    # Given a scheduler
+    scheduler = curdler.BuildScheduler(slots=1, budget=2**30)
+
+    # When a build fails
+    def build():
+        with scheduler.slot('pkg') as usage:
+            usage.update(peak_rss=1024, duration=1.5, status=-9)
+            raise BuildError('P0wned!!1')
+    build.when.called_with().should.throw(BuildError)
+
+    # Then I see the slot and the memory were released
+    scheduler.running.should.equal(0)
+    scheduler.committed.should.equal(0)
+
+    # And that the failed build was recorded with its exit status
+    scheduler.history.should.equal({
+        'pkg': {'peak_rss': 1024, 'duration': 1.5, 'status': -9},
+    })
+
+
+def test_build_queue_longest_first():
+    "BuildQueue should hand out the longest builds first and the sentinels last"
+
+    # Given a queue that knows how long some builds take
+    durations = {'small': 1, 'big': 100, 'medium': 10}
+    build_queue = curdler.BuildQueue(
+        lambda item: -durations.get(item[1]['requirement'], 0))
+
+    # When I queue some builds and a sentinel
+    build_queue.put(SENTINEL)
+    for requirement in ('small', 'unknown', 'big', 'medium'):
+        build_queue.put(('tests', {'requirement': requirement}))
+
+    # Then I see they come out from the longest to the shortest one
+    [build_queue.get() for _ in range(5)].should.equal([
+        ('tests', {'requirement': 'big'}),
+        ('tests', {'requirement': 'medium'}),
+        ('tests', {'requirement': 'small'}),
+        ('tests', {'requirement': 'unknown'}),
+        SENTINEL,
+    ])
+
+
+@patch('curdling.services.curdler.PARALLEL_BUILD_EXT', True)
+@patch('curdling.services.curdler.which', Mock(return_value='/usr/bin/ccache'))
+@patch('curdling.services.curdler.compiler_cache_environ')
+@patch('curdling.services.curdler.run_setup_script')
+def test_curdler_build_options(run_setup_script, compiler_cache_environ):
+    "Curdler.build() Should compile extensions in parallel and through the compiler cache"
+
+    # Given a curdler service configured to use 4 jobs and a compiler cache
+    index = Mock(**{'catalog.return_value': {}})
+    index.cache_path.return_value = '/curds/.cache/ccache'
+    service = curdler.Curdler(index=index, conf={
+        'build_jobs': 4, 'compiler_cache': True})
+
+    # When I build a package
+    service.build('/tmp/pkg/setup.py', {}, 'pkg')
+
+    # Then I see the extensions are built in parallel before the wheel
+    run_setup_script.assert_called_once_with(
+        '/tmp/pkg/setup.py', 'build_ext', '--parallel', '4', 'bdist_wheel',
+        usage={}, log=ANY, env=compiler_cache_environ.return_value)
+
+    # And that the compiler cache lives in the index
+    index.cache_path.assert_any_call('ccache')
+    compiler_cache_environ.assert_called_once_with('/curds/.cache/ccache')
+
+
+@patch('curdling.services.curdler.which', Mock(return_value=None))
+def test_curdler_compiler_cache_not_installed():
+    "Curdler should build without a compiler cache when ccache is not installed"
+
+    # Given a curdler service configured to use a compiler cache
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}), conf={
+        'compiler_cache': True})
+
+    # When ccache is not installed; Then I see no compiler cache is used
+    service.compiler_cache.should.be.none
+
+
+@patch('curdling.services.curdler.which', Mock(return_value='/usr/bin/ccache'))
+@patch('curdling.services.curdler.sysconfig.get_config_var')
+def test_compiler_cache_environ(get_config_var):
+    "compiler_cache_environ() Should prefix the compilers with ccache"
+
+    # Given that the interpreter was built with gcc
+    get_config_var.side_effect = {'CC': 'gcc -pthread', 'CXX': 'g++'}.get
+
+    # When I get the environment, with CXX already going through ccache
+    environ = curdler.compiler_cache_environ('/cache', {'CXX': 'ccache clang++'})
+
+    # Then I see the compilers are called through ccache only once
+    environ.should.equal({
+        'CC': '/usr/bin/ccache gcc -pthread',
+        'CXX': 'ccache clang++',
+        'CCACHE_DIR': '/cache',
+    })
+
+
+@patch('curdling.services.curdler.command_output')
+def test_compiler_cache_stats(command_output):
+    "compiler_cache_stats() Should read the hits and misses from ccache"
+
+    # Given the output of `ccache --print-stats`
+    command_output.return_value = (
+        b'direct_cache_hit\t7\n'
+        b'preprocessed_cache_hit\t2\n'
+        b'cache_miss\t5\n')
+
+    # When I read the stats; Then I see the hits were added together
+    curdler.compiler_cache_stats('/cache').should.equal({'hits': 9, 'misses': 5})
+
+    # And When ccache fails; Then I see no stats
+    command_output.side_effect = Exception('unknown option')
+    curdler.compiler_cache_stats('/cache').should.be.none
+
+
+@patch('curdling.services.curdler.run_setup_script')
+def test_curdler_build_limits(run_setup_script):
+    "Curdler.build() Should limit the builds and save their output in the index"
+
+    # Given a curdler service configured with limits
+    index = Mock(**{'catalog.return_value': {}})
+    index.ensure_path.side_effect = lambda path: path
+    index.cache_path.side_effect = lambda *parts: '/curds/.cache/' + '/'.join(parts)
+    service = curdler.Curdler(index=index, conf={
+        'build_timeout': 600, 'build_memory_limit': 512})
+
+    # When I build a package
+    service.build('/tmp/pkg/setup.py', {}, 'git+http://srv/pkg.git')
+
+    # Then I see the limits and the log file were informed
+    run_setup_script.assert_called_once_with(
+        '/tmp/pkg/setup.py', 'bdist_wheel',
+        usage={}, timeout=600, memory_limit=512 * 2**20,
+        log='/curds/.cache/build-logs/git_http_srv_pkg.git.log')
+
+
+@patch('curdling.services.curdler.tempfile.mkdtemp')
+@patch('curdling.services.curdler.get_setup_from_package')
+@patch('curdling.services.curdler.purewheel.build_wheel')
+@patch('curdling.services.curdler.run_setup_script')
+@patch('curdling.services.curdler.shutil.rmtree')
+def test_curdler_service_fast_build(rmtree, run_setup_script, build_wheel,
+                                    get_setup_from_package, mkdtemp):
+    "Curdler.handle() Should assemble static pure Python packages without running setup.py"
+
+    # Given a curdler service with fast builds enabled
+    service = curdler.Curdler(index=Mock(**{'catalog.return_value': {}}), conf={
+        'fast_builds': True})
+    service.index.get_build.return_value = None
+    get_setup_from_package.return_value = '/tmp/build/pkg-0.1/setup.py'
+
+    # When I build a static pure Python package
+    result = service.handle('tests', {'requirement': 'pkg', 'tarball': 'pkg.tar.gz'})
+
+    # Then I see the wheel was assembled without running setup.py
+    build_wheel.assert_called_once_with(
+        '/tmp/build/pkg-0.1/setup.py', '/tmp/build/pkg-0.1/dist')
+    run_setup_script.called.should.be.false
+    service.index.from_file.assert_called_once_with(build_wheel.return_value)
+    result['wheel'].should.equal(service.index.from_file.return_value)
+
+    # And When the package is not that simple; Then I see setup.py runs
+    build_wheel.return_value = None
+    service.handle('tests', {'requirement': 'pkg', 'tarball': 'pkg.tar.gz'})
+    run_setup_script.called.should.be.true
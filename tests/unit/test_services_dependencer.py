@@ -110,3 +110,85 @@ def test_dependencer_skip_not_required_extras(Wheel):
     # Then I see no dependencies were actually found, since the extra
     # section doesn't match.
     callback.called.should.be.false
+
+
+@patch('curdling.services.dependencer.Wheel')
+def test_dependencer_cached_dependencies(Wheel):
+    "Dependencer#handle() should read the dependencies of each wheel only once"
+
+    # Given that I have the dependencer service with an index that
+    # doesn't know the dependencies of a wheel yet
+    index = Mock(**{'get_dependencies.return_value': None})
+    dependencer = Dependencer(index=index)
+    Wheel.return_value = Mock(metadata=Mock(dependencies={
+        'install': ['forbiddenfruit'],
+    }))
+
+    # When I handle the wheel
+    dependencer.handle('tests', {'requirement': 'sure', 'wheel': 'sure-0.1.whl'})
+
+    # Then I see its dependencies were saved in the index
+    index.add_dependencies.assert_called_once_with('sure-0.1.whl', {
+        'install': ['forbiddenfruit'],
+        'extras': {},
+    })
+
+    # And When the index knows the dependencies
+    Wheel.reset_mock()
+    callback = Mock()
+    dependencer.connect('dependency_found', callback)
+    index.get_dependencies.return_value = {
+        'install': ['forbiddenfruit'],
+        'extras': {'test': ['mock']},
+    }
+    dependencer.handle('tests', {'requirement': 'sure[test]', 'wheel': 'sure-0.1.whl'})
+
+    # Then I see the wheel was not opened
+    Wheel.called.should.be.false
+    list(callback.call_args_list).should.equal([
+        call('dependencer', requirement='forbiddenfruit', dependency_of='sure[test]'),
+        call('dependencer', requirement='mock', dependency_of='sure[test]'),
+    ])
+
+    # And that the cached entry was not changed by the extras
+    index.get_dependencies.return_value['install'].should.equal(
+        ['forbiddenfruit'])
+
+
+@patch('curdling.services.dependencer.Wheel')
+def test_dependencer_environment_markers(Wheel):
+    "Dependencer#handle() should skip dependencies whose markers don't match the environment"
+
+    # Given that I have the dependencer service
+    callback = Mock()
+    dependencer = Dependencer()
+    dependencer.connect('dependency_found', callback)
+
+    # And a package with dependencies for other environments and extras
+    Wheel.return_value = Mock(metadata=Mock(dependencies={
+        'install': [
+            'six',
+            'ancient; python_version < "2.0"',
+            'mock; extra == "test"',
+            'docutils; extra == "docs"',
+        ],
+    }))
+
+    # When I handle the package with the `test` extra
+    dependencer.handle('tests', {'requirement': 'sure[test]', 'wheel': 'sure-0.1.whl'})
+
+    # Then I see only the dependencies needed here were found
+    list(callback.call_args_list).should.equal([
+        call('dependencer', requirement='six', dependency_of='sure[test]'),
+        call('dependencer', requirement='mock', dependency_of='sure[test]'),
+    ])
+
+
+def test_marker_matches():
+    "marker_matches() Should evaluate markers for each extra and keep markers it can't read"
+
+    from curdling.services.dependencer import marker_matches
+    marker_matches('python_version >= "2.0"').should.be.true
+    marker_matches('extra == "test"').should.be.false
+    marker_matches('extra == "test"', set(['docs', 'test'])).should.be.true
+    marker_matches('this is not a marker').should.be.true
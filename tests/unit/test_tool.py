@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
+import argparse
 import io
 import logging
 import mock
@@ -64,3 +65,51 @@ def test_initialize_logging():
             log_level=logging.DEBUG,
             log_name=mock.sentinel.log_name,
         )
+
+
+def test_parse_rate():
+    "parse_rate() Should read transfer rates with units"
+
+    tool.parse_rate('512').should.equal(512)
+    tool.parse_rate('200k').should.equal(200 * 1024)
+    tool.parse_rate('1.5M').should.equal(1.5 * 1024 ** 2)
+    tool.parse_rate.when.called_with('fast').should.throw(argparse.ArgumentTypeError)
+    tool.parse_rate.when.called_with('0').should.throw(argparse.ArgumentTypeError)
+
+
+@mock.patch('curdling.tool.sys')
+def test_show_build_stats(sys):
+    "show_build_stats() Should report how many builds were reused"
+
+    # Given an index that found one build and missed two
+    index = mock.Mock(build_stats={'hits': 1, 'misses': 2})
+
+    # When I show the stats; Then I see the numbers
+    tool.show_build_stats(index)
+    sys.stdout.write.assert_called_once_with('Build cache: 1 hit, 2 misses\n')
+
+    # And When nothing was built; Then nothing is shown
+    sys.stdout.write.reset_mock()
+    tool.show_build_stats(mock.Mock(build_stats={'hits': 0, 'misses': 0}))
+    sys.stdout.write.called.should.be.false
+
+
+@mock.patch('curdling.tool.curdler.compiler_cache_stats')
+@mock.patch('curdling.tool.sys')
+def test_show_compiler_cache_stats(sys, compiler_cache_stats):
+    "show_compiler_cache_stats() Should report where the compiler cache is and how it was used"
+
+    # Given a compiler cache with some hits and misses
+    compiler_cache_stats.return_value = {'hits': 10, 'misses': 3}
+
+    # When I show the stats; Then I see the location and the numbers
+    tool.show_compiler_cache_stats('/curds/.cache/ccache')
+    sys.stdout.write.assert_called_once_with(
+        'Compiler cache: /curds/.cache/ccache (10 hits, 3 misses)\n')
+
+    # And When ccache can't tell the numbers; Then I see just the location
+    sys.stdout.write.reset_mock()
+    compiler_cache_stats.return_value = None
+    tool.show_compiler_cache_stats('/curds/.cache/ccache')
+    sys.stdout.write.assert_called_once_with(
+        'Compiler cache: /curds/.cache/ccache\n')
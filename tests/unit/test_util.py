@@ -164,6 +164,20 @@ def test_execute_command(subprocess):
     util.execute_command('ls').should.be.none
 
 
+@patch('curdling.util.subprocess')
+def test_command_output(subprocess):
+    "command_output() Should return the output of the subprocess"
+
+    # Given that my process runs successfully
+    subprocess.Popen.return_value.returncode = 0
+    subprocess.Popen.return_value.communicate.return_value = ["stdout", "stderr"]
+
+    # When I execute the command; Then I see its output
+    util.command_output('ls', cwd='dir').should.equal('stdout')
+    subprocess.Popen.call_args[0].should.equal((('ls',),))
+    subprocess.Popen.call_args[1]['cwd'].should.equal('dir')
+
+
 @patch('curdling.util.subprocess')
 def test_execute_command_when_it_fails(subprocess):
     "execute_command() Should raise an exception if the command fails"
@@ -177,6 +191,127 @@ def test_execute_command_when_it_fails(subprocess):
     util.execute_command.when.called_with('ls').should.throw(Exception, "stderr")
 
 
+@patch('curdling.util.os')
+@patch('curdling.util.subprocess')
+def test_execute_command_usage(subprocess, os):
+    "execute_command() Should save the peak memory usage and the duration of the command in `usage`"
+
+    # Given that my process runs successfully using 2048kB of memory
+    os.wait4.return_value = (1, 0, Mock(ru_maxrss=2048))
+    os.WIFEXITED.return_value = True
+    os.WEXITSTATUS.return_value = 0
+
+    # When I execute the command asking for its usage
+    usage = {}
+    util.execute_command('ls', usage=usage)
+
+    # Then I see the process was reaped with `os.wait4()`
+    os.wait4.assert_called_once_with(subprocess.Popen.return_value.pid, 0)
+
+    # And that its usage was saved
+    usage['peak_rss'].should.be.within((2048, 2048 * 1024))
+    usage.should.have.key('duration')
+
+
+@patch('curdling.util.wait_command')
+@patch('curdling.util.os')
+@patch('curdling.util.subprocess')
+def test_execute_command_timeout(subprocess, os, wait_command):
+    "execute_command() Should kill commands that run for longer than the timeout"
+
+    # Given a command that doesn't finish in time
+    wait_command.return_value = None
+    os.wait4.return_value = (1, 9, Mock(ru_maxrss=2048))
+    os.WIFEXITED.return_value = False
+    os.WTERMSIG.return_value = 9
+
+    # When I execute the command; Then I see it fails
+    usage = {}
+    util.execute_command.when.called_with(
+        'ls', usage=usage, timeout=10).should.throw(
+            Exception, 'Killed after 10 seconds')
+
+    # And that the command and the processes it started were killed
+    pid = subprocess.Popen.return_value.pid
+    wait_command.assert_called_once_with(pid, 10)
+    os.killpg.assert_called_once_with(pid, util.signal.SIGKILL)
+
+    # And that its exit status was saved
+    usage['status'].should.equal(-9)
+
+
+@patch('curdling.util.wait_command')
+@patch('curdling.util.os')
+@patch('curdling.util.subprocess')
+def test_execute_command_memory_limit(subprocess, os, wait_command):
+    "execute_command() Should start commands in a new session with the memory limit set by a wrapper, not by `preexec_fn`"
+
+    # Given a command that runs successfully
+    wait_command.return_value = (1, 0, Mock(ru_maxrss=2048))
+    os.WIFEXITED.return_value = True
+    os.WEXITSTATUS.return_value = 0
+
+    # When I execute the command with a memory limit
+    util.execute_command('ls', '-l', usage={}, memory_limit=2**20)
+
+    # Then I see the wrapper runs the command after setting the limit
+    args, kwargs = subprocess.Popen.call_args
+    args[0].should.equal((
+        util.sys.executable, '-c', util.COMMAND_WRAPPER,
+        '0' if util.NEW_SESSION else '1', '1048576', 'ls', '-l'))
+    kwargs.shouldnt.have.key('preexec_fn')
+    if util.NEW_SESSION:
+        kwargs['start_new_session'].should.be.true
+
+
+def test_parse_requirement_is_memoized():
+    "parse_requirement() Should return the same immutable object for the same spec"
+
+    # Given a spec parsed once
+    first = util.parse_requirement('Memoized_Package[Extra]')
+
+    # When it's parsed again
+    second = util.parse_requirement('Memoized_Package[Extra]')
+
+    # Then the same normalized object is returned
+    second.should.be(first)
+    first.name.should.equal('memoized-package')
+    first.requirement.should.equal('memoized-package[extra]')
+    first.extras.should.equal(('Extra',))
+    first.is_link.should.be.false
+
+    # And it can't be changed by the code sharing it
+    setattr.when.called_with(first, 'name', 'other').should.throw(AttributeError)
+
+
+def test_parse_requirement_link():
+    "parse_requirement() Should keep URLs as both the name and the requirement"
+    requirement = util.parse_requirement('http://example.com/pkg.tar.gz')
+    requirement.name.should.equal('http://example.com/pkg.tar.gz')
+    requirement.requirement.should.equal('http://example.com/pkg.tar.gz')
+    requirement.constraints.should.equal(())
+    requirement.is_link.should.be.true
+
+
+def test_requirement_cache():
+    "RequirementCache() Should drop the least recently used entries and count hits and misses"
+
+    # Given a cache that holds two entries
+    cache = util.RequirementCache(size=2)
+    parse = Mock(side_effect=lambda spec: spec.upper())
+
+    # When three specs are looked up, the first one twice before the third
+    cache.get('a', parse).should.equal('A')
+    cache.get('b', parse)
+    cache.get('a', parse)
+    cache.get('c', parse)
+
+    # Then the entry used last time was kept and the other one was dropped
+    list(cache.entries).should.equal(['a', 'c'])
+    parse.call_count.should.equal(3)
+    cache.stats.should.equal({'hits': 1, 'misses': 3})
+
+
 def test_safe_constraints():
     "safe_constraints() Should return a string with all the constraints of a requirement separated by comma"
 
@@ -129,3 +129,44 @@ Tag: py3-none-any
         'Root-Is-Purelib': 'true',
         'Tag': ['py27-none-any', 'py3-none-any']
     })
+
+
+def test_compatibility():
+    "Wheel.compatibility() Should prefer the most specific tags supported and reject the unsupported ones"
+
+    # Given the tags supported by an interpreter
+    tags = [
+        ('cp27', 'cp27mu', 'linux_x86_64'),
+        ('cp27', 'none', 'any'),
+        ('py27', 'none', 'any'),
+        ('py2', 'none', 'any'),
+    ]
+
+    # When I rank a few wheels against those tags
+    generic = Wheel.from_name('pkg-0.1-py2.py3-none-any.whl').compatibility(tags)
+    binary = Wheel.from_name('pkg-0.1-cp27-cp27mu-linux_x86_64.whl').compatibility(tags)
+    other = Wheel.from_name('pkg-0.1-cp33-cp33m-macosx_10_8_x86_64.whl').compatibility(tags)
+
+    # Then I see the binary wheel is a better fit than the generic one
+    (binary > generic).should.be.true
+
+    # And that the wheel built for another platform is not supported
+    other.should.be.none
+
+
+def test_wheel_file():
+    "Wheel.wheel_file() Should render the WHEEL file read by Wheel.read_wheel_file()"
+
+    # Given the following wheel
+    wheel = Wheel.from_name('sure-0.1.2-py27.py33-none-any')
+
+    # When I render its WHEEL file
+    content = wheel.wheel_file()
+
+    # Then I see all the fields, with one line per tag
+    content.should.equal(
+        'Wheel-Version: 1.0\n'
+        'Generator: Curdling {0}\n'
+        'Root-Is-Purelib: True\n'
+        'Tag: py27-none-any\n'
+        'Tag: py33-none-any\n'.format(__version__))